@@ -0,0 +1,281 @@
+"""Load-test the daemon's Unix-socket API with concurrent asyncio clients.
+
+Serves the API from a separate process on a temporary socket, with a
+synthetic status in place of the control loop, and drives it with an
+increasing number of keep-alive clients. For each level it reports
+requests/sec, latency percentiles and the CPU time the server spent:
+
+    python benchmarks/bench_api_load.py
+    python benchmarks/bench_api_load.py --clients 1,8,64 --accept binary --output load.json
+    python benchmarks/bench_api_load.py --api builtin --reconnect
+
+"cli CPU%" is the load generator's own CPU use. Levels marked "*" used
+all the CPUs available to this process between server and clients, so
+they measure the machine as much as the server; give the benchmark more
+CPUs than the server can use to compare API layers at those levels.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from benchutil import BENCH_DIR, git_revision, summarize
+from bench_api_server import MODES, daemon_env, rss_kib, wait_ready
+import statuscodec
+
+DEFAULT_CLIENTS = [1, 4, 16, 64]
+ACCEPT = {
+    "json": statuscodec.JSON,
+    "binary": statuscodec.BINARY,
+    "msgpack": statuscodec.MSGPACK,
+    "cbor": statuscodec.CBOR,
+}
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+CPUS = len(os.sched_getaffinity(0))
+
+SERVER_SNIPPET = """
+import sys
+sys.path.insert(0, {bench!r})
+import benchutil
+import service
+from bench_status_codec import make_status
+service.shared_state = make_status({fans})
+service.start_api_server(service.bind_api_socket())
+"""
+
+
+def cpu_seconds(pid: int) -> float:
+    """User + system CPU time of a process, from /proc."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(")")[2].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+class Client:
+    """One consumer issuing GETs back to back on its own connection."""
+
+    def __init__(self, socket_path: str, request: bytes, reconnect: bool):
+        self.socket_path = socket_path
+        self.request = request
+        self.reconnect = reconnect
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.samples: List[int] = []
+        self.errors = 0
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_unix_connection(self.socket_path)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.writer = None
+
+    async def get(self) -> int:
+        if self.writer is None:
+            await self.connect()
+        self.writer.write(self.request)
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        await self.reader.readexactly(length)
+        if self.reconnect:
+            await self.close()
+        return int(head.split(b" ", 2)[1])
+
+    async def run(self, deadline: float, record: bool):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter_ns()
+            try:
+                status = await self.get()
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                self.errors += 1
+                await self.close()
+                continue
+            if record:
+                self.samples.append(time.perf_counter_ns() - start)
+                if status != 200:
+                    self.errors += 1
+
+
+async def drive(
+    socket_path: str,
+    pid: int,
+    clients: int,
+    request: bytes,
+    reconnect: bool,
+    warmup: float,
+    duration: float,
+) -> Dict[str, float]:
+    pool = [Client(socket_path, request, reconnect) for _ in range(clients)]
+    if not reconnect:
+        await asyncio.gather(*(c.connect() for c in pool))
+
+    await asyncio.gather(*(c.run(time.perf_counter() + warmup, False) for c in pool))
+
+    server_cpu = cpu_seconds(pid)
+    client_cpu = time.process_time()
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(c.run(deadline, True) for c in pool))
+    elapsed = time.perf_counter() - start
+    server_cpu = cpu_seconds(pid) - server_cpu
+    client_cpu = time.process_time() - client_cpu
+
+    await asyncio.gather(*(c.close() for c in pool))
+
+    samples = [s for c in pool for s in c.samples]
+    result = summarize(samples)
+    result.pop("ops_per_sec", None)
+    result["clients"] = clients
+    result["requests_per_sec"] = round(len(samples) / elapsed, 1)
+    result["errors"] = sum(c.errors for c in pool)
+    result["server_cpu_s"] = round(server_cpu, 3)
+    result["server_cpu_pct"] = round(100 * server_cpu / elapsed, 1)
+    result["server_cpu_us_per_request"] = (
+        round(server_cpu / len(samples) * 1_000_000, 1) if samples else 0.0
+    )
+    result["client_cpu_pct"] = round(100 * client_cpu / elapsed, 1)
+    result["cpu_saturated"] = server_cpu + client_cpu >= 0.9 * CPUS * elapsed
+    return result
+
+
+def run_mode(mode: str, levels: List[int], request: bytes, args) -> Dict[str, object]:
+    home = tempfile.mkdtemp(prefix=f"llcw-load-{mode}-")
+    socket_path = os.path.join(home, "ll-connect-wireless", "ll-connect-wireless.sock")
+    code = SERVER_SNIPPET.format(bench=str(BENCH_DIR), fans=args.fans)
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code],
+        env=daemon_env(home, mode, args.fans),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_ready(socket_path, proc, timeout=30)
+        idle_rss = rss_kib(proc.pid)
+        levels_result = []
+        for clients in levels:
+            r = asyncio.run(
+                drive(
+                    socket_path,
+                    proc.pid,
+                    clients,
+                    request,
+                    args.reconnect,
+                    args.warmup,
+                    args.duration,
+                )
+            )
+            levels_result.append(r)
+            print(
+                f"{mode:8} {clients:>7} {r['requests_per_sec']:>9.1f} "
+                f"{r['p50_us']:>9.1f} {r['p99_us']:>9.1f} "
+                f"{r['server_cpu_pct']:>8.1f} {r['server_cpu_us_per_request']:>8.1f} "
+                f"{r['client_cpu_pct']:>9.1f} {r['errors']:>6}"
+                f"{' *' if r['cpu_saturated'] else ''}"
+            )
+        loaded_rss = rss_kib(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(home, ignore_errors=True)
+    return {
+        "idle_rss_mib": round(idle_rss / 1024, 1),
+        "loaded_rss_mib": round(loaded_rss / 1024, 1),
+        "levels": levels_result,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--api",
+        default=",".join(MODES),
+        help="comma-separated API servers to test (default: fastapi,builtin)",
+    )
+    parser.add_argument(
+        "--clients",
+        default=",".join(str(n) for n in DEFAULT_CLIENTS),
+        help="comma-separated concurrent client counts (default: 1,4,16,64)",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=3.0, help="seconds measured per level"
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=0.5, help="unmeasured seconds per level"
+    )
+    parser.add_argument("--path", default="/status", help="endpoint to request")
+    parser.add_argument(
+        "--accept", choices=sorted(ACCEPT), default="json", help="status format"
+    )
+    parser.add_argument(
+        "--reconnect",
+        action="store_true",
+        help="open a new connection per request, as one-shot CLI calls do",
+    )
+    parser.add_argument("--fans", type=int, default=16, help="fans in the status")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.api.split(",") if m.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown API server '{mode}'")
+    levels = [int(n) for n in args.clients.split(",") if n.strip()]
+    request = (
+        f"GET {args.path} HTTP/1.1\r\nhost: localhost\r\n"
+        f"accept: {ACCEPT[args.accept]}\r\n\r\n"
+    ).encode()
+
+    print(
+        f"{'server':8} {'clients':>7} {'req/s':>9} {'p50 us':>9} {'p99 us':>9} "
+        f"{'srv CPU%':>8} {'us/req':>8} {'cli CPU%':>9} {'errors':>6}"
+    )
+    print("-" * 82)
+    results = {mode: run_mode(mode, levels, request, args) for mode in modes}
+    if any(r["cpu_saturated"] for m in results.values() for r in m["levels"]):
+        print(f"\n* server and clients used all {CPUS} available CPU(s)")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.time(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "cpus": CPUS,
+                "path": args.path,
+                "accept": ACCEPT[args.accept],
+                "reconnect": args.reconnect,
+                "duration": args.duration,
+                "fans": args.fans,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
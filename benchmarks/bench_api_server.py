@@ -0,0 +1,228 @@
+"""Compare the FastAPI/uvicorn and built-in daemon API servers.
+
+Starts the daemon on the emulator backend once per server mode and reports
+import time, time until the socket answers, resident memory and /status
+throughput over keep-alive connections:
+
+    python benchmarks/bench_api_server.py
+    python benchmarks/bench_api_server.py --requests 5000 --clients 8 --output api.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+from benchutil import ROOT_DIR, git_revision, summarize
+
+SRC_DIR = ROOT_DIR / "src"
+MODES = ("fastapi", "builtin")
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {src!r})
+start = time.perf_counter()
+import service
+if {mode!r} == "fastapi":
+    import uvicorn
+    service.create_fastapi_app()
+print(time.perf_counter() - start)
+"""
+
+
+def daemon_env(home: str, mode: str, fans: int) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop("DEV", None)
+    env.update(
+        HOME=home,
+        XDG_RUNTIME_DIR=home,
+        LLCW_API=mode,
+        LLCW_BACKEND="emulator",
+        LLCW_EMU_FANS=str(fans),
+        LLCW_EMU_CPU_TEMP="60",
+        LLCW_EMU_SEED="1",
+    )
+    return env
+
+
+def import_seconds(env: Dict[str, str], mode: str, runs: int) -> float:
+    code = IMPORT_SNIPPET.format(src=str(SRC_DIR), mode=mode)
+    times = [
+        float(subprocess.check_output([sys.executable, "-c", code], env=env, text=True))
+        for _ in range(runs)
+    ]
+    return min(times)
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def connect(path: str) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    return sock
+
+
+def get(sock: socket.socket, buf: bytearray, path: str) -> int:
+    """Send one keep-alive GET and return the status code."""
+    sock.sendall(f"GET {path} HTTP/1.1\r\nhost: localhost\r\n\r\n".encode())
+    while b"\r\n\r\n" not in buf:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("server closed the connection")
+        buf += chunk
+    head, _, _ = bytes(buf).partition(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    end = len(head) + 4 + length
+    while len(buf) < end:
+        chunk = sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("server closed the connection")
+        buf += chunk
+    del buf[:end]
+    return int(head.split(b" ", 2)[1])
+
+
+def wait_ready(path: str, proc: subprocess.Popen, timeout: float) -> float:
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if proc.poll() is not None:
+            raise RuntimeError(f"daemon exited with code {proc.returncode}")
+        try:
+            with connect(path) as sock:
+                if get(sock, bytearray(), "/status") == 200:
+                    return time.perf_counter() - start
+        except (OSError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError("daemon did not answer in time")
+
+
+def load(path: str, requests: int, clients: int) -> Dict[str, float]:
+    per_client = max(1, requests // clients)
+    samples: List[List[int]] = [[] for _ in range(clients)]
+    errors = [0] * clients
+
+    def run(i: int):
+        with connect(path) as sock:
+            buf = bytearray()
+            for _ in range(per_client):
+                start = time.perf_counter_ns()
+                if get(sock, buf, "/status") != 200:
+                    errors[i] += 1
+                samples[i].append(time.perf_counter_ns() - start)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    result = summarize([s for client in samples for s in client])
+    result["requests_per_sec"] = round(per_client * clients / elapsed, 1)
+    result["errors"] = sum(errors)
+    return result
+
+
+def run_mode(mode: str, args) -> Dict[str, object]:
+    home = tempfile.mkdtemp(prefix=f"llcw-api-{mode}-")
+    env = daemon_env(home, mode, args.fans)
+    path = os.path.join(home, "ll-connect-wireless", "ll-connect-wireless.sock")
+    try:
+        import_s = import_seconds(env, mode, args.import_runs)
+        proc = subprocess.Popen(
+            [sys.executable, str(SRC_DIR / "service.py")],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            ready_s = wait_ready(path, proc, timeout=30)
+            idle_rss = rss_kib(proc.pid)
+            load(path, min(200, args.requests), args.clients)
+            throughput = load(path, args.requests, args.clients)
+            loaded_rss = rss_kib(proc.pid)
+        finally:
+            proc.send_signal(signal.SIGINT)
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return {
+        "import_ms": round(import_s * 1000, 1),
+        "ready_ms": round(ready_s * 1000, 1),
+        "idle_rss_mib": round(idle_rss / 1024, 1),
+        "loaded_rss_mib": round(loaded_rss / 1024, 1),
+        "status": throughput,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--fans", type=int, default=4, help="emulated fan groups")
+    parser.add_argument("--import-runs", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    results = {mode: run_mode(mode, args) for mode in MODES}
+
+    print(
+        f"{'server':10} {'import ms':>10} {'ready ms':>9} {'idle MiB':>9} "
+        f"{'load MiB':>9} {'req/s':>9} {'p50 us':>9} {'p99 us':>9}"
+    )
+    print("-" * 82)
+    for mode, r in results.items():
+        s = r["status"]
+        print(
+            f"{mode:10} {r['import_ms']:>10.1f} {r['ready_ms']:>9.1f} "
+            f"{r['idle_rss_mib']:>9.1f} {r['loaded_rss_mib']:>9.1f} "
+            f"{s['requests_per_sec']:>9.1f} {s['p50_us']:>9.1f} {s['p99_us']:>9.1f}"
+        )
+        if s["errors"]:
+            print(f"  {s['errors']} request(s) did not return 200")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.time(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "requests": args.requests,
+                "clients": args.clients,
+                "fans": args.fans,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
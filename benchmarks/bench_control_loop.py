@@ -0,0 +1,272 @@
+"""Benchmark the daemon's control path against a mocked wireless controller.
+
+Measures list_fans, build_data, temp_to_pwm, the compiled CPU curve the loop
+caches, 32-point per-fan curves and full control ticks (also through the USB
+flight recorder) at several fan counts and writes the results as JSON so runs
+can be compared with --compare. Before timing, each fan count is listed
+through both the mock and the emulator to check the daemon sees every group.
+
+    python benchmarks/bench_control_loop.py --output before.json
+    python benchmarks/bench_control_loop.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from benchutil import git_revision, summarize
+import emulator
+import service
+from curves import CompiledCurve, CurveSet
+import flightrec
+from sources import SourceGraph
+from mock_usb import FakeRxDevice, FakeTxDevice
+from models import CurvePoint, FanCurve, Settings
+
+DEFAULT_FAN_COUNTS = [1, 8, 32, 128]
+
+
+def time_op(op: Callable[[], object], iterations: int) -> List[int]:
+    samples: List[int] = []
+    clock = time.perf_counter_ns
+    for _ in range(iterations):
+        start = clock()
+        op()
+        samples.append(clock() - start)
+    return samples
+
+
+def alloc_op(op: Callable[[], object], iterations: int) -> Dict[str, float]:
+    tracemalloc.start()
+    peak_total = 0
+    retained_total = 0
+    try:
+        for _ in range(iterations):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            op()
+            after, peak = tracemalloc.get_traced_memory()
+            peak_total += peak - before
+            retained_total += after - before
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_bytes": round(peak_total / iterations, 1),
+        "alloc_retained_bytes": round(retained_total / iterations, 1),
+    }
+
+
+def run_case(
+    op: Callable[[], object],
+    iterations: int,
+    warmup: int,
+    tx: FakeTxDevice = None,
+) -> Dict[str, float]:
+    for _ in range(warmup):
+        op()
+    frames_before = tx.frame_count if tx else 0
+    result = summarize(time_op(op, iterations))
+    if tx:
+        result["tx_frames_per_op"] = round(
+            (tx.frame_count - frames_before) / iterations, 2
+        )
+    result.update(alloc_op(op, max(1, min(iterations, 50))))
+    return result
+
+
+def prepare_service():
+    service.SETTINGS = Settings()
+    service.DEV_MODE = None
+    service.WRITE_INTERVAL = 0
+    service.get_gpu_temp = lambda: 55.0
+
+
+def check_listed(fan_count: int):
+    rx = FakeRxDevice(fan_count)
+    controller = emulator.EmulatedController(
+        emulator.EmulatorConfig(fans=fan_count, latency_ms=0, jitter_ms=0, seed=0)
+    )
+    for name, dev in (
+        ("mock", rx),
+        ("emulator", emulator.EmulatedDevice(controller, emulator.RX)),
+    ):
+        seen = len(service.list_fans(dev, []))
+        if seen != fan_count:
+            raise SystemExit(f"list_fans saw {seen} of {fan_count} {name} fan groups")
+
+
+def bench_fan_count(fan_count: int, iterations: int, warmup: int) -> Dict[str, dict]:
+    results: Dict[str, dict] = {}
+    rx = FakeRxDevice(fan_count)
+    tx = FakeTxDevice()
+    fans = service.list_fans(rx, [])
+
+    results["list_fans"] = run_case(
+        lambda: service.list_fans(rx, fans), iterations, warmup
+    )
+
+    fan = fans[0]
+    results["build_data"] = run_case(
+        lambda: [service.build_data(fan, seq) for seq in range(fan_count)],
+        iterations,
+        warmup,
+    )
+
+    temps = [30 + (i * 67) % 70 for i in range(fan_count)]
+    linear = service.SETTINGS.linear
+    results["temp_to_pwm"] = run_case(
+        lambda: [service.temp_to_pwm(t, linear) for t in temps], iterations, warmup
+    )
+    cpu_curve = CurveSet(service.SETTINGS).cpu
+    results["cpu_curve"] = run_case(
+        lambda: [cpu_curve(t) for t in temps], iterations, warmup
+    )
+    points = [CurvePoint(temp_c=20 + 3 * i, percent=3 * i) for i in range(32)]
+    fan_curve = CompiledCurve(points)
+    results["fan_curve_32pt"] = run_case(
+        lambda: [fan_curve(t) for t in temps], iterations, warmup
+    )
+    graph = SourceGraph(
+        {
+            "hot": "max(cpu, gpu)",
+            "smooth_hot": "ema(max(gpu, cpu), 10)",
+            "blend": "0.7 * cpu + 0.3 * gpu",
+            "case": "avg(hot, blend)",
+        }
+    )
+    inputs = {"cpu": 65.0, "gpu": 55.0}
+    results["source_graph"] = run_case(
+        lambda: graph.evaluate(inputs, None, time.monotonic()), iterations, warmup
+    )
+
+    state = service.LoopState()
+    service.get_cpu_temp = lambda: 65.0
+    results["control_tick_steady"] = run_case(
+        lambda: service.control_tick(rx, tx, state), iterations, warmup, tx
+    )
+
+    state = service.LoopState()
+    readings = [40.0, 80.0]
+    tick = {"n": 0}
+
+    def swinging_temp():
+        tick["n"] += 1
+        return readings[tick["n"] % 2]
+
+    service.get_cpu_temp = swinging_temp
+    results["control_tick_update"] = run_case(
+        lambda: service.control_tick(rx, tx, state), iterations, warmup, tx
+    )
+
+    recorder = flightrec.FlightRecorder(4096, Path(tempfile.gettempdir()))
+    recorded_rx = flightrec.RecorderDevice(rx, recorder, flightrec.DEVICE_RX)
+    recorded_tx = flightrec.RecorderDevice(tx, recorder, flightrec.DEVICE_TX)
+    state = service.LoopState()
+    results["control_tick_recorded"] = run_case(
+        lambda: service.control_tick(recorded_rx, recorded_tx, state),
+        iterations,
+        warmup,
+        tx,
+    )
+
+    base_settings = service.SETTINGS
+    service.SETTINGS = Settings(
+        fan_curves={
+            f.mac: FanCurve(source=("cpu", "gpu", "mix")[i % 3], points=points)
+            for i, f in enumerate(fans)
+        }
+    )
+    state = service.LoopState()
+    service.get_cpu_temp = lambda: 65.0
+    results["control_tick_fan_curves"] = run_case(
+        lambda: service.control_tick(rx, tx, state), iterations, warmup, tx
+    )
+    service.SETTINGS = base_settings
+    return results
+
+
+def print_report(report: dict, baseline: dict = None):
+    print(
+        f"{'case':24} {'fans':>5} {'mean us':>10} {'p99 us':>10} {'ops/s':>11} {'tx/op':>8}",
+        end="",
+    )
+    print(f" {'vs base':>8}" if baseline else "")
+    print("-" * (72 + (9 if baseline else 0)))
+    for fan_count, cases in report["results"].items():
+        for name, r in cases.items():
+            line = (
+                f"{name:24} {fan_count:>5} {r['mean_us']:>10.2f} {r['p99_us']:>10.2f} "
+                f"{r['ops_per_sec']:>11.1f} {r.get('tx_frames_per_op', 0):>8.1f}"
+            )
+            if baseline:
+                base = baseline.get("results", {}).get(fan_count, {}).get(name)
+                if base and base["mean_us"]:
+                    delta = (r["mean_us"] - base["mean_us"]) / base["mean_us"] * 100
+                    line += f" {delta:>+7.1f}%"
+                else:
+                    line += f" {'n/a':>8}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fans",
+        default=",".join(str(n) for n in DEFAULT_FAN_COUNTS),
+        help="comma-separated fan counts, at most 255 (default: 1,8,32,128)",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this path")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args()
+
+    fan_counts = [int(n) for n in args.fans.split(",") if n.strip()]
+    too_many = [n for n in fan_counts if n > emulator.MAX_RECORDS]
+    if too_many:
+        parser.error(
+            f"--fans: {too_many[0]} is more than the "
+            f"{emulator.MAX_RECORDS} fan groups the controller reports"
+        )
+
+    prepare_service()
+    for fan_count in fan_counts:
+        check_listed(fan_count)
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+        },
+        "results": {},
+    }
+    for fan_count in fan_counts:
+        report["results"][str(fan_count)] = bench_fan_count(
+            fan_count, args.iterations, args.warmup
+        )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
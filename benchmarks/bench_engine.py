@@ -0,0 +1,127 @@
+"""Compare the Python and NumPy target engines across fan counts.
+
+Routes group targets to synthetic fan lists (a quarter GPU, a quarter MIX,
+the rest CPU) with both engines and reports where NumPy starts to win:
+
+    python benchmarks/bench_engine.py
+    python benchmarks/bench_engine.py --fans 8,64,512,4096 --output engine.json
+
+Two cases are measured: "steady" (same targets every tick, nothing to
+write) and "update" (targets swing every tick, every fan changes).
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+from typing import Dict, List, Optional
+
+from benchutil import git_revision, summarize
+import service
+import vector
+from models import Fan
+
+DEFAULT_FAN_COUNTS = [1, 4, 16, 64, 256, 1024, 4096]
+
+
+def make_fans(count: int) -> List[Fan]:
+    return [
+        Fan(
+            mac=f"02:4c:4c:57:{(i >> 8) & 0xFF:02x}:{i & 0xFF:02x}",
+            master_mac="06:4c:4c:57:00:01",
+            channel=i % 40,
+            rx_type=1,
+            fan_count=1,
+            pwm=0,
+            rpm=[0, 0, 0, 0],
+            target_pwm=0,
+            is_bound=True,
+        )
+        for i in range(count)
+    ]
+
+
+def time_route(route, fans: List[Fan], swing: bool, iterations: int, warmup: int):
+    macs = [f.mac for f in fans]
+    gpu_mac_set = set(macs[0::4])
+    mix_mac_set = set(macs[1::4])
+    samples: List[int] = []
+    for n in range(warmup + iterations):
+        cpu = 100 + (n % 2) * 50 if swing else 120
+        start = time.perf_counter_ns()
+        route(fans, cpu, 140, gpu_mac_set, mix_mac_set, {}, False)
+        if n >= warmup:
+            samples.append(time.perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def crossover(results: Dict[str, dict], case: str) -> Optional[int]:
+    for fan_count, engines in results.items():
+        if engines["numpy"][case]["mean_us"] < engines["python"][case]["mean_us"]:
+            return int(fan_count)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fans",
+        default=",".join(str(n) for n in DEFAULT_FAN_COUNTS),
+        help="comma-separated fan counts (default: 1,4,16,64,256,1024,4096)",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    results: Dict[str, dict] = {}
+    for fan_count in [int(n) for n in args.fans.split(",") if n.strip()]:
+        engines = {}
+        for name in ("python", "numpy"):
+            route = (
+                service.route_targets
+                if name == "python"
+                else vector.VectorRouter().route
+            )
+            engines[name] = {
+                case: time_route(
+                    route, make_fans(fan_count), swing, args.iterations, args.warmup
+                )
+                for case, swing in (("steady", False), ("update", True))
+            }
+        results[str(fan_count)] = engines
+
+    print(f"{'fans':>6} {'case':8} {'python us':>11} {'numpy us':>11} {'speedup':>8}")
+    print("-" * 48)
+    for fan_count, engines in results.items():
+        for case in ("steady", "update"):
+            py = engines["python"][case]["mean_us"]
+            np_ = engines["numpy"][case]["mean_us"]
+            print(f"{fan_count:>6} {case:8} {py:>11.2f} {np_:>11.2f} {py / np_:>7.2f}x")
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "numpy": vector.np.__version__,
+            "machine": platform.machine(),
+            "iterations": args.iterations,
+        },
+        "results": results,
+        "crossover": {case: crossover(results, case) for case in ("steady", "update")},
+    }
+    print()
+    for case, fans in report["crossover"].items():
+        where = f"from {fans} fans" if fans else "not reached"
+        print(f"NumPy faster ({case}): {where}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""Poll a fleet of local daemons with the `llcw fleet` aggregator.
+
+Starts several API-only daemons, each on its own temporary socket and
+serving a synthetic status, and serves some of them over the token-protected
+TCP listener as well. Then it polls the whole fleet at each concurrency
+level and reports how long a round over every host takes:
+
+    python benchmarks/bench_fleet.py
+    python benchmarks/bench_fleet.py --hosts 32 --tcp 0.5 --concurrency 1,8,32 --output fleet.json
+
+Every round must find every host ok. A last round with a wrong token checks
+that the TCP hosts refuse it; the script exits with status 1 otherwise.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+from benchutil import BENCH_DIR, git_revision, summarize
+from bench_api_server import MODES, daemon_env, wait_ready
+import fleet
+
+TOKEN = "bench-fleet-token"
+
+SERVER_SNIPPET = """
+import sys, threading, time
+sys.path.insert(0, {bench!r})
+import benchutil
+import service
+from bench_status_codec import make_status
+
+def publish():
+    while True:
+        service.shared_state = make_status({fans})
+        time.sleep(0.5)
+
+threading.Thread(target=publish, daemon=True).start()
+service.start_api_server(service.bind_api_socket(), service.bind_tcp_socket())
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_hosts(args) -> Tuple[List[subprocess.Popen], List[fleet.Endpoint], str]:
+    root = tempfile.mkdtemp(prefix="llcw-fleet-")
+    code = SERVER_SNIPPET.format(bench=str(BENCH_DIR), fans=args.fans)
+    tcp_hosts = round(args.hosts * args.tcp)
+    procs, endpoints = [], []
+    for i in range(args.hosts):
+        home = os.path.join(root, f"host{i}")
+        env = daemon_env(home, args.api, args.fans)
+        if i < tcp_hosts:
+            port = free_port()
+            env.update(LLCW_API_TCP=f"127.0.0.1:{port}", LLCW_API_TOKEN=TOKEN)
+            endpoints.append(
+                fleet.parse_endpoint(f"host{i}=tcp://{TOKEN}@127.0.0.1:{port}")
+            )
+        else:
+            path = os.path.join(home, "ll-connect-wireless", "ll-connect-wireless.sock")
+            endpoints.append(fleet.parse_endpoint(f"host{i}={path}"))
+        procs.append(
+            subprocess.Popen(
+                [sys.executable, "-c", code],
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        )
+    for i, proc in enumerate(procs):
+        home = os.path.join(root, f"host{i}")
+        wait_ready(
+            os.path.join(home, "ll-connect-wireless", "ll-connect-wireless.sock"),
+            proc,
+            timeout=60,
+        )
+    return procs, endpoints, root
+
+
+def stop_hosts(procs: List[subprocess.Popen], root: str):
+    for proc in procs:
+        proc.send_signal(signal.SIGINT)
+    for proc in procs:
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    shutil.rmtree(root, ignore_errors=True)
+
+
+async def measure(
+    endpoints: List[fleet.Endpoint], concurrency: int, rounds: int, timeout: float
+) -> Dict[str, object]:
+    samples: List[int] = []
+    not_ok = 0
+    async with fleet.Fleet(endpoints, timeout, concurrency) as f:
+        await f.poll()
+        for _ in range(rounds):
+            start = time.perf_counter_ns()
+            results = await f.poll()
+            samples.append(time.perf_counter_ns() - start)
+            not_ok += sum(1 for r in results if r.state != "ok")
+    result = summarize(samples)
+    result.pop("ops_per_sec", None)
+    result["concurrency"] = concurrency
+    result["hosts_per_sec"] = round(
+        len(endpoints) * len(samples) / (sum(samples) / 1e9), 1
+    )
+    result["not_ok"] = not_ok
+    return result
+
+
+async def refused(endpoints: List[fleet.Endpoint], timeout: float) -> int:
+    """TCP hosts that answered a wrong token with anything but a 401."""
+    wrong = [
+        fleet.Endpoint(e.name, host=e.host, port=e.port, token="wrong")
+        for e in endpoints
+        if e.uds is None
+    ]
+    if not wrong:
+        return 0
+    async with fleet.Fleet(wrong, timeout) as f:
+        results = await f.poll()
+    return sum(1 for r in results if r.error is None or "unauthorized" not in r.error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hosts", type=int, default=8, help="daemons to start")
+    parser.add_argument(
+        "--tcp",
+        type=float,
+        default=0.5,
+        help="share of the daemons polled over TCP (default: 0.5)",
+    )
+    parser.add_argument(
+        "--api", choices=MODES, default="builtin", help="API server of the daemons"
+    )
+    parser.add_argument(
+        "--concurrency",
+        default="1,8,32",
+        help="comma-separated aggregator concurrency levels (default: 1,8,32)",
+    )
+    parser.add_argument("--rounds", type=int, default=50, help="polls per level")
+    parser.add_argument("--timeout", type=float, default=2.0, help="per-host timeout")
+    parser.add_argument("--fans", type=int, default=16, help="fans per daemon")
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.concurrency.split(",") if n.strip()]
+    print(f"Starting {args.hosts} daemons...")
+    procs, endpoints, root = start_hosts(args)
+    try:
+        print(
+            f"{'concurrency':>11} {'p50 ms':>9} {'p99 ms':>9} "
+            f"{'hosts/s':>9} {'not ok':>7}"
+        )
+        print("-" * 49)
+        results = []
+        for level in levels:
+            r = asyncio.run(measure(endpoints, level, args.rounds, args.timeout))
+            results.append(r)
+            print(
+                f"{level:>11} {r['p50_us'] / 1000:>9.2f} {r['p99_us'] / 1000:>9.2f} "
+                f"{r['hosts_per_sec']:>9.1f} {r['not_ok']:>7}"
+            )
+        accepted = asyncio.run(refused(endpoints, args.timeout))
+    finally:
+        stop_hosts(procs, root)
+
+    failed = any(r["not_ok"] for r in results) or accepted
+    if accepted:
+        print(f"\n{accepted} TCP host(s) did not refuse a wrong token")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.time(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "hosts": args.hosts,
+                "tcp_hosts": sum(1 for e in endpoints if e.uds is None),
+                "api": args.api,
+                "fans": args.fans,
+                "rounds": args.rounds,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""Replay a captured USB trace through the control loop faster than real time.
+
+Capture a trace from a running daemon with LLCW_CAPTURE=/path/to/session.trace,
+then replay it against the current tree:
+
+    python benchmarks/bench_replay.py session.trace --output replay.json
+
+Each recorded tick is fed back through control_tick() with the recorded
+sensor readings (hwmon ones for sensor() sources too), loads, tick time and settings. Emitted frames are compared with the recorded
+ones and per-tick processing time is reported next to the recorded tick time.
+The exit code is 1 when more than --max-mismatches frames differ.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from benchutil import git_revision, summarize
+import service
+import usbtrace
+from models import Settings
+
+
+class MissingSensors(Exception):
+    """A tick reads hwmon for sensor() sources but the trace has no readings."""
+
+
+def replay(path: str, verbose: bool = False) -> Dict[str, object]:
+    # The final tick is usually cut short when the daemon is stopped.
+    ticks = usbtrace.load_ticks(path)[:-1]
+    service.DEV_MODE = None
+    service.WRITE_INTERVAL = 0
+    service.SETTINGS = Settings()
+
+    rx = usbtrace.ReplayDevice(usbtrace.DEVICE_RX)
+    tx = usbtrace.ReplayDevice(usbtrace.DEVICE_TX)
+    state = service.LoopState()
+    current = {
+        "cpu": None,
+        "gpu": None,
+        "clock": 0.0,
+        "load": None,
+        "util": None,
+        "sensors": None,
+    }
+
+    def recorded_sensors():
+        if current["sensors"] is None:
+            raise MissingSensors()
+        return current["sensors"]
+
+    state.clock = lambda: current["clock"]
+    service.get_cpu_temp = lambda: current["cpu"]
+    service.get_gpu_temp = lambda: current["gpu"]
+    service.get_cpu_load = lambda: current["load"] or 0.0
+    service.get_gpu_stats = lambda: (current["gpu"], current["util"])
+    service.get_hwmon_temps = recorded_sensors
+
+    replay_ns: List[int] = []
+    recorded_ns: List[int] = []
+    mismatched_ticks: List[Dict[str, object]] = []
+    errors = 0
+    idle = 0
+    frames = 0
+
+    for tick in ticks:
+        if tick.settings:
+            service.SETTINGS = Settings.model_validate_json(tick.settings)
+        if tick.cpu_temp is None and tick.gpu_temp is None:
+            idle += 1
+            continue
+        current["cpu"] = tick.cpu_temp
+        current["gpu"] = tick.gpu_temp
+        # Traces from before the tick inputs were recorded fall back to the
+        # marker times, which are close but not exact for PID and RPM mode.
+        current["clock"] = tick.t if tick.clock is None else tick.clock
+        current["load"] = tick.cpu_load
+        current["util"] = tick.gpu_util
+        current["sensors"] = tick.sensors
+        rx.load(tick)
+        tx.load(tick)
+
+        start = time.perf_counter_ns()
+        try:
+            service.control_tick(rx, tx, state)
+        except MissingSensors:
+            raise SystemExit(
+                f"tick {tick.index} uses sensor() sources but the trace has no "
+                "hwmon readings for it (captured before they were recorded); "
+                "replaying it would read this machine's sensors"
+            )
+        except Exception as e:
+            errors += 1
+            if verbose:
+                print(f"tick {tick.index}: {e!r}")
+        replay_ns.append(time.perf_counter_ns() - start)
+        recorded_ns.append(int(tick.duration * 1_000_000_000))
+        frames += len(tx.written)
+
+        mismatches = rx.finish() + tx.finish()
+        if mismatches:
+            mismatched_ticks.append(
+                {"tick": tick.index, "count": len(mismatches), "detail": mismatches[:5]}
+            )
+            if verbose:
+                print(f"tick {tick.index}: {len(mismatches)} mismatch(es)")
+
+    replay_total = sum(replay_ns)
+    recorded_total = sum(recorded_ns)
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "revision": git_revision(),
+            "trace": os.path.abspath(path),
+        },
+        "ticks": len(ticks),
+        "idle_ticks": idle,
+        "replayed_ticks": len(replay_ns),
+        "tick_errors": errors,
+        "tx_frames": frames,
+        "mismatched_ticks": len(mismatched_ticks),
+        "mismatches": sum(t["count"] for t in mismatched_ticks),
+        "mismatch_detail": mismatched_ticks[:20],
+        "replay_tick": summarize(replay_ns),
+        "recorded_tick": summarize(recorded_ns),
+        "speedup": (round(recorded_total / replay_total, 1) if replay_total else 0.0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="trace captured with LLCW_CAPTURE")
+    parser.add_argument("--output", help="write JSON results to this path")
+    parser.add_argument("--max-mismatches", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    result = replay(args.trace, args.verbose)
+
+    print(f"Ticks replayed : {result['replayed_ticks']} ({result['idle_ticks']} idle)")
+    print(f"TX frames      : {result['tx_frames']}")
+    print(f"Tick errors    : {result['tick_errors']}")
+    print(
+        f"Mismatches     : {result['mismatches']} in {result['mismatched_ticks']} tick(s)"
+    )
+    replay_tick = result["replay_tick"]
+    recorded_tick = result["recorded_tick"]
+    if replay_tick["samples"]:
+        print(
+            f"Replay tick    : mean {replay_tick['mean_us']:.1f} us, "
+            f"p99 {replay_tick['p99_us']:.1f} us"
+        )
+        print(
+            f"Recorded tick  : mean {recorded_tick['mean_us']:.1f} us, "
+            f"p99 {recorded_tick['p99_us']:.1f} us"
+        )
+        print(f"Speedup        : {result['speedup']}x")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+    if result["mismatches"] > args.max_mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
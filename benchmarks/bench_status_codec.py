@@ -0,0 +1,138 @@
+"""Benchmark encoding and decoding of /status payloads in each media type.
+
+    python benchmarks/bench_status_codec.py
+    python benchmarks/bench_status_codec.py --fans 4,64 --output codec.json
+
+"json (legacy)" is the client path used before content negotiation:
+json.loads() followed by SystemStatus(**data). "binary (no pydantic)" only
+unpacks the records, as a status bar would. MessagePack and CBOR are only
+measured when msgpack / cbor2 are installed.
+"""
+
+import argparse
+import json
+import os
+import platform
+import time
+from typing import Callable, Dict, List
+
+from benchutil import git_revision, summarize
+import statuscodec
+from models import Fan, SystemStatus
+
+DEFAULT_FAN_COUNTS = [4, 16, 64]
+
+
+def make_status(count: int) -> SystemStatus:
+    return SystemStatus(
+        timestamp=time.time(),
+        cpu_temp=61.25,
+        gpu_temp=None,
+        fans=[
+            Fan(
+                mac=f"02:4c:4c:57:{(i >> 8) & 0xFF:02x}:{i & 0xFF:02x}",
+                master_mac="06:4c:4c:57:00:01",
+                channel=i % 40,
+                rx_type=1,
+                fan_count=3,
+                pwm=120 + i % 50,
+                rpm=[900 + i, 910 + i, 905 + i, 0],
+                target_pwm=128,
+                is_bound=True,
+            )
+            for i in range(count)
+        ],
+    )
+
+
+def measure(fn: Callable[[], object], iterations: int) -> Dict[str, float]:
+    for _ in range(min(50, iterations)):
+        fn()
+    samples: List[int] = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    return summarize(samples)
+
+
+def bench_fans(count: int, iterations: int) -> Dict[str, dict]:
+    status = make_status(count)
+    results: Dict[str, dict] = {}
+    for media_type in statuscodec.available():
+        payload = statuscodec.encode(status, media_type)
+        results[media_type] = {
+            "bytes": len(payload),
+            "encode": measure(
+                lambda: statuscodec.encode(status, media_type), iterations
+            ),
+            "decode": measure(
+                lambda: statuscodec.decode(payload, media_type), iterations
+            ),
+        }
+    binary = statuscodec.encode(status, statuscodec.BINARY)
+    results["binary (no pydantic)"] = {
+        "bytes": len(binary),
+        "encode": results[statuscodec.BINARY]["encode"],
+        "decode": measure(lambda: statuscodec.unpack_binary(binary), iterations),
+    }
+    legacy = statuscodec.encode(status, statuscodec.JSON)
+    results["json (legacy)"] = {
+        "bytes": len(legacy),
+        "encode": results[statuscodec.JSON]["encode"],
+        "decode": measure(lambda: SystemStatus(**json.loads(legacy)), iterations),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--fans",
+        default=",".join(str(n) for n in DEFAULT_FAN_COUNTS),
+        help="comma-separated fan counts (default: 4,16,64)",
+    )
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--output", help="write JSON results to this path")
+    args = parser.parse_args()
+
+    results = {
+        n: bench_fans(int(n), args.iterations)
+        for n in [n.strip() for n in args.fans.split(",") if n.strip()]
+    }
+
+    print(f"{'fans':>5} {'format':28} {'bytes':>7} {'encode us':>10} {'decode us':>10}")
+    print("-" * 64)
+    for fans, formats in results.items():
+        for name, r in formats.items():
+            print(
+                f"{fans:>5} {name:28} {r['bytes']:>7} "
+                f"{r['encode']['mean_us']:>10.2f} {r['decode']['mean_us']:>10.2f}"
+            )
+    missing = [
+        name
+        for media_type, name in statuscodec.CODEC_MODULES.items()
+        if statuscodec.codec(media_type) is None
+    ]
+    if missing:
+        print(f"\nNot installed, skipped: {', '.join(missing)}")
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": time.time(),
+                "revision": git_revision(),
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "iterations": args.iterations,
+            },
+            "results": results,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Helpers shared by the benchmark scripts."""
+
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+BENCH_DIR = Path(__file__).resolve().parent
+ROOT_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(ROOT_DIR / "src"))
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def summarize(samples_ns: List[int]) -> Dict[str, float]:
+    values = sorted(s / 1000 for s in samples_ns)
+    if not values:
+        return {"samples": 0}
+    mean = sum(values) / len(values)
+    return {
+        "samples": len(values),
+        "mean_us": round(mean, 3),
+        "p50_us": round(percentile(values, 50), 3),
+        "p90_us": round(percentile(values, 90), 3),
+        "p99_us": round(percentile(values, 99), 3),
+        "max_us": round(values[-1], 3),
+        "ops_per_sec": round(1_000_000 / mean, 1) if mean else 0.0,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except Exception:
+        return "unknown"
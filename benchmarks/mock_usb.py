@@ -0,0 +1,94 @@
+"""Minimal stand-ins for the TX/RX ``usb.core.Device`` objects used by the daemon.
+
+The RX device answers ``GET_DEV_CMD`` with synthetic RF pages describing a
+configurable number of fan groups, the TX device records every frame written
+to it. Both only implement the subset of the pyusb API that ``service.py``
+calls, and do no I/O, so benchmark numbers reflect the daemon's own cost.
+"""
+
+from array import array
+from typing import List
+
+GET_DEV_CMD = 0x10
+RF_PAGE_STRIDE = 434
+RECORD_SIZE = 42
+RECORD_MARKER = 28
+RECORDS_PER_PAGE = 10
+CHUNK_SIZE = 512
+
+
+def fake_mac(index: int, prefix: int = 0x02) -> bytes:
+    return bytes(
+        [prefix, 0x4C, 0x4C, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF]
+    )
+
+
+def build_record(index: int, pwm: int = 80, rpm: int = 900) -> bytes:
+    record = bytearray(RECORD_SIZE)
+    record[0:6] = fake_mac(index)
+    record[6:12] = fake_mac(0, prefix=0x06)
+    record[12] = index % 40
+    record[13] = 1
+    record[19] = 3
+    for slot in range(3):
+        value = rpm + index + slot
+        record[28 + slot * 2] = (value >> 8) & 0xFF
+        record[29 + slot * 2] = value & 0xFF
+    record[36:40] = bytes([pwm & 0xFF] * 4)
+    record[41] = RECORD_MARKER
+    return bytes(record)
+
+
+class FakeRxDevice:
+    def __init__(self, fan_count: int):
+        self.fan_count = fan_count
+        self.records = [build_record(i) for i in range(fan_count)]
+        self.reads = 0
+        self.writes = 0
+        self._pending = b""
+
+    def write(self, endpoint, data, timeout=None):
+        self.writes += 1
+        if data[0] == GET_DEV_CMD:
+            page_count = data[1] or 1
+            pages = bytearray(RF_PAGE_STRIDE * page_count)
+            for page in range(page_count):
+                start = page * RF_PAGE_STRIDE
+                chunk = self.records[
+                    page * RECORDS_PER_PAGE : (page + 1) * RECORDS_PER_PAGE
+                ]
+                body = bytes([GET_DEV_CMD, self.fan_count & 0xFF, 0, 0])
+                body += b"".join(chunk)
+                pages[start : start + len(body)] = body
+            self._pending = bytes(pages)
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        self.reads += 1
+        chunk = self._pending[:size]
+        self._pending = self._pending[size:]
+        return array("B", chunk)
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+
+class FakeTxDevice:
+    def __init__(self, keep_frames: bool = False):
+        self.keep_frames = keep_frames
+        self.frames: List[bytes] = []
+        self.frame_count = 0
+        self.byte_count = 0
+
+    def write(self, endpoint, data, timeout=None):
+        self.frame_count += 1
+        self.byte_count += len(data)
+        if self.keep_frames:
+            self.frames.append(bytes(data))
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        return array("B")
+
+    def is_kernel_driver_active(self, interface):
+        return False
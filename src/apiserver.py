@@ -0,0 +1,300 @@
+import asyncio
+import hmac
+import json
+import socket
+import threading
+from http import HTTPStatus
+from urllib.parse import parse_qsl
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ValidationError
+
+MAX_HEADER_LINES = 64
+MAX_BODY = 1 << 20
+JSON_TYPE = "application/json"
+
+
+class ApiError(Exception):
+    """An error answered as ``{"detail": ...}`` with the given status code."""
+
+    def __init__(self, status_code: int, detail: Any):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class Request:
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        version: str,
+        headers: Dict[str, str],
+        body: bytes,
+        query: Optional[Dict[str, str]] = None,
+    ):
+        self.method = method
+        self.path = path
+        self.query = query or {}
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body)
+        except ValueError as e:
+            raise ApiError(422, [{"type": "json_invalid", "msg": str(e)}])
+
+    def model(self, model: type) -> BaseModel:
+        try:
+            return model.model_validate_json(self.body)
+        except ValidationError as e:
+            raise ApiError(422, validation_detail(e))
+
+
+class Response:
+    """A pre-encoded body, returned by handlers that pick their own media type."""
+
+    def __init__(
+        self, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None
+    ):
+        self.body = body
+        self.media_type = media_type
+        self.headers = headers or {}
+
+
+class StreamResponse:
+    """A body sent chunk by chunk as ``chunks`` yields, until the client leaves."""
+
+    def __init__(self, chunks: AsyncIterator[bytes], media_type: str):
+        self.chunks = chunks
+        self.media_type = media_type
+
+
+class Broadcast:
+    """Wakes coroutines, on any event loop, when another thread publishes.
+
+    ``wait(seen)`` returns at once when something was published after
+    version ``seen``, so a waiter that was busy does not miss a publish.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.lock = threading.Lock()
+
+    def publish(self):
+        with self.lock:
+            self.version += 1
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(wake, future)
+
+    async def wait(self, seen: int) -> int:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            if self.version != seen:
+                return self.version
+            future = loop.create_future()
+            self.waiters.append((loop, future))
+        await future
+        return self.version
+
+
+def wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+Handler = Callable[[Request], Any]
+Routes = Dict[Tuple[str, str], Handler]
+
+
+def validation_detail(e: ValidationError) -> list:
+    return [
+        {
+            "type": err["type"],
+            "loc": ["body", *err["loc"]],
+            "msg": err["msg"],
+            "input": err.get("input"),
+        }
+        for err in e.errors(include_url=False)
+    ]
+
+
+def authorized(authorization: Optional[str], token: str) -> bool:
+    """Whether an ``Authorization`` header carries ``Bearer <token>``."""
+    scheme, _, value = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(
+        value.strip().encode(), token.encode()
+    )
+
+
+def encode(value: Any) -> bytes:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json().encode()
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def stream_head(media_type: str) -> bytes:
+    return (
+        "HTTP/1.1 200 OK\r\n"
+        "transfer-encoding: chunked\r\n"
+        f"content-type: {media_type}\r\n"
+        "cache-control: no-cache\r\n\r\n"
+    ).encode()
+
+
+def response(
+    status: int,
+    payload: bytes,
+    keep_alive: bool,
+    media_type: str = JSON_TYPE,
+    headers: Optional[Dict[str, str]] = None,
+) -> bytes:
+    head = (
+        f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        f"content-length: {len(payload)}\r\n"
+        f"content-type: {media_type}\r\n"
+    )
+    for name, value in (headers or {}).items():
+        head += f"{name}: {value}\r\n"
+    if not keep_alive:
+        head += "connection: close\r\n"
+    return head.encode() + b"\r\n" + payload
+
+
+class ApiServer:
+    """A small HTTP/1.1 server for the daemon's JSON routes on a Unix socket.
+
+    Handlers run on the event loop thread, the same way the FastAPI app runs
+    its ``async`` endpoints, and return a pydantic model or a JSON-able value.
+    Keep-alive is supported; chunked request bodies are not. With a
+    ``token``, every request must authenticate with it (the TCP listener).
+    """
+
+    def __init__(self, routes: Routes, token: Optional[str] = None):
+        self.routes = routes
+        self.paths = {path for _, path in routes}
+        self.token = token
+
+    def dispatch(self, request: Request) -> Tuple[int, Any, str, Dict[str, str]]:
+        handler = self.routes.get((request.method, request.path))
+        try:
+            if self.token and not authorized(
+                request.headers.get("authorization"), self.token
+            ):
+                raise ApiError(401, "Missing or invalid API token")
+            if handler is None:
+                if request.path in self.paths:
+                    raise ApiError(405, "Method Not Allowed")
+                raise ApiError(404, "Not Found")
+            result = handler(request)
+            if isinstance(result, Response):
+                return 200, result.body, result.media_type, result.headers
+            if isinstance(result, StreamResponse):
+                return 200, result.chunks, result.media_type, {}
+            return 200, encode(result), JSON_TYPE, {}
+        except ApiError as e:
+            return e.status_code, encode({"detail": e.detail}), JSON_TYPE, {}
+        except Exception as e:
+            print(f"API error on {request.method} {request.path}: {e}")
+            return 500, encode({"detail": "Internal Server Error"}), JSON_TYPE, {}
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        line = await reader.readline()
+        if not line:
+            return None
+        method, target, version = line.decode("latin-1").split()
+        headers: Dict[str, str] = {}
+        for _ in range(MAX_HEADER_LINES):
+            raw = await reader.readline()
+            if raw in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = raw.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("too many header lines")
+        if "chunked" in headers.get("transfer-encoding", ""):
+            raise ValueError("chunked request bodies are not supported")
+        length = int(headers.get("content-length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        body = await reader.readexactly(length) if length else b""
+        path, _, query = target.partition("?")
+        return Request(method, path, version, headers, body, dict(parse_qsl(query)))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ValueError as e:
+                    writer.write(response(400, encode({"detail": str(e)}), False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                connection = request.headers.get("connection", "").lower()
+                if request.version == "HTTP/1.0":
+                    keep_alive = connection == "keep-alive"
+                else:
+                    keep_alive = connection != "close"
+                status, payload, media_type, headers = self.dispatch(request)
+                if not isinstance(payload, bytes):
+                    await self.stream(writer, payload, media_type)
+                    break
+                writer.write(response(status, payload, keep_alive, media_type, headers))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream(
+        self, writer: asyncio.StreamWriter, chunks: AsyncIterator[bytes], media_type
+    ):
+        """Send ``chunks`` with chunked encoding; the connection closes after."""
+        writer.write(stream_head(media_type))
+        try:
+            async for chunk in chunks:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            await chunks.aclose()
+
+    async def start(self, sock: socket.socket) -> asyncio.AbstractServer:
+        if sock.family == socket.AF_UNIX:
+            return await asyncio.start_unix_server(self.handle, sock=sock)
+        return await asyncio.start_server(self.handle, sock=sock)
+
+    async def serve(self, sock: socket.socket):
+        server = await self.start(sock)
+        async with server:
+            await server.serve_forever()
+
+
+async def serve_all(listeners: List[Tuple["ApiServer", socket.socket]]):
+    servers = [await api.start(sock) for api, sock in listeners]
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def serve_unix(routes: Routes, sock: socket.socket):
+    """Serve ``routes`` on an already bound and listening Unix socket."""
+    asyncio.run(ApiServer(routes).serve(sock))
+
+
+def serve_sockets(
+    routes: Routes, sock: socket.socket, tcp_sock: socket.socket, token: str
+):
+    """Serve ``routes`` on the Unix socket and, with ``token``, on a TCP one.
+
+    Both run on one event loop, so handlers never run concurrently.
+    """
+    asyncio.run(
+        serve_all([(ApiServer(routes), sock), (ApiServer(routes, token), tcp_sock)])
+    )
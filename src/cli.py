@@ -1,3 +1,5 @@
+import difflib
+import json
 import os
 import shutil
 import sys
@@ -6,22 +8,40 @@ import argparse
 import subprocess
 from typing import Optional
 import httpx
+import shmstatus
+import statuscodec
 from utils import (
     CACHE_DIR,
     CONFIG_DIR,
     SOCKET_PATH,
+    STATUS_SHM_PATH,
     check_latest_version,
+    format_fan_curve,
     format_four_point_curve,
+    format_settings,
+    format_pid,
+    format_rpm_curve,
     get_build_identity,
     load_settings,
+    merge_settings,
     parse_curve_input,
+    parse_fan_curve_input,
     parse_four_point_curve_input,
+    parse_pid_input,
+    parse_rpm_curve_input,
+    resolve_fan_ids,
     save_settings,
 )
 from models import (
+    FAN_CURVE_MAX_POINTS,
     FanMode,
     LinearMode,
+    CalibrationStatus,
+    PidMode,
+    RpmMode,
     Settings,
+    SettingsState,
+    ShadowStatus,
     SystemStatus,
     VersionInfo,
     VersionStatus,
@@ -38,44 +58,95 @@ def clear_console():
     sys.stdout.flush()
 
 
-def fetch_state() -> SystemStatus:
+STATUS_ACCEPT = f"{statuscodec.BINARY}, {statuscodec.JSON};q=0.5"
+
+
+def fetch_state(accept: str = STATUS_ACCEPT) -> SystemStatus:
+    """Fetch /status, preferring the binary format; older daemons answer JSON."""
     transport = httpx.HTTPTransport(uds=SOCKET_PATH)
     with httpx.Client(transport=transport) as client:
-        resp = client.get("http://localhost/status")
+        resp = client.get("http://localhost/status", headers={"accept": accept})
+        resp.raise_for_status()
+        return statuscodec.decode(resp.content, resp.headers.get("content-type"))
+
+
+def daemon_client() -> httpx.Client:
+    transport = httpx.HTTPTransport(uds=SOCKET_PATH)
+    return httpx.Client(transport=transport, base_url="http://localhost")
+
+
+def raise_for_daemon_error(resp: httpx.Response):
+    """Raise ValueError with the daemon's message for an error response.
+
+    Bodies that are not the daemon's JSON (a proxy's HTML page, say) are
+    reported as text with the status code.
+    """
+    if resp.status_code < 400:
+        return
+    try:
+        detail = resp.json().get("detail")
+    except (ValueError, AttributeError):
+        detail = None
+    if isinstance(detail, list):
+        detail = "\n".join(str(d) for d in detail)
+    if detail is None or resp.status_code not in (400, 409, 412, 422, 503):
+        text = detail or resp.text.strip() or resp.reason_phrase
+        detail = f"the daemon answered {resp.status_code}: {text}"
+    raise ValueError(detail)
+
+
+def get_settings() -> Settings:
+    """Return the daemon's live settings, or the config file when it is down."""
+    try:
+        with daemon_client() as client:
+            resp = client.get("/settings")
         resp.raise_for_status()
-        return SystemStatus(**resp.json())
+        return SettingsState(**resp.json()).settings
+    except httpx.HTTPError:
+        return load_settings()
 
 
-def reload_service_settings():
+def update_settings(changes: dict, replace: bool = False) -> Settings:
+    """Apply a partial settings update in one round trip to the daemon.
+
+    The daemon validates and applies it in memory and persists it itself.
+    When the daemon is not running, the update is merged into config.json.
+    With ``replace``, the update is merged onto the defaults instead of the
+    current settings, so everything it leaves out is reset.
+    """
     try:
-        transport = httpx.HTTPTransport(uds=SOCKET_PATH)
-        with httpx.Client(transport=transport) as client:
-            client.post("http://localhost/reload-settings")
-    except:
+        with daemon_client() as client:
+            if replace:
+                resp = client.put("/settings", json=changes)
+            else:
+                resp = client.patch("/settings", json=changes)
+    except httpx.TransportError:
+        base = Settings() if replace else load_settings()
+        settings = merge_settings(base, changes)
+        save_settings(settings)
         print(
-            "\033[93mUnable to inform the changes to daemon, maybe it's not running.\033[0m"
+            "\033[93mDaemon is not running, the change was saved to the config file only.\033[0m"
         )
+        return settings
+    raise_for_daemon_error(resp)
+    return SettingsState(**resp.json()).settings
 
 
-def resolve_fan_ids(fan_ids_str: str, fans) -> list:
-    ids = []
-    for part in fan_ids_str.split(","):
-        part = part.strip()
-        if not part:
-            continue
-        try:
-            fid = int(part)
-        except ValueError:
-            raise ValueError(f"'{part}' is not a valid fan ID (must be an integer)")
-        if fid < 0 or fid >= len(fans):
-            raise ValueError(
-                f"Fan ID {fid} is out of range. Valid IDs: 0-{len(fans) - 1}"
-            )
-        if fid not in ids:
-            ids.append(fid)
-    if not ids:
-        raise ValueError("No fan IDs provided")
-    return [fans[i].mac.lower() for i in ids]
+def assign_sources(fan_ids: str, group: str) -> Settings:
+    with daemon_client() as client:
+        resp = client.post(
+            "/settings/sources", json={"fan_ids": fan_ids, "group": group}
+        )
+    raise_for_daemon_error(resp)
+    return SettingsState(**resp.json()).settings
+
+
+def resolve_fans(fans: str) -> list:
+    """Resolve comma-separated monitor IDs or MAC addresses to MACs."""
+    parts = [p.strip() for p in fans.split(",") if p.strip()]
+    if parts and all(":" in p for p in parts):
+        return [p.lower() for p in parts]
+    return resolve_fan_ids(fans, fetch_state().fans)
 
 
 def get_fan_source(mac: str, settings: Settings) -> str:
@@ -114,12 +185,13 @@ def render(status: SystemStatus, settings: Settings):
         )
 
 
-def run_monitor():
+def run_monitor(use_shm: bool = False):
     err = 0
     settings = load_settings()
+    reader = shmstatus.StatusReader(STATUS_SHM_PATH) if use_shm else None
     while True:
         try:
-            state = fetch_state()
+            state = reader.read() if reader else fetch_state()
             settings = load_settings()
             render(state, settings)
             err = 0
@@ -133,6 +205,99 @@ def run_monitor():
         time.sleep(1)
 
 
+WATCH_RETRY_SECONDS = 1.0
+
+
+def drop_stdout():
+    """The reader of stdout went away (e.g. `| head`); discard what is left."""
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def run_status_json():
+    """Print the daemon's current status as one line of compact JSON."""
+    try:
+        with daemon_client() as client:
+            resp = client.get("/status", headers={"accept": statuscodec.JSON})
+        resp.raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Error: unable to get the status from the daemon: {e}", file=sys.stderr)
+        sys.exit(1)
+    body = resp.text.strip()
+    if body == "null":
+        print("Error: the daemon has no fan data yet", file=sys.stderr)
+        sys.exit(1)
+    try:
+        print(body, flush=True)
+    except BrokenPipeError:
+        drop_stdout()
+
+
+def format_watch_line(status: SystemStatus) -> str:
+    cpu = f"{status.cpu_temp:.1f}" if status.cpu_temp is not None else "-"
+    gpu = f"{status.gpu_temp:.1f}" if status.gpu_temp is not None else "-"
+    percents = [round(f.pwm * 100 / 255) for f in status.fans]
+    rpms = [r for f in status.fans for r in f.rpm[: f.fan_count] if r > 0]
+    return (
+        f"{time.strftime('%H:%M:%S', time.localtime(status.timestamp))}  "
+        f"CPU {cpu} °C  GPU {gpu} °C  "
+        f"PWM {min(percents, default=0)}-{max(percents, default=0)}%  "
+        f"RPM {min(rpms, default=0)}-{max(rpms, default=0)}  "
+        f"alerts {len(status.alerts)}"
+    )
+
+
+def run_watch(ndjson: bool, interval: float, on_change: bool):
+    """Stream the daemon's status over one connection, reconnecting if it drops.
+
+    Only status lines go to stdout, so it can be piped; notices go to stderr.
+    """
+    params = {"interval": interval}
+    if on_change:
+        params["on_change"] = 1
+    timeout = httpx.Timeout(5.0, read=None)
+    connected = True
+    try:
+        with daemon_client() as client:
+            while True:
+                try:
+                    with client.stream(
+                        "GET", "/watch", params=params, timeout=timeout
+                    ) as resp:
+                        if resp.status_code == 404:
+                            print(
+                                "Error: the running daemon has no /watch, restart it after updating",
+                                file=sys.stderr,
+                            )
+                            sys.exit(1)
+                        if resp.status_code != 200:
+                            resp.read()
+                            raise_for_daemon_error(resp)
+                        if not connected:
+                            print("Reconnected.", file=sys.stderr)
+                            connected = True
+                        for line in resp.iter_lines():
+                            if not line:
+                                continue
+                            if not ndjson:
+                                status = SystemStatus.model_validate_json(line)
+                                line = format_watch_line(status)
+                            sys.stdout.write(line + "\n")
+                            sys.stdout.flush()
+                except httpx.TransportError as e:
+                    if connected:
+                        print(
+                            f"Lost the daemon ({e or type(e).__name__}), retrying...",
+                            file=sys.stderr,
+                        )
+                        connected = False
+                time.sleep(WATCH_RETRY_SECONDS)
+    except (ValueError, httpx.HTTPStatusError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    except BrokenPipeError:
+        drop_stdout()
+
+
 def run_systemctl(action: str, service=True):
     service_name = f"{APP_NAME}.service"
 
@@ -278,6 +443,19 @@ def show_settings(settings: Settings):
     print("Curve Mode:")
     print(f"  CPU_FAN_CURVE : {format_four_point_curve(settings.cpu_curve)}")
     print(f"  GPU_FAN_CURVE : {format_four_point_curve(settings.gpu_curve)}")
+    for mac, curve in settings.fan_curves.items():
+        fan_curve = format_fan_curve(curve)
+        print(f"  {mac} : {fan_curve['source']} {fan_curve['curve']}")
+    for name, expression in settings.sources.items():
+        print(f"  source {name} = {expression}")
+    print()
+    print("PID Mode:")
+    print(f"  PID : {format_pid(settings.pid)}")
+    print()
+    print("RPM Mode:")
+    print(f"  CPU_RPM_CURVE : {format_rpm_curve(settings.rpm.cpu_curve)}")
+    print(f"  GPU_RPM_CURVE : {format_rpm_curve(settings.rpm.gpu_curve)}")
+    print(f"  CALIBRATED    : {len(settings.calibrations)} fan group(s)")
     print()
     print("Fan Source Groups:")
     print(
@@ -309,6 +487,442 @@ def show_curve_settings(settings: Settings):
     print("-" * 30)
 
 
+def show_fan_curve_settings(settings: Settings):
+    print("\033[1mPer-Fan Curves\033[0m")
+    print("-" * 30)
+    if not settings.fan_curves:
+        print("(none)")
+    for mac, curve in settings.fan_curves.items():
+        fan_curve = format_fan_curve(curve)
+        print(f"{mac} : {fan_curve['source']:>3} {fan_curve['curve']}")
+    print("-" * 30)
+
+
+def show_source_settings(settings: Settings):
+    print("\033[1mNamed Sources\033[0m")
+    print("-" * 30)
+    if not settings.sources:
+        print("(none)")
+    for name, expression in settings.sources.items():
+        print(f"{name} = {expression}")
+    print("-" * 30)
+
+
+def show_pid_settings(settings: Settings):
+    print("\033[1mPID Mode Settings\033[0m")
+    print("-" * 30)
+    for key, value in settings.pid.model_dump().items():
+        print(f"{key:17} : {value}")
+    print("-" * 30)
+
+
+def show_rpm_settings(settings: Settings):
+    print("\033[1mRPM Mode Settings\033[0m")
+    print("-" * 30)
+    print(f"CPU_RPM_CURVE : {format_rpm_curve(settings.rpm.cpu_curve)}")
+    print(f"GPU_RPM_CURVE : {format_rpm_curve(settings.rpm.gpu_curve)}")
+    for key in ("correction_gain", "max_correction", "tolerance"):
+        print(f"{key:15} : {getattr(settings.rpm, key)}")
+    print()
+    print("Calibrations:")
+    if not settings.calibrations:
+        print("  (none, fans use a linear 0-2000 RPM estimate)")
+    for mac, calibration in settings.calibrations.items():
+        table = " ".join(
+            f"{round(p * 100 / 255)}%:{r}"
+            for p, r in zip(calibration.pwm, calibration.rpm)
+        )
+        print(f"  {mac} : {table}")
+    print("-" * 30)
+
+
+def parse_rpm_values(values: list) -> dict:
+    keys = ("correction_gain", "max_correction", "tolerance")
+    changes = {}
+    for value in values:
+        key, sep, raw = value.partition("=")
+        key = key.strip().lower()
+        if not sep or key not in keys:
+            raise ValueError(
+                f"Invalid RPM parameter '{value}'. Use key=value with keys: {', '.join(keys)}."
+            )
+        changes[key] = raw.strip()
+    return changes
+
+
+def run_calibrate(fans: Optional[str]):
+    try:
+        with daemon_client() as client:
+            body = {"fan_ids": fans} if fans else {}
+            resp = client.post("/calibrate", json=body)
+            raise_for_daemon_error(resp)
+            status = CalibrationStatus(**resp.json())
+            print(
+                f"Calibrating {len(status.macs)} fan group(s); "
+                "their speed sweeps from 0% to 100%."
+            )
+            while status.running:
+                print(
+                    f"\r  step {status.step + 1}/{status.steps}, "
+                    f"about {status.remaining:.0f} s left   ",
+                    end="",
+                    flush=True,
+                )
+                time.sleep(1)
+                resp = client.get("/calibrate")
+                raise_for_daemon_error(resp)
+                status = CalibrationStatus(**resp.json())
+            print()
+    except httpx.ConnectError:
+        print("Error: Service is not running. Start it first with: llcw start")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if status.error:
+        print(f"Calibration failed: {status.error}")
+        sys.exit(1)
+    print("Calibration finished.")
+    show_rpm_settings(get_settings())
+
+
+def run_apply(source: str, dry_run: bool):
+    try:
+        if source == "-":
+            raw = json.load(sys.stdin)
+        else:
+            with open(source, "r") as f:
+                raw = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Error: unable to read {source}: {e}")
+        sys.exit(1)
+
+    current = get_settings()
+    try:
+        updated = merge_settings(current, raw)
+    except ValueError as e:
+        print("\033[91mInvalid settings, nothing was changed:\033[0m")
+        for line in str(e).splitlines():
+            print(f"  {line}")
+        sys.exit(1)
+
+    before = format_settings(current).splitlines()
+    after = format_settings(updated).splitlines()
+    if before == after:
+        print("No changes.")
+        return
+
+    if dry_run:
+        for line in difflib.unified_diff(before, after, "current", source, lineterm=""):
+            print(line)
+        return
+
+    try:
+        update_settings(raw)
+    except (ValueError, httpx.HTTPError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Settings applied successfully.")
+
+
+def format_span(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} h"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds:.1f} s"
+
+
+def run_simulate(args):
+    try:
+        import simulate
+
+        candidates = [simulate.linear_candidate(s) for s in args.linear or []]
+        candidates += [simulate.curve_candidate(s) for s in args.curve or []]
+        if not candidates:
+            candidates = simulate.settings_candidates(load_settings())
+        started = time.perf_counter()
+        trace = simulate.load_trace(args.trace)
+        loaded = time.perf_counter()
+        sim = simulate.Simulation(trace, args.source, args.interval, candidates)
+        results = sim.stats(args.above)
+        finished = time.perf_counter()
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    temps = sim.temps
+    print(
+        f"{len(temps)} samples over {format_span(float(sim.durations.sum()))}, "
+        f"{args.source.upper()} {temps.min():.1f}-{temps.max():.1f} °C "
+        f"(mean {temps.mean():.1f} °C)"
+    )
+    print(
+        f"Loaded in {loaded - started:.2f} s, simulated in {finished - loaded:.2f} s\n"
+    )
+    width = max(len(r["candidate"]) for r in results)
+    above = f">{args.above:g}%"
+    print(f"{'Candidate':{width}}  Mean %  P95 %  Max %  {above:>6}  Writes  Writes/h")
+    print("-" * (width + 52))
+    for r in results:
+        print(
+            f"{r['candidate']:{width}}  "
+            f"{r['mean_percent']:>6.1f}  "
+            f"{r['p95_percent']:>5.1f}  "
+            f"{r['max_percent']:>5.1f}  "
+            f"{r['above_percent_time']:>5.1f}%  "
+            f"{r['writes']:>6}  "
+            f"{r['writes_per_hour']:>8.1f}"
+        )
+    if args.output:
+        sim.save(args.output)
+        print(f"\nPWM timeline written to {args.output}")
+
+
+def run_tune(args):
+    try:
+        import simulate
+        import tune
+
+        settings = load_settings()
+        trace = simulate.load_trace(args.trace)
+        history = tune.History(
+            trace, args.source, args.interval, tune.settings_pwm(settings, args.source)
+        )
+        fitted = tune.fit_response(history.raw_temps, history.raw_duty, history.sample)
+        time_constant, effect = fitted or (
+            tune.DEFAULT_TIME_CONSTANT,
+            tune.DEFAULT_FULL_SPEED_EFFECT,
+        )
+        if args.time_constant is not None:
+            time_constant = args.time_constant
+        if args.fan_effect is not None:
+            effect = args.fan_effect
+        model = tune.ThermalModel(
+            history.temps, history.duty, history.step, time_constant, effect
+        )
+    except (OSError, RuntimeError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    temps = history.temps
+    print(
+        f"{history.samples} samples over {format_span(history.duration)}, "
+        f"{args.source.upper()} {temps.min():.1f}-{temps.max():.1f} °C, "
+        f"modelled in {len(temps)} steps of {history.step:.2f} s"
+    )
+    if not history.recorded_pwm:
+        print(
+            f"The trace has no fan PWM; assuming it ran under the current "
+            f"{settings.mode.value} settings."
+        )
+    if fitted is None:
+        print(
+            "The history does not separate the fans' effect from the load; "
+            "set --time-constant and --fan-effect for your machine."
+        )
+    print(
+        f"Thermal model: time constant {model.time_constant:.0f} s, "
+        f"full fan speed {model.full_speed_effect:+.1f} °C"
+        f"{'' if fitted else ' (assumed)'}"
+    )
+    print(
+        f"Recorded: mean {history.duty.mean() * 100:.1f}% duty, "
+        f"peak {temps.max():.1f} °C\n"
+    )
+
+    current_curve = settings.cpu_curve if args.source == "cpu" else settings.gpu_curve
+    current = tune.genome_of(current_curve)
+    jobs = max(1, args.jobs or tune.default_jobs())
+    started = time.perf_counter()
+
+    def progress(generation: int, best):
+        if generation % 10 == 0 or generation == args.generations:
+            mean, peak = tuner.scores[best]
+            print(
+                f"generation {generation:>3}: {tune.format_curve(best):24} "
+                f"{mean:5.1f}% duty, peak {peak:.1f} °C"
+            )
+
+    with tune.Tuner(model, temps, args.max_temp, jobs, args.seed) as tuner:
+        ranked = tuner.search([current], args.population, args.generations, progress)
+    print(
+        f"Evaluated {len(ranked)} curves in {time.perf_counter() - started:.1f} s "
+        f"with {jobs} process(es)\n"
+    )
+
+    top = ranked[: args.top]
+    rows = [("current", current)] + [(f"#{i + 1}", g) for i, g in enumerate(top)]
+    print(f"{'':8} {'Curve':24} Mean %  Peak °C")
+    print("-" * 51)
+    for label, genome in rows:
+        mean, peak = tuner.scores[genome]
+        flag = "" if peak <= args.max_temp else "  over"
+        print(
+            f"{label:8} {tune.format_curve(genome):24} {mean:6.1f}  {peak:7.1f}{flag}"
+        )
+
+    best = top[0]
+    if tuner.scores[best][1] > args.max_temp:
+        print(
+            f"\nNo curve kept the simulated {args.source.upper()} temperature at or "
+            f"below {args.max_temp:g} °C."
+        )
+        sys.exit(1)
+
+    key = "CPU_FAN_CURVE" if args.source == "cpu" else "GPU_FAN_CURVE"
+    snippet = json.dumps(
+        {
+            "mode": FanMode.curve.value,
+            key: format_four_point_curve(tune.curve_of(best)),
+        },
+        indent=4,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(snippet + "\n")
+        print(f"\nSettings written to {args.output}; apply them with:")
+        print(f"  {APP_ALIAS} settings apply {args.output}")
+    else:
+        print(f"\nApply with '{APP_ALIAS} settings apply <file>':")
+        print(snippet)
+
+
+def run_fleet(args):
+    import asyncio
+    import fleet
+
+    token = args.token or os.getenv("LLCW_API_TOKEN")
+    try:
+        endpoints = [fleet.parse_endpoint(e, token) for e in args.endpoints]
+        if args.file:
+            endpoints += fleet.load_endpoints(args.file, token)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if not endpoints:
+        print("Error: give daemon endpoints as arguments or with --file")
+        sys.exit(1)
+
+    async def run() -> bool:
+        async with fleet.Fleet(endpoints, args.timeout, args.concurrency) as f:
+            while True:
+                started = time.monotonic()
+                results = await f.poll()
+                rows = fleet.sort_rows(
+                    [fleet.host_row(r) for r in results], args.sort, args.reverse
+                )
+                if not args.once:
+                    clear_console()
+                up = sum(1 for r in rows if r["state"] == "ok")
+                print(
+                    f"\033[1mFleet\033[0m  {up}/{len(rows)} ok  "
+                    f"{time.strftime('%H:%M:%S')}"
+                )
+                print()
+                for line in fleet.format_table(rows):
+                    print(line)
+                fan_rows = None
+                if args.fans:
+                    order = [r["host"] for r in rows]
+                    fan_rows = [row for r in results for row in fleet.fan_rows(r)]
+                    fan_rows.sort(key=lambda row: order.index(row["host"]))
+                    print()
+                    for line in fleet.format_fan_table(fan_rows):
+                        print(line)
+                if args.output:
+                    fleet.export(args.output, results, rows, fan_rows)
+                if args.once:
+                    return up == len(rows)
+                await asyncio.sleep(
+                    max(0, args.interval - (time.monotonic() - started))
+                )
+
+    if not asyncio.run(run()):
+        sys.exit(1)
+
+
+def show_shadow(status: ShadowStatus):
+    if status.dry_run is not None:
+        print(
+            f"Dry run: {status.dry_run.frames} frame(s) recorded, none sent to the fans"
+        )
+    summary = status.summary
+    if summary is None:
+        print("No shadow engine is running.")
+        return
+    state = "running" if status.running else "stopped"
+    print(f"\033[1mShadow engine\033[0m ({status.engine}, {state})")
+    print(f"  Settings: {json.dumps(status.settings)}")
+    print(
+        f"  Ticks: {summary.ticks}, with different targets: {summary.differing_ticks}"
+    )
+    print(
+        f"  Target difference: max {summary.max_diff * 100 / 255:.0f}%, "
+        f"mean {summary.mean_diff * 100 / 255:.1f}%"
+    )
+    print(f"  {'':8} {'writes':>8} {'p50 us':>8} {'p99 us':>8}")
+    print(
+        f"  {'live':8} {summary.live_writes:>8} "
+        f"{summary.live_p50_us:>8} {summary.live_p99_us:>8}"
+    )
+    print(
+        f"  {'shadow':8} {summary.shadow_writes:>8} "
+        f"{summary.shadow_p50_us:>8} {summary.shadow_p99_us:>8}"
+    )
+    if status.ticks:
+        print()
+        print(f"{'Time':8}  {'Fan Address':17}  {'Live %':>6}  {'Shadow %':>8}")
+        print("-" * 46)
+        for tick in status.ticks:
+            when = time.strftime("%H:%M:%S", time.localtime(tick.timestamp))
+            for mac, (live, shadow) in tick.diffs.items():
+                print(
+                    f"{when:8}  {mac:17}  {live * 100 / 255:>6.0f}  "
+                    f"{shadow * 100 / 255:>8.0f}"
+                )
+
+
+def run_shadow(args):
+    try:
+        with daemon_client() as client:
+            if args.shadow_cmd == "start":
+                try:
+                    if args.file == "-":
+                        patch = json.load(sys.stdin)
+                    else:
+                        with open(args.file, "r") as f:
+                            patch = json.load(f)
+                except (OSError, json.JSONDecodeError) as e:
+                    raise ValueError(f"unable to read {args.file}: {e}")
+                body = {"settings": patch}
+                if args.engine:
+                    body["engine"] = args.engine
+                resp = client.post("/shadow", json=body)
+            elif args.shadow_cmd == "stop":
+                resp = client.delete("/shadow")
+            else:
+                resp = client.get("/shadow", params={"ticks": args.ticks})
+            raise_for_daemon_error(resp)
+    except httpx.ConnectError:
+        print("Error: Service is not running. Start it first with: llcw start")
+        sys.exit(1)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.json:
+        try:
+            print(resp.text, flush=True)
+        except BrokenPipeError:
+            drop_stdout()
+        return
+    status = ShadowStatus(**resp.json())
+    if args.shadow_cmd == "start":
+        print("Shadow engine started; see how it compares with: llcw shadow")
+        return
+    show_shadow(status)
+
+
 def run_uninstall():
     confirm = input("Confirm? (y/N): ").lower()
     if confirm != "y":
@@ -350,7 +964,31 @@ def generate_parser():
         "update", help=f"check and update {APP_ALIAS} to latest version"
     )
 
-    subparsers.add_parser("status", help=f"show systemd service status")
+    subparsers.add_parser("status", help=f"show systemd service status").add_argument(
+        "--json",
+        action="store_true",
+        help="print the daemon's current fan status as one line of JSON instead",
+    )
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="print each new fan status as it is published"
+    )
+    watch_parser.add_argument(
+        "--ndjson",
+        action="store_true",
+        help="one line of JSON per status, for jq, log shippers and widgets",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0,
+        help="at least this many seconds between lines (default: every update)",
+    )
+    watch_parser.add_argument(
+        "--on-change",
+        action="store_true",
+        help="skip statuses where only the timestamp changed",
+    )
 
     subparsers.add_parser("enable", help=f"enable {APP_ALIAS} service and start it")
 
@@ -365,16 +1003,225 @@ def generate_parser():
     subparsers.add_parser(
         "monitor",
         help="show live fan monitor (Default to it if no command is provided)",
+    ).add_argument(
+        "--shm",
+        action="store_true",
+        help="read status from the daemon's shared memory instead of its socket",
     )
 
     subparsers.add_parser("uninstall", help=f"stop, disable and remove {APP_ALIAS}")
 
+    simulate_parser = subparsers.add_parser(
+        "simulate",
+        help="replay a recorded temperature trace through candidate curves (needs numpy)",
+    )
+    simulate_parser.add_argument(
+        "trace",
+        help="CSV (timestamp,cpu_temp,gpu_temp), NDJSON of /status or an LLCW_CAPTURE trace",
+    )
+    simulate_parser.add_argument(
+        "--linear",
+        action="append",
+        help="linear candidate 'minT:minP,maxT:maxP' (repeatable)",
+    )
+    simulate_parser.add_argument(
+        "--curve",
+        action="append",
+        help=f"curve candidate 'temp:percent,...' with 2-{FAN_CURVE_MAX_POINTS} points (repeatable)",
+    )
+    simulate_parser.add_argument(
+        "--source",
+        choices=["cpu", "gpu", "mix"],
+        default="cpu",
+        help="temperature the candidates follow (default: cpu)",
+    )
+    simulate_parser.add_argument(
+        "--above",
+        type=float,
+        default=70,
+        help="report the share of time above this PWM percentage (default: 70)",
+    )
+    simulate_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="seconds between samples when the trace has no timestamps (default: 0.5)",
+    )
+    simulate_parser.add_argument(
+        "--output", help="write the PWM timeline of each candidate to this CSV file"
+    )
+
+    tune_parser = subparsers.add_parser(
+        "tune",
+        help="search for the curve with the lowest duty that holds a temperature limit (needs numpy)",
+    )
+    tune_parser.add_argument(
+        "trace",
+        help="CSV (timestamp,cpu_temp,gpu_temp,pwm), NDJSON of /status or an LLCW_CAPTURE trace",
+    )
+    tune_parser.add_argument(
+        "--max-temp",
+        type=float,
+        default=80,
+        help="highest simulated temperature allowed, in °C (default: 80)",
+    )
+    tune_parser.add_argument(
+        "--source",
+        choices=["cpu", "gpu"],
+        default="cpu",
+        help="tune the CPU or the GPU curve (default: cpu)",
+    )
+    tune_parser.add_argument(
+        "--population", type=int, default=48, help="curves per generation (default: 48)"
+    )
+    tune_parser.add_argument(
+        "--generations", type=int, default=40, help="generations to run (default: 40)"
+    )
+    tune_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help="worker processes (default: one per CPU)",
+    )
+    tune_parser.add_argument(
+        "--time-constant",
+        type=float,
+        help="thermal time constant in seconds, instead of the fitted one",
+    )
+    tune_parser.add_argument(
+        "--fan-effect",
+        type=float,
+        help="steady-state °C change from 0%% to 100%% fan duty (negative), "
+        "instead of the fitted one",
+    )
+    tune_parser.add_argument(
+        "--seed", type=int, help="random seed, for repeatable runs"
+    )
+    tune_parser.add_argument(
+        "--top", type=int, default=3, help="best curves to list (default: 3)"
+    )
+    tune_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        help="seconds between samples when the trace has no timestamps (default: 0.5)",
+    )
+    tune_parser.add_argument(
+        "--output", help="write the best curve as a settings JSON file"
+    )
+
+    calibrate_parser = subparsers.add_parser(
+        "calibrate",
+        help="measure the RPM of fans across their PWM range for rpm mode (requires running service)",
+    )
+    calibrate_parser.add_argument(
+        "fans",
+        nargs="?",
+        help="comma-separated fan IDs from monitor (default: all fans)",
+    )
+
+    fleet_parser = subparsers.add_parser(
+        "fleet", help="show the status of many daemons side by side"
+    )
+    fleet_parser.add_argument(
+        "endpoints",
+        nargs="*",
+        help="[name=]target: a socket path (e.g. a forwarded one), "
+        "tcp://[token@]host:port or host:port",
+    )
+    fleet_parser.add_argument(
+        "--file", "-f", help="file with one endpoint per line ('#' comments)"
+    )
+    fleet_parser.add_argument(
+        "--token",
+        help="API token for TCP endpoints without their own (default: $LLCW_API_TOKEN)",
+    )
+    fleet_parser.add_argument(
+        "--interval", type=float, default=2.0, help="seconds between polls (default: 2)"
+    )
+    fleet_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="poll once and exit, with status 1 when a daemon is not ok",
+    )
+    fleet_parser.add_argument(
+        "--sort",
+        default="host",
+        choices=[
+            "host",
+            "state",
+            "cpu",
+            "gpu",
+            "pwm",
+            "rpm",
+            "alerts",
+            "latency",
+            "age",
+        ],
+        help="column to sort hosts by (default: host)",
+    )
+    fleet_parser.add_argument(
+        "--reverse", action="store_true", help="sort in descending order"
+    )
+    fleet_parser.add_argument(
+        "--fans", action="store_true", help="also list every fan group"
+    )
+    fleet_parser.add_argument(
+        "--output",
+        help="write each poll to this file: .json, .ndjson (full statuses) or .csv (table)",
+    )
+    fleet_parser.add_argument(
+        "--timeout", type=float, default=2.0, help="per-daemon timeout in seconds"
+    )
+    fleet_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=32,
+        help="most daemons polled at the same time (default: 32)",
+    )
+
+    shadow_parser = subparsers.add_parser(
+        "shadow",
+        help="compare other settings with the live ones without driving the fans (requires running service)",
+    )
+    shadow_parser.add_argument(
+        "--json", action="store_true", help="print the daemon's report as JSON"
+    )
+    shadow_parser.add_argument(
+        "--ticks",
+        type=int,
+        default=10,
+        help="recent ticks to list with their differences (default: 10)",
+    )
+    shadow_sub = shadow_parser.add_subparsers(dest="shadow_cmd")
+    shadow_start = shadow_sub.add_parser(
+        "start", help="run settings changes from a JSON file next to the live engine"
+    )
+    shadow_start.add_argument(
+        "file", help="settings JSON file with the changes to try, or - for stdin"
+    )
+    shadow_start.add_argument(
+        "--engine",
+        choices=["python", "numpy"],
+        help="target engine of the shadow (default: the daemon's)",
+    )
+    shadow_sub.add_parser("stop", help="stop the shadow engine and show its report")
+
     settings_parser = subparsers.add_parser("settings", help="Manage settings")
     settings_sub = settings_parser.add_subparsers(dest="settings_cmd")
     settings_sub.add_parser("set-mode", help="set control mode").add_argument(
         "mode", choices=[m.value for m in FanMode], help="control mode"
     )
     settings_sub.add_parser("reset", help="reset the settings")
+    apply_parser = settings_sub.add_parser(
+        "apply", help="validate and apply a full or partial settings JSON document"
+    )
+    apply_parser.add_argument("file", help="path to a JSON file, or '-' for stdin")
+    apply_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="show the resulting changes without applying them",
+    )
 
     linear_parser = settings_sub.add_parser("linear", help="Linear mode settings")
     linear_sub = linear_parser.add_subparsers(dest="linear_cmd")
@@ -404,6 +1251,91 @@ def generate_parser():
     gpu_curve_set.add_argument(
         "curve", help="format: 'temp:percent,temp:percent,temp:percent,temp:percent'"
     )
+    fan_curve_parser = settings_sub.add_parser(
+        "fan-curve", help="per-fan curves used in curve mode"
+    )
+    fan_curve_sub = fan_curve_parser.add_subparsers(dest="fan_curve_cmd")
+    fan_curve_set = fan_curve_sub.add_parser(
+        "set", help="give fan(s) a curve of their own"
+    )
+    fan_curve_set.add_argument(
+        "fans", help="comma-separated fan IDs from monitor, or MAC addresses"
+    )
+    fan_curve_set.add_argument(
+        "curve",
+        help=f"format: 'temp:percent,temp:percent,...' with 2-{FAN_CURVE_MAX_POINTS} points",
+    )
+    fan_curve_set.add_argument(
+        "--source",
+        default="cpu",
+        help="temperature the curve follows: cpu, gpu, mix or a named source (default: cpu)",
+    )
+    fan_curve_clear = fan_curve_sub.add_parser(
+        "clear", help="return fan(s) to their group curve"
+    )
+    fan_curve_clear.add_argument(
+        "fans",
+        nargs="?",
+        default="all",
+        help="comma-separated fan IDs or MAC addresses, or 'all' (default: all)",
+    )
+
+    source_parser = settings_sub.add_parser(
+        "source", help="named temperature sources defined by expressions"
+    )
+    source_sub = source_parser.add_subparsers(dest="source_cmd")
+    source_set = source_sub.add_parser("set", help="define or replace a named source")
+    source_set.add_argument("name", help="source name, e.g. 'coolant'")
+    source_set.add_argument(
+        "expression",
+        help="e.g. 'max(cpu, gpu)', '0.7*cpu + 0.3*gpu', 'ema(cpu, 10)', "
+        '\'sensor("nvme", "Composite")\'',
+    )
+    source_sub.add_parser("remove", help="remove a named source").add_argument(
+        "name", help="source name"
+    )
+
+    pid_parser = settings_sub.add_parser("pid", help="PID mode settings")
+    pid_sub = pid_parser.add_subparsers(dest="pid_cmd")
+
+    pid_sub.add_parser("reset", help="reset PID controller settings")
+    pid_set = pid_sub.add_parser("set", help="set PID controller parameters")
+    pid_set.add_argument(
+        "values",
+        nargs="+",
+        help=f"key=value pairs, keys: {', '.join(PidMode.model_fields)}",
+    )
+
+    rpm_parser = settings_sub.add_parser("rpm", help="RPM mode settings")
+    rpm_sub = rpm_parser.add_subparsers(dest="rpm_cmd")
+
+    rpm_sub.add_parser("reset", help="reset RPM curves and controller settings")
+    cpu_rpm_set = rpm_sub.add_parser("set-cpu-curve", help="set CPU RPM curve")
+    cpu_rpm_set.add_argument(
+        "curve",
+        help=f"format: 'temp:rpm,temp:rpm,...' with 2-{FAN_CURVE_MAX_POINTS} points",
+    )
+    gpu_rpm_set = rpm_sub.add_parser("set-gpu-curve", help="set GPU RPM curve")
+    gpu_rpm_set.add_argument(
+        "curve",
+        help=f"format: 'temp:rpm,temp:rpm,...' with 2-{FAN_CURVE_MAX_POINTS} points",
+    )
+    rpm_set = rpm_sub.add_parser("set", help="set RPM controller parameters")
+    rpm_set.add_argument(
+        "values",
+        nargs="+",
+        help="key=value pairs, keys: correction_gain, max_correction, tolerance",
+    )
+    rpm_clear = rpm_sub.add_parser(
+        "clear-calibration", help="forget the calibration of fan(s)"
+    )
+    rpm_clear.add_argument(
+        "fans",
+        nargs="?",
+        default="all",
+        help="comma-separated fan IDs or MAC addresses, or 'all' (default: all)",
+    )
+
     set_source_parser = settings_sub.add_parser(
         "set-source",
         help="assign fan(s) to a temperature source group (requires running service)",
@@ -452,7 +1384,9 @@ if __name__ == "__main__":
             sys.exit(0)
 
         is_monitor = args.command == "monitor" or args.command is None
-        remoteVer = check_latest_version()
+        # Machine-readable output must stay clean and start fast.
+        is_machine = args.command == "watch" or getattr(args, "json", False)
+        remoteVer = None if is_machine else check_latest_version()
         if (
             remoteVer
             and remoteVer.outdated
@@ -463,15 +1397,30 @@ if __name__ == "__main__":
             printOutdated(remoteVer.data, is_monitor)
 
         if is_monitor:
-            run_monitor()
+            run_monitor(getattr(args, "shm", False))
         elif args.command == "uninstall":
             run_uninstall()
+        elif args.command == "simulate":
+            run_simulate(args)
+        elif args.command == "tune":
+            run_tune(args)
+        elif args.command == "fleet":
+            run_fleet(args)
+        elif args.command == "calibrate":
+            run_calibrate(args.fans)
+        elif args.command == "shadow":
+            run_shadow(args)
         elif args.command == "info":
             run_info(remoteVer)
         elif args.command == "update":
             run_update(remoteVer)
         elif args.command == "status":
-            run_systemctl("status")
+            if args.json:
+                run_status_json()
+            else:
+                run_systemctl("status")
+        elif args.command == "watch":
+            run_watch(args.ndjson, args.interval, args.on_change)
         elif args.command == "enable":
             run_systemctl("enable")
         elif args.command == "disable":
@@ -483,88 +1432,156 @@ if __name__ == "__main__":
         elif args.command == "restart":
             run_systemctl("restart")
         elif args.command == "settings":
-            settings = load_settings()
+            settings = get_settings()
 
             if args.settings_cmd == "set-mode":
-                settings.mode = args.mode
-                save_settings(settings)
-                reload_service_settings()
+                update_settings({"mode": args.mode})
                 print(f"Mode updated to {args.mode}")
             elif args.settings_cmd == "reset":
-                save_settings(Settings())
-                reload_service_settings()
+                update_settings({}, replace=True)
                 print(f"Finished reset")
+            elif args.settings_cmd == "apply":
+                run_apply(args.file, args.dry_run)
             elif args.settings_cmd == "linear":
                 if args.linear_cmd == "set-curve":
                     try:
                         new_curve = parse_curve_input(args.curve)
-                        settings.linear = new_curve
-                        save_settings(settings)
-                        reload_service_settings()
+                        update_settings({"linear": new_curve.model_dump()})
                         print("CPU linear curve updated successfully.")
                     except Exception as e:
                         print(f"Error: {e}")
                 elif args.linear_cmd == "set-gpu-curve":
                     try:
                         new_curve = parse_curve_input(args.curve)
-                        settings.gpu_linear = new_curve
-                        save_settings(settings)
-                        reload_service_settings()
+                        update_settings({"gpu_linear": new_curve.model_dump()})
                         print("GPU linear curve updated successfully.")
                     except Exception as e:
                         print(f"Error: {e}")
                 elif args.linear_cmd == "reset":
-                    settings.linear = LinearMode()
-                    save_settings(settings)
-                    reload_service_settings()
+                    update_settings({"linear": LinearMode().model_dump()})
                     print("Finished reset CPU linear curve")
                 elif args.linear_cmd == "reset-gpu-curve":
-                    settings.gpu_linear = default_gpu_linear()
-                    save_settings(settings)
-                    reload_service_settings()
+                    update_settings({"gpu_linear": default_gpu_linear().model_dump()})
                     print("Finished reset GPU linear curve")
                 else:
                     show_linear_settings(settings)
             elif args.settings_cmd == "curve":
                 if args.curve_cmd == "set-cpu-curve":
                     try:
-                        settings.cpu_curve = parse_four_point_curve_input(args.curve)
-                        save_settings(settings)
-                        reload_service_settings()
+                        curve = parse_four_point_curve_input(args.curve)
+                        update_settings({"cpu_curve": curve.model_dump()})
                         print("CPU curve updated successfully.")
                     except Exception as e:
                         print(f"Error: {e}")
                 elif args.curve_cmd == "set-gpu-curve":
                     try:
-                        settings.gpu_curve = parse_four_point_curve_input(args.curve)
-                        save_settings(settings)
-                        reload_service_settings()
+                        curve = parse_four_point_curve_input(args.curve)
+                        update_settings({"gpu_curve": curve.model_dump()})
                         print("GPU curve updated successfully.")
                     except Exception as e:
                         print(f"Error: {e}")
                 elif args.curve_cmd == "reset":
-                    settings.cpu_curve = default_cpu_curve()
-                    settings.gpu_curve = default_gpu_curve()
-                    save_settings(settings)
-                    reload_service_settings()
+                    update_settings(
+                        {
+                            "cpu_curve": default_cpu_curve().model_dump(),
+                            "gpu_curve": default_gpu_curve().model_dump(),
+                        }
+                    )
                     print("Finished reset curve mode settings")
                 else:
                     show_curve_settings(settings)
+            elif args.settings_cmd == "fan-curve":
+                try:
+                    if args.fan_curve_cmd == "set":
+                        curve = parse_fan_curve_input(args.curve, args.source)
+                        macs = resolve_fans(args.fans)
+                        update_settings(
+                            {"fan_curves": {mac: curve.model_dump() for mac in macs}}
+                        )
+                        print(f"Curve set for fan(s) {args.fans}.")
+                    elif args.fan_curve_cmd == "clear":
+                        if args.fans.strip().lower() == "all":
+                            macs = list(settings.fan_curves)
+                        else:
+                            macs = resolve_fans(args.fans)
+                        update_settings({"fan_curves": {mac: None for mac in macs}})
+                        print("Fan curve(s) cleared.")
+                    else:
+                        show_fan_curve_settings(settings)
+                except httpx.ConnectError:
+                    print(
+                        "Error: Service is not running. Start it first with: llcw start"
+                    )
+                except Exception as e:
+                    print(f"Error: {e}")
+            elif args.settings_cmd == "source":
+                try:
+                    if args.source_cmd == "set":
+                        update_settings({"sources": {args.name: args.expression}})
+                        print(f"Source '{args.name}' updated successfully.")
+                    elif args.source_cmd == "remove":
+                        if args.name not in settings.sources:
+                            raise ValueError(f"No source named '{args.name}'")
+                        update_settings({"sources": {args.name: None}})
+                        print(f"Source '{args.name}' removed.")
+                    else:
+                        show_source_settings(settings)
+                except Exception as e:
+                    print(f"Error: {e}")
+            elif args.settings_cmd == "pid":
+                if args.pid_cmd == "set":
+                    try:
+                        pid = parse_pid_input(args.values, settings.pid)
+                        keys = {
+                            v.partition("=")[0].strip().lower() for v in args.values
+                        }
+                        update_settings({"pid": pid.model_dump(include=keys)})
+                        print("PID settings updated successfully.")
+                    except Exception as e:
+                        print(f"Error: {e}")
+                elif args.pid_cmd == "reset":
+                    update_settings({"pid": PidMode().model_dump()})
+                    print("Finished reset PID mode settings")
+                else:
+                    show_pid_settings(settings)
+            elif args.settings_cmd == "rpm":
+                try:
+                    if args.rpm_cmd == "set-cpu-curve":
+                        points = parse_rpm_curve_input(args.curve)
+                        update_settings(
+                            {"rpm": {"cpu_curve": [p.model_dump() for p in points]}}
+                        )
+                        print("CPU RPM curve updated successfully.")
+                    elif args.rpm_cmd == "set-gpu-curve":
+                        points = parse_rpm_curve_input(args.curve)
+                        update_settings(
+                            {"rpm": {"gpu_curve": [p.model_dump() for p in points]}}
+                        )
+                        print("GPU RPM curve updated successfully.")
+                    elif args.rpm_cmd == "set":
+                        update_settings({"rpm": parse_rpm_values(args.values)})
+                        print("RPM settings updated successfully.")
+                    elif args.rpm_cmd == "reset":
+                        update_settings({"rpm": RpmMode().model_dump()})
+                        print("Finished reset RPM mode settings")
+                    elif args.rpm_cmd == "clear-calibration":
+                        if args.fans.strip().lower() == "all":
+                            macs = list(settings.calibrations)
+                        else:
+                            macs = resolve_fans(args.fans)
+                        update_settings({"calibrations": {mac: None for mac in macs}})
+                        print("Calibration(s) cleared.")
+                    else:
+                        show_rpm_settings(settings)
+                except httpx.ConnectError:
+                    print(
+                        "Error: Service is not running. Start it first with: llcw start"
+                    )
+                except Exception as e:
+                    print(f"Error: {e}")
             elif args.settings_cmd == "set-source":
                 try:
-                    state = fetch_state()
-                    fan_macs = resolve_fan_ids(args.fan_ids, state.fans)
-                    for mac in fan_macs:
-                        if mac in settings.gpu_macs:
-                            settings.gpu_macs.remove(mac)
-                        if mac in settings.mix_macs:
-                            settings.mix_macs.remove(mac)
-                        if args.group == "gpu":
-                            settings.gpu_macs.append(mac)
-                        elif args.group == "mix":
-                            settings.mix_macs.append(mac)
-                    save_settings(settings)
-                    reload_service_settings()
+                    assign_sources(args.fan_ids, args.group)
                     print(f"Fan(s) {args.fan_ids} assigned to {args.group} group.")
                 except httpx.ConnectError:
                     print(
@@ -575,18 +1592,9 @@ if __name__ == "__main__":
             elif args.settings_cmd == "clear-sources":
                 try:
                     if args.fan_ids.strip().lower() == "all":
-                        settings.gpu_macs = []
-                        settings.mix_macs = []
+                        update_settings({"gpu_macs": [], "mix_macs": []})
                     else:
-                        state = fetch_state()
-                        fan_macs = resolve_fan_ids(args.fan_ids, state.fans)
-                        for mac in fan_macs:
-                            if mac in settings.gpu_macs:
-                                settings.gpu_macs.remove(mac)
-                            if mac in settings.mix_macs:
-                                settings.mix_macs.remove(mac)
-                    save_settings(settings)
-                    reload_service_settings()
+                        assign_sources(args.fan_ids, "cpu")
                     print("Fan source(s) reset to CPU.")
                 except httpx.ConnectError:
                     print(
@@ -0,0 +1,92 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Tuple
+
+from models import CurvePoint, RpmPoint, Settings
+from sources import SourceGraph
+
+
+class CompiledCurve:
+    """A temperature curve precomputed for O(log n) lookups.
+
+    Temperatures are kept in a sorted list searched with ``bisect``; each
+    segment's width and rise are computed once, so evaluating a 32-point
+    curve costs one binary search and one interpolation.
+    """
+
+    __slots__ = ("temps", "percents", "spans", "rises", "low_pwm", "high_pwm")
+
+    def __init__(self, points: List[CurvePoint]):
+        self.temps = [p.temp_c for p in points]
+        self.percents = [p.percent for p in points]
+        self.spans = [b - a for a, b in zip(self.temps, self.temps[1:])]
+        self.rises = [b - a for a, b in zip(self.percents, self.percents[1:])]
+        self.low_pwm = percent_to_pwm(self.percents[0])
+        self.high_pwm = percent_to_pwm(self.percents[-1])
+
+    def __call__(self, temp: float) -> int:
+        temps = self.temps
+        if temp <= temps[0]:
+            return self.low_pwm
+        if temp >= temps[-1]:
+            return self.high_pwm
+        i = bisect_left(temps, temp) - 1
+        ratio = (temp - temps[i]) / self.spans[i]
+        return percent_to_pwm(self.percents[i] + ratio * self.rises[i])
+
+
+class CompiledRpmCurve:
+    """Temperature to target RPM, interpolated like ``CompiledCurve``."""
+
+    __slots__ = ("temps", "rpms")
+
+    def __init__(self, points: List[RpmPoint]):
+        self.temps = [p.temp_c for p in points]
+        self.rpms = [p.rpm for p in points]
+
+    def __call__(self, temp: float) -> float:
+        temps = self.temps
+        if temp <= temps[0]:
+            return self.rpms[0]
+        if temp >= temps[-1]:
+            return self.rpms[-1]
+        i = bisect_left(temps, temp) - 1
+        ratio = (temp - temps[i]) / (temps[i + 1] - temps[i])
+        return self.rpms[i] + ratio * (self.rpms[i + 1] - self.rpms[i])
+
+
+def percent_to_pwm(percent: float) -> int:
+    return int(round(max(0, min(100, percent)) / 100 * 255))
+
+
+SOURCE_INPUTS = {"cpu": {"cpu"}, "gpu": {"gpu"}, "mix": {"cpu", "gpu"}}
+
+
+class CurveSet:
+    """The compiled curves and named sources of one ``Settings`` object.
+
+    ``fans`` maps a MAC to ``(source, curve, inputs)``, where ``inputs`` are
+    the raw readings (cpu, gpu, sensor) the source depends on. Pass the
+    ``previous`` set to keep the smoothed source values across a settings
+    change.
+    """
+
+    def __init__(self, settings: Settings, previous: Optional["CurveSet"] = None):
+        self.settings = settings
+        self.cpu = CompiledCurve(settings.cpu_curve.points)
+        self.gpu = CompiledCurve(settings.gpu_curve.points)
+        self.cpu_rpm = CompiledRpmCurve(settings.rpm.cpu_curve)
+        self.gpu_rpm = CompiledRpmCurve(settings.rpm.gpu_curve)
+        self.graph = SourceGraph(settings.sources)
+        if previous is not None:
+            self.graph.carry_state(previous.graph)
+        self.fans: Dict[str, Tuple[str, CompiledCurve, Set[str]]] = {}
+        for mac, fan_curve in settings.fan_curves.items():
+            source = fan_curve.source
+            inputs = SOURCE_INPUTS.get(source) or self.graph.source_inputs(source)
+            self.fans[mac] = (source, CompiledCurve(fan_curve.points), inputs)
+        used = set().union(*(inputs for _, _, inputs in self.fans.values()))
+        self.needs_gpu = "gpu" in used
+        self.needs_sensors = "sensor" in used
+        self.needs_sources = any(
+            source not in SOURCE_INPUTS for source, _, _ in self.fans.values()
+        )
@@ -0,0 +1,319 @@
+import math
+import os
+import random
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+import usb.core
+
+# ==============================
+# PROTOCOL CONSTANTS
+# ==============================
+TX = 0x8040
+RX = 0x8041
+
+GET_DEV_CMD = 0x10
+RF_PAGE_STRIDE = 434
+RECORD_SIZE = 42
+RECORD_MARKER = 28
+RECORDS_PER_PAGE = 10
+MAX_RECORDS = 255
+
+# ==============================
+# FAN MODEL
+# ==============================
+STALL_RATIO = 0.08
+SPIN_UP_TAU = 1.2
+SPIN_DOWN_TAU = 2.5
+RPM_NOISE = 0.01
+WEAR_FACTOR = 0.6
+DROPOUT_SECONDS = 10.0
+FAN_FAULTS = ("stall", "wear", "drop")
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+class EmulatorConfig:
+    def __init__(
+        self,
+        fans: int = 4,
+        latency_ms: float = 1.0,
+        jitter_ms: float = 0.5,
+        short_read_rate: float = 0.0,
+        timeout_rate: float = 0.0,
+        disconnect_rate: float = 0.0,
+        disconnect_seconds: float = 3.0,
+        seed: Optional[int] = None,
+        fan_faults: Optional[List[Tuple[str, int, float]]] = None,
+    ):
+        self.fans = max(0, min(MAX_RECORDS, fans))
+        self.fan_faults = fan_faults or []
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.short_read_rate = short_read_rate
+        self.timeout_rate = timeout_rate
+        self.disconnect_rate = disconnect_rate
+        self.disconnect_seconds = disconnect_seconds
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "EmulatorConfig":
+        seed = os.getenv("LLCW_EMU_SEED")
+        return cls(
+            fans=int(env_float("LLCW_EMU_FANS", 4)),
+            latency_ms=env_float("LLCW_EMU_LATENCY_MS", 1.0),
+            jitter_ms=env_float("LLCW_EMU_JITTER_MS", 0.5),
+            short_read_rate=env_float("LLCW_EMU_SHORT_READ_RATE", 0.0),
+            timeout_rate=env_float("LLCW_EMU_TIMEOUT_RATE", 0.0),
+            disconnect_rate=env_float("LLCW_EMU_DISCONNECT_RATE", 0.0),
+            disconnect_seconds=env_float("LLCW_EMU_DISCONNECT_SECONDS", 3.0),
+            seed=int(seed) if seed and seed.isdigit() else None,
+            fan_faults=parse_fan_faults(os.getenv("LLCW_EMU_FAN_FAULTS", "")),
+        )
+
+
+def parse_fan_faults(raw: str) -> List[Tuple[str, int, float]]:
+    """Parse ``kind@fan:seconds`` items, e.g. ``stall@0:20,drop@2:30``.
+
+    ``stall`` seizes the first fan of the group, ``wear`` makes every fan of
+    the group run slower and rougher, ``drop`` hides the group from the
+    records for ``DROPOUT_SECONDS``. Times count from the emulator start.
+    """
+    faults = []
+    for item in filter(None, (i.strip() for i in raw.split(","))):
+        try:
+            kind, rest = item.split("@", 1)
+            index, seconds = rest.split(":", 1)
+            if kind not in FAN_FAULTS:
+                raise ValueError
+            faults.append((kind, int(index), float(seconds)))
+        except ValueError:
+            print(f"Ignoring emulated fan fault '{item}' (use kind@fan:seconds)")
+    return faults
+
+
+class EmulatedFan:
+    __slots__ = (
+        "mac",
+        "master_mac",
+        "channel",
+        "rx_type",
+        "fan_count",
+        "pwm",
+        "rpm",
+        "max_rpm",
+        "min_rpm",
+        "fault",
+        "fault_at",
+    )
+
+    def __init__(self, index: int, rng: random.Random):
+        self.mac = bytes([0x02, 0x4C, 0x4C, 0x57, (index >> 8) & 0xFF, index & 0xFF])
+        self.master_mac = bytes([0x06, 0x4C, 0x4C, 0x57, 0x00, 0x01])
+        self.channel = index % 40
+        self.rx_type = 1
+        self.fan_count = rng.choice([1, 2, 3, 4])
+        self.pwm = 0
+        self.max_rpm = [rng.uniform(1900, 2200) for _ in range(self.fan_count)]
+        self.min_rpm = [m * 0.2 for m in self.max_rpm]
+        self.rpm = [0.0] * self.fan_count
+        self.fault: Optional[str] = None
+        self.fault_at = 0.0
+
+    def faulty(self, kind: str, now: float) -> bool:
+        return self.fault == kind and now >= self.fault_at
+
+    def target_rpm(self, slot: int, now: float) -> float:
+        ratio = self.pwm / 255
+        if ratio < STALL_RATIO or (slot == 0 and self.faulty("stall", now)):
+            return 0.0
+        lo = self.min_rpm[slot]
+        rpm = lo + (self.max_rpm[slot] - lo) * ratio
+        return rpm * WEAR_FACTOR if self.faulty("wear", now) else rpm
+
+    def reporting(self, now: float) -> bool:
+        return not (self.faulty("drop", now) and now < self.fault_at + DROPOUT_SECONDS)
+
+    def advance(self, dt: float, now: float):
+        for slot in range(self.fan_count):
+            target = self.target_rpm(slot, now)
+            tau = SPIN_UP_TAU if target > self.rpm[slot] else SPIN_DOWN_TAU
+            self.rpm[slot] += (target - self.rpm[slot]) * (1 - math.exp(-dt / tau))
+            if self.rpm[slot] < 1:
+                self.rpm[slot] = 0.0
+
+    def record(self, rng: random.Random, now: float) -> bytes:
+        record = bytearray(RECORD_SIZE)
+        record[0:6] = self.mac
+        record[6:12] = self.master_mac
+        record[12] = self.channel
+        record[13] = self.rx_type
+        record[19] = self.fan_count
+        for slot in range(self.fan_count):
+            rpm = self.rpm[slot]
+            if rpm:
+                noise = RPM_NOISE * (15 if self.faulty("wear", now) else 1)
+                rpm *= 1 + rng.uniform(-noise, noise)
+            value = max(0, min(0xFFFF, int(rpm)))
+            record[28 + slot * 2] = value >> 8
+            record[29 + slot * 2] = value & 0xFF
+        record[36:40] = bytes([self.pwm] * 4)
+        record[41] = RECORD_MARKER
+        return bytes(record)
+
+
+class EmulatedController:
+    """Shared state behind the emulated TX and RX dongles."""
+
+    def __init__(self, config: EmulatorConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.fans: List[EmulatedFan] = [
+            EmulatedFan(i, self.rng) for i in range(config.fans)
+        ]
+        self.by_mac: Dict[bytes, EmulatedFan] = {f.mac: f for f in self.fans}
+        self.lock = threading.Lock()
+        self.started = self.last_advance = time.monotonic()
+        for kind, index, seconds in config.fan_faults:
+            if 0 <= index < len(self.fans):
+                self.fans[index].fault = kind
+                self.fans[index].fault_at = seconds
+        self.offline_until = 0.0
+        self.frames_received = 0
+
+    def advance(self):
+        now = time.monotonic()
+        dt = now - self.last_advance
+        self.last_advance = now
+        for fan in self.fans:
+            fan.advance(dt, now - self.started)
+
+    def build_pages(self, page_count: int) -> bytes:
+        with self.lock:
+            self.advance()
+            now = time.monotonic() - self.started
+            fans = [f for f in self.fans if f.reporting(now)]
+            records = [f.record(self.rng, now) for f in fans]
+        pages = bytearray(RF_PAGE_STRIDE * max(1, page_count))
+        for page in range(max(1, page_count)):
+            start = page * RF_PAGE_STRIDE
+            chunk = records[page * RECORDS_PER_PAGE : (page + 1) * RECORDS_PER_PAGE]
+            body = bytes([GET_DEV_CMD, len(fans), 0, 0]) + b"".join(chunk)
+            pages[start : start + len(body)] = body
+        return bytes(pages)
+
+    def apply_frame(self, frame: bytes):
+        self.frames_received += 1
+        if len(frame) < 25 or frame[0] != 0x10 or frame[1] != 0:
+            return
+        with self.lock:
+            fan = self.by_mac.get(bytes(frame[6:12]))
+            if fan is not None:
+                self.advance()
+                fan.pwm = frame[21]
+
+    def inject_faults(self, reading: bool = False) -> bool:
+        """Sleep for the configured latency and raise injected transfer errors.
+
+        Returns True when the caller should answer with a short read.
+        """
+        cfg = self.config
+        delay = cfg.latency_ms + self.rng.uniform(0, cfg.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        now = time.monotonic()
+        if now < self.offline_until:
+            raise usb.core.USBError(
+                "No such device (it may have been disconnected)", errno=19
+            )
+        if cfg.disconnect_rate and self.rng.random() < cfg.disconnect_rate:
+            self.offline_until = now + cfg.disconnect_seconds
+            raise usb.core.USBError(
+                "No such device (it may have been disconnected)", errno=19
+            )
+        if cfg.timeout_rate and self.rng.random() < cfg.timeout_rate:
+            raise usb.core.USBTimeoutError("Operation timed out", errno=110)
+        return bool(
+            reading and cfg.short_read_rate and self.rng.random() < cfg.short_read_rate
+        )
+
+
+class EmulatedDevice:
+    """Implements the subset of ``usb.core.Device`` used by the daemon."""
+
+    def __init__(self, controller: EmulatedController, pid: int):
+        self.controller = controller
+        self.idVendor = 0x0416
+        self.idProduct = pid
+        self._pending = b""
+
+    def write(self, endpoint, data, timeout=None):
+        self.controller.inject_faults()
+        if self.idProduct == RX:
+            if data[0] == GET_DEV_CMD:
+                self._pending = self.controller.build_pages(data[1])
+        else:
+            self.controller.apply_frame(bytes(data))
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        short = self.controller.inject_faults(reading=True)
+        if not self._pending:
+            raise usb.core.USBTimeoutError("Operation timed out", errno=110)
+        n = size
+        if short:
+            n = self.controller.rng.randint(
+                1, max(1, min(size, len(self._pending)) - 1)
+            )
+        chunk = self._pending[:n]
+        self._pending = self._pending[n:]
+        return array("B", chunk)
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def detach_kernel_driver(self, interface):
+        pass
+
+
+def synthetic_temp(source: str) -> Optional[float]:
+    """Temperature override for boxes without usable sensors.
+
+    ``LLCW_EMU_<SOURCE>_TEMP`` is either a constant (``55``) or a ``low:high``
+    range that is swept as a sine wave with a 60s period.
+    """
+    raw = os.getenv(f"LLCW_EMU_{source.upper()}_TEMP")
+    if not raw:
+        return None
+    try:
+        if ":" in raw:
+            low, high = map(float, raw.split(":", 1))
+            phase = math.sin(time.monotonic() * 2 * math.pi / 60)
+            return round(low + (high - low) * (phase + 1) / 2, 1)
+        return float(raw)
+    except ValueError:
+        return None
+
+
+_controller: Optional[EmulatedController] = None
+
+
+def get_controller() -> EmulatedController:
+    global _controller
+    if _controller is None:
+        _controller = EmulatedController(EmulatorConfig.from_env())
+    return _controller
+
+
+def open_device(pid: int) -> EmulatedDevice:
+    controller = get_controller()
+    if time.monotonic() < controller.offline_until:
+        raise RuntimeError(f"Device {pid:04x} not found")
+    return EmulatedDevice(controller, pid)
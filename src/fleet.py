@@ -0,0 +1,374 @@
+import asyncio
+import csv
+import json
+import os
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+import httpx
+import statuscodec
+from models import SystemStatus
+from utils import parse_host_port
+
+STATUS_ACCEPT = f"{statuscodec.BINARY}, {statuscodec.JSON};q=0.5"
+# A daemon whose last status is older than this, by its own clock, is stale.
+STALE_AFTER = 10.0
+
+SORT_KEYS = {
+    "host": "host",
+    "state": "state",
+    "cpu": "cpu_temp",
+    "gpu": "gpu_temp",
+    "pwm": "pwm_avg",
+    "rpm": "rpm_max",
+    "alerts": "alerts",
+    "latency": "latency_ms",
+    "age": "age",
+}
+
+
+class Endpoint:
+    """One daemon: a Unix socket path (local or forwarded) or a TCP address."""
+
+    __slots__ = ("name", "uds", "host", "port", "token")
+
+    def __init__(
+        self,
+        name: str,
+        uds: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        token: Optional[str] = None,
+    ):
+        self.name = name
+        self.uds = uds
+        self.host = host
+        self.port = port
+        self.token = token
+
+    @property
+    def target(self) -> str:
+        if self.uds:
+            return f"unix:{self.uds}"
+        host = f"[{self.host}]" if ":" in self.host else self.host
+        return f"tcp://{host}:{self.port}"
+
+    def client(self, timeout: float) -> httpx.AsyncClient:
+        """A client holding at most one keep-alive connection to the daemon."""
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        headers = {"authorization": f"Bearer {self.token}"} if self.token else None
+        if self.uds:
+            transport = httpx.AsyncHTTPTransport(uds=self.uds, limits=limits)
+            base_url = "http://localhost"
+        else:
+            transport = httpx.AsyncHTTPTransport(limits=limits)
+            base_url = "http://" + self.target[len("tcp://") :]
+        return httpx.AsyncClient(
+            transport=transport, base_url=base_url, headers=headers, timeout=timeout
+        )
+
+
+def parse_endpoint(spec: str, token: Optional[str] = None) -> Endpoint:
+    """Parse ``[name=]target``.
+
+    The target is a socket path (``/path.sock`` or ``unix:/path.sock``),
+    ``tcp://[token@]host:port``, ``http://...`` or ``host:port``. ``token``
+    is used for TCP targets that do not carry their own.
+    """
+    spec = spec.strip()
+    name, sep, target = spec.partition("=")
+    if not sep or "/" in name or ":" in name:
+        name, target = "", spec
+    if target.startswith("unix:"):
+        target = target[len("unix:") :]
+        if target.startswith("//"):
+            target = target[2:]
+        uds = target
+    elif target.startswith(("/", ".", "~")) or target.endswith(".sock"):
+        uds = target
+    else:
+        uds = None
+
+    if uds is not None:
+        uds = os.path.expanduser(uds)
+        if not name:
+            base = os.path.basename(uds)
+            name = base[: -len(".sock")] if base.endswith(".sock") else base
+        return Endpoint(name, uds=uds)
+
+    if "://" in target:
+        url = urlsplit(target)
+        if url.scheme not in ("tcp", "http"):
+            raise ValueError(f"Unsupported endpoint scheme '{url.scheme}' in {spec}")
+        if url.port is None:
+            raise ValueError(f"Endpoint {spec} needs a port")
+        host, port = url.hostname, url.port
+        token = url.username or token
+    else:
+        host, port = parse_host_port(target)
+    return Endpoint(name or host, host=host, port=port, token=token)
+
+
+def load_endpoints(path: str, token: Optional[str] = None) -> List[Endpoint]:
+    """Endpoints from a file, one per line; blank lines and ``#`` comments skipped."""
+    endpoints = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                endpoints.append(parse_endpoint(line, token))
+    return endpoints
+
+
+class HostStatus:
+    """The result of polling one endpoint."""
+
+    __slots__ = ("endpoint", "status", "error", "latency", "fetched_at", "age")
+
+    def __init__(
+        self,
+        endpoint: Endpoint,
+        status: Optional[SystemStatus],
+        error: Optional[str],
+        latency: float,
+        fetched_at: float,
+        age: Optional[float] = None,
+    ):
+        self.endpoint = endpoint
+        self.status = status
+        self.error = error
+        self.latency = latency
+        self.fetched_at = fetched_at
+        # Seconds since the daemon took ``status``, as the daemon reported it;
+        # None if it did not say. Never compared with the local clock.
+        self.age = age
+
+    @property
+    def state(self) -> str:
+        if self.error is not None:
+            return "down"
+        if self.status is None:
+            return "starting"
+        if self.age is not None and self.age > STALE_AFTER:
+            return "stale"
+        return "ok"
+
+
+def parse_age(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class Fleet:
+    """Polls many daemons concurrently on one event loop.
+
+    Each endpoint keeps one keep-alive connection across polls and at most
+    ``concurrency`` requests are in flight at once, so a large fleet costs
+    neither a connection per poll nor a burst of sockets. A slow or dead
+    daemon only delays its own row, up to ``timeout``.
+    """
+
+    def __init__(
+        self, endpoints: List[Endpoint], timeout: float = 2.0, concurrency: int = 32
+    ):
+        self.endpoints = endpoints
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.clients: List[httpx.AsyncClient] = []
+        self.semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "Fleet":
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.clients = [e.client(self.timeout) for e in self.endpoints]
+        return self
+
+    async def __aexit__(self, *exc):
+        await asyncio.gather(*(c.aclose() for c in self.clients))
+        self.clients = []
+
+    async def fetch(self, endpoint: Endpoint, client: httpx.AsyncClient) -> HostStatus:
+        async with self.semaphore:
+            start = time.perf_counter()
+            status = error = age = None
+            try:
+                resp = await client.get("/status", headers={"accept": STATUS_ACCEPT})
+                if resp.status_code == 401:
+                    error = "unauthorized (check the API token)"
+                elif resp.status_code != 503:
+                    resp.raise_for_status()
+                    if resp.content.strip() != b"null":
+                        status = statuscodec.decode(
+                            resp.content, resp.headers.get("content-type")
+                        )
+                        age = parse_age(resp.headers.get(statuscodec.AGE_HEADER))
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            except ValueError as e:
+                error = f"bad status: {e}"
+            latency = time.perf_counter() - start
+        return HostStatus(endpoint, status, error, latency, time.time(), age)
+
+    async def poll(self) -> List[HostStatus]:
+        return await asyncio.gather(
+            *(self.fetch(e, c) for e, c in zip(self.endpoints, self.clients))
+        )
+
+
+def host_row(result: HostStatus) -> Dict[str, object]:
+    status = result.status
+    row: Dict[str, object] = {
+        "host": result.endpoint.name,
+        "endpoint": result.endpoint.target,
+        "state": result.state,
+        "cpu_temp": None,
+        "gpu_temp": None,
+        "groups": None,
+        "fans": None,
+        "pwm_avg": None,
+        "pwm_max": None,
+        "rpm_min": None,
+        "rpm_max": None,
+        "alerts": None,
+        "age": None,
+        "latency_ms": round(result.latency * 1000, 1),
+        "error": result.error,
+    }
+    if status is None:
+        return row
+    percents = [f.pwm * 100 / 255 for f in status.fans]
+    rpms = [r for f in status.fans for r in f.rpm[: f.fan_count] if r > 0]
+    row.update(
+        cpu_temp=status.cpu_temp,
+        gpu_temp=status.gpu_temp,
+        groups=len(status.fans),
+        fans=sum(f.fan_count for f in status.fans),
+        pwm_avg=round(sum(percents) / len(percents), 1) if percents else None,
+        pwm_max=round(max(percents), 1) if percents else None,
+        rpm_min=min(rpms) if rpms else None,
+        rpm_max=max(rpms) if rpms else None,
+        alerts=len(status.alerts),
+        age=None if result.age is None else round(result.age, 1),
+    )
+    return row
+
+
+def fan_rows(result: HostStatus) -> List[Dict[str, object]]:
+    if result.status is None:
+        return []
+    alerts: Dict[str, int] = {}
+    for a in result.status.alerts:
+        alerts[a.mac] = alerts.get(a.mac, 0) + 1
+    return [
+        {
+            "host": result.endpoint.name,
+            "mac": f.mac,
+            "fans": f.fan_count,
+            "pwm": round(f.pwm * 100 / 255, 1),
+            "target_pwm": round(f.target_pwm * 100 / 255, 1),
+            "rpm": " ".join(str(r) for r in f.rpm[: f.fan_count]),
+            "alerts": alerts.get(f.mac, 0),
+        }
+        for f in result.status.fans
+    ]
+
+
+def sort_rows(rows: List[Dict[str, object]], key: str, reverse: bool = False):
+    """Sort by a SORT_KEYS name; rows without a value go last either way."""
+    field = SORT_KEYS[key]
+    present = [r for r in rows if r.get(field) is not None]
+    missing = [r for r in rows if r.get(field) is None]
+    present.sort(key=lambda r: (r[field], r["host"]), reverse=reverse)
+    return present + missing
+
+
+def format_value(value, digits: int = 0) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.{digits}f}"
+    return str(value)
+
+
+def format_table(rows: List[Dict[str, object]]) -> List[str]:
+    width = max([4] + [len(str(r["host"])) for r in rows])
+    lines = [
+        f"{'HOST':{width}}  {'STATE':8} {'CPU':>5} {'GPU':>5} {'FANS':>5} "
+        f"{'PWM%':>5} {'MAX%':>5} {'RPM':>11} {'ALRT':>4} {'AGE':>5} {'MS':>6}",
+        "-" * (width + 72),
+    ]
+    for r in rows:
+        rpm = (
+            f"{r['rpm_min']}-{r['rpm_max']}"
+            if r["rpm_min"] is not None
+            else format_value(None)
+        )
+        line = (
+            f"{r['host']:{width}}  {r['state']:8} {format_value(r['cpu_temp'], 1):>5} "
+            f"{format_value(r['gpu_temp'], 1):>5} {format_value(r['fans']):>5} "
+            f"{format_value(r['pwm_avg']):>5} {format_value(r['pwm_max']):>5} "
+            f"{rpm:>11} {format_value(r['alerts']):>4} {format_value(r['age'], 1):>5} "
+            f"{format_value(r['latency_ms'], 1):>6}"
+        )
+        if r["error"]:
+            line += f"  {r['error']}"
+        lines.append(line)
+    return lines
+
+
+def format_fan_table(rows: List[Dict[str, object]]) -> List[str]:
+    width = max([4] + [len(str(r["host"])) for r in rows])
+    lines = [
+        f"{'HOST':{width}}  {'FAN ADDRESS':17} {'FANS':>4} {'PWM%':>5} "
+        f"{'TGT%':>5} {'ALRT':>4}  RPM",
+        "-" * (width + 60),
+    ]
+    for r in rows:
+        lines.append(
+            f"{r['host']:{width}}  {r['mac']:17} {r['fans']:>4} {r['pwm']:>5.0f} "
+            f"{r['target_pwm']:>5.0f} {r['alerts']:>4}  {r['rpm']}"
+        )
+    return lines
+
+
+def export(
+    path: str,
+    results: List[HostStatus],
+    rows: List[Dict[str, object]],
+    fans: Optional[List[Dict[str, object]]] = None,
+):
+    """Write one poll of the whole fleet, replacing ``path`` atomically.
+
+    ``.csv`` gets the table rows (the fan rows when given), ``.ndjson`` one
+    line per host with its full status, anything else a single JSON document.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            if path.endswith(".csv"):
+                if fans is not None:
+                    rows = fans
+                if rows:
+                    writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                    writer.writeheader()
+                    writer.writerows(rows)
+            else:
+                hosts = []
+                for result in results:
+                    status = result.status
+                    hosts.append(
+                        {
+                            **host_row(result),
+                            "status": status and status.model_dump(mode="json"),
+                        }
+                    )
+                if path.endswith(".ndjson"):
+                    for host in hosts:
+                        f.write(json.dumps(host, separators=(",", ":")) + "\n")
+                else:
+                    json.dump({"timestamp": time.time(), "hosts": hosts}, f, indent=1)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
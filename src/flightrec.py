@@ -0,0 +1,180 @@
+import json
+import os
+import struct
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+import usb.core
+
+# ==============================
+# RECORD LAYOUT
+# ==============================
+# time ns (monotonic) | latency µs | errno (0 = ok) | length | kind | device
+# | endpoint | first HEAD_BYTES bytes of the data
+RECORD = struct.Struct("<QIhHBBB16s")
+HEAD_BYTES = 16
+
+KIND_WRITE = 0
+KIND_READ = 1
+KIND_PAGE = 2
+KIND_NAMES = ("write", "read", "page")
+
+DEVICE_RX = 0
+DEVICE_TX = 1
+DEVICE_NAMES = ("rx", "tx")
+
+KEEP_DUMPS = 10
+
+
+class FlightRecorder:
+    """Keeps the last ``capacity`` USB transactions in one preallocated buffer.
+
+    Recording packs one fixed-size record in place; memory use never grows.
+    Only the control thread records; ``snapshot()`` may run on any thread and
+    returns only the records no write could have overwritten while copying.
+    """
+
+    def __init__(self, capacity: int, dump_dir: Path):
+        self.capacity = capacity
+        self.dump_dir = dump_dir
+        self.buf = bytearray(capacity * RECORD.size)
+        self.count = 0
+        self.pack_into = RECORD.pack_into
+        self.wall_at = time.time()
+        self.ns_at = time.perf_counter_ns()
+
+    def record(
+        self,
+        kind: int,
+        device: int,
+        endpoint: int,
+        data,
+        length: int,
+        started_ns: int,
+        error: int = 0,
+    ):
+        n = self.count
+        head = data[:HEAD_BYTES]
+        if not isinstance(head, (bytes, bytearray)):
+            head = bytes(head)  # pyusb reads return array('B')
+        latency = (time.perf_counter_ns() - started_ns) // 1000
+        self.pack_into(
+            self.buf,
+            (n % self.capacity) * RECORD.size,
+            started_ns,
+            latency if latency <= 0xFFFFFFFF else 0xFFFFFFFF,
+            error,
+            length if length <= 0xFFFF else 0xFFFF,
+            kind,
+            device,
+            endpoint,
+            head,
+        )
+        self.count = n + 1
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        first = self.count
+        buf = bytes(self.buf)
+        last = self.count
+        records = []
+        for n in range(max(0, last - self.capacity), first):
+            t_ns, latency, error, length, kind, device, endpoint, head = (
+                RECORD.unpack_from(buf, (n % self.capacity) * RECORD.size)
+            )
+            records.append(
+                {
+                    "time": self.wall_at + (t_ns - self.ns_at) / 1e9,
+                    "kind": KIND_NAMES[kind],
+                    "device": DEVICE_NAMES[device],
+                    "endpoint": f"0x{endpoint:02x}",
+                    "length": length,
+                    "head": head[: min(length, HEAD_BYTES)].hex(" "),
+                    "latency_us": latency,
+                    "error": os.strerror(error) if error else None,
+                    "errno": error or None,
+                }
+            )
+        return records
+
+    def dump(self, reason: str, detail: Optional[str] = None) -> Path:
+        """Write the recorded transactions to a JSON file and return its path."""
+        records = self.snapshot()
+        now = datetime.now()
+        os.makedirs(self.dump_dir, exist_ok=True)
+        path = self.dump_dir / f"flight-{now:%Y%m%d-%H%M%S-%f}-{reason}.json"
+        with open(path, "w") as f:
+            json.dump(
+                {
+                    "reason": reason,
+                    "detail": detail,
+                    "dumped_at": now.isoformat(timespec="milliseconds"),
+                    "recorded": self.count,
+                    "records": records,
+                },
+                f,
+                indent=1,
+            )
+        for old in sorted(self.dump_dir.glob("flight-*.json"))[:-KEEP_DUMPS]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+        return path
+
+
+class RecorderDevice:
+    """Wraps a TX/RX device and records every transfer in a FlightRecorder."""
+
+    def __init__(self, dev, recorder: FlightRecorder, device: int):
+        self.dev = dev
+        self.recorder = recorder
+        self.device = device
+
+    def write(self, endpoint, data, timeout=None):
+        started = time.perf_counter_ns()
+        try:
+            written = self.dev.write(endpoint, data, timeout)
+        except usb.core.USBError as e:
+            self.recorder.record(
+                KIND_WRITE,
+                self.device,
+                endpoint,
+                data,
+                len(data),
+                started,
+                e.errno or -1,
+            )
+            raise
+        self.recorder.record(
+            KIND_WRITE, self.device, endpoint, data, len(data), started
+        )
+        return written
+
+    def read(self, endpoint, size, timeout=None):
+        started = time.perf_counter_ns()
+        try:
+            data = self.dev.read(endpoint, size, timeout)
+        except usb.core.USBError as e:
+            self.recorder.record(
+                KIND_READ, self.device, endpoint, b"", 0, started, e.errno or -1
+            )
+            raise
+        self.recorder.record(KIND_READ, self.device, endpoint, data, len(data), started)
+        return data
+
+    def fetch_page(self, page_count: int, endpoint: int, wait: float):
+        """Page request of the libusb1 RX device; an empty reply was not ready yet."""
+        started = time.perf_counter_ns()
+        try:
+            data = self.dev.fetch_page(page_count, endpoint, wait)
+        except usb.core.USBError as e:
+            self.recorder.record(
+                KIND_PAGE, self.device, endpoint, b"", 0, started, e.errno or -1
+            )
+            raise
+        self.recorder.record(KIND_PAGE, self.device, endpoint, data, len(data), started)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
@@ -0,0 +1,265 @@
+import math
+import threading
+from collections import deque
+from typing import Collection, Deque, Dict, List, Optional, Tuple
+from models import Fan, FanAlert, FanEvent
+
+# ==============================
+# DETECTOR TUNING
+# ==============================
+RPM_SLOTS = 4
+STALL_MIN_PWM = int(round(20 / 100 * 255))
+STALL_TICKS = 6
+SETTLE_BAND = 8
+SETTLE_TICKS = 6
+BASELINE_ALPHA = 0.01
+FAST_ALPHA = 0.2
+WARMUP_SAMPLES = 60
+DEGRADED_DROP = 0.2
+ERRATIC_SPREAD = 0.1
+DROPOUT_SECONDS = 2.0
+FORGET_SECONDS = 600.0
+EVENT_LOG_SIZE = 256
+
+
+class SlotStats:
+    """Constant-size running statistics of one fan slot.
+
+    The baseline is an exponentially weighted linear fit of RPM against PWM
+    (weighted means of pwm, rpm, pwm^2 and pwm*rpm), so it follows the fan's
+    own curve without keeping any history. Each settled reading is compared
+    with the fit; the relative residual feeds a fast EWMA and its variance.
+    """
+
+    __slots__ = (
+        "n",
+        "pwm",
+        "rpm",
+        "pwm_sq",
+        "pwm_rpm",
+        "residual",
+        "spread",
+        "zero_ticks",
+    )
+
+    def __init__(self):
+        self.n = 0
+        self.pwm = 0.0
+        self.rpm = 0.0
+        self.pwm_sq = 0.0
+        self.pwm_rpm = 0.0
+        self.residual = 0.0
+        self.spread = 0.0
+        self.zero_ticks = 0
+
+    def expected(self, pwm: int) -> float:
+        var = self.pwm_sq - self.pwm * self.pwm
+        if var < 1.0:
+            return self.rpm
+        slope = (self.pwm_rpm - self.pwm * self.rpm) / var
+        return self.rpm + slope * (pwm - self.pwm)
+
+    def learn(self, pwm: int, rpm: int):
+        self.n += 1
+        a = max(BASELINE_ALPHA, 1 / self.n)
+        self.pwm += a * (pwm - self.pwm)
+        self.rpm += a * (rpm - self.rpm)
+        self.pwm_sq += a * (pwm * pwm - self.pwm_sq)
+        self.pwm_rpm += a * (pwm * rpm - self.pwm_rpm)
+
+    def observe(self, pwm: int, rpm: int) -> float:
+        expected = self.expected(pwm)
+        r = (rpm - expected) / expected if expected > 0 else 0.0
+        diff = r - self.residual
+        incr = FAST_ALPHA * diff
+        self.residual += incr
+        self.spread = (1 - FAST_ALPHA) * (self.spread + diff * incr)
+        return r
+
+
+class FanHealth:
+    __slots__ = ("slots", "anchor_pwm", "settled", "last_seen")
+
+    def __init__(self, now: float):
+        self.slots = [SlotStats() for _ in range(RPM_SLOTS)]
+        self.anchor_pwm = -1
+        self.settled = 0
+        self.last_seen = now
+
+
+class HealthMonitor:
+    """Flags stalled, degraded and missing fans from the readings of each tick.
+
+    ``update()`` costs the same on every tick whatever the uptime: a few
+    arithmetic updates per fan slot. Conditions are reported as alerts while
+    active, and as raise/clear events in a bounded log.
+    """
+
+    def __init__(self):
+        self.fans: Dict[str, FanHealth] = {}
+        self.active: Dict[Tuple[str, Optional[int], str], FanAlert] = {}
+        self.events: Deque[FanEvent] = deque(maxlen=EVENT_LOG_SIZE)
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    # ---------- alerts ----------
+    def raise_alert(
+        self, mac: str, slot: Optional[int], kind: str, detail: str, now: float
+    ):
+        key = (mac, slot, kind)
+        if key in self.active:
+            return
+        self.active[key] = FanAlert(
+            mac=mac, slot=slot, kind=kind, since=now, detail=detail
+        )
+        self.record(mac, slot, kind, True, detail, now)
+
+    def clear_alert(
+        self, mac: str, slot: Optional[int], kind: str, detail: str, now: float
+    ):
+        if self.active.pop((mac, slot, kind), None) is not None:
+            self.record(mac, slot, kind, False, detail, now)
+
+    def update_alert(
+        self,
+        mac: str,
+        slot: Optional[int],
+        kind: str,
+        raise_when: bool,
+        clear_when: bool,
+        raise_detail: str,
+        clear_detail: str,
+        now: float,
+    ):
+        """Raise or clear one alert with separate hysteresis thresholds.
+
+        Only ``clear_when`` is looked at while the alert is active, and only
+        ``raise_when`` while it is not, so readings between the two leave it
+        as it is.
+        """
+        if (mac, slot, kind) in self.active:
+            if clear_when:
+                self.clear_alert(mac, slot, kind, clear_detail, now)
+        elif raise_when:
+            self.raise_alert(mac, slot, kind, raise_detail, now)
+
+    def record(
+        self,
+        mac: str,
+        slot: Optional[int],
+        kind: str,
+        active: bool,
+        detail: str,
+        now: float,
+    ):
+        where = f"Fan {mac}" if slot is None else f"Fan {mac} slot {slot}"
+        print(f"{where}: {detail}")
+        with self.lock:
+            self.events.append(
+                FanEvent(
+                    id=self.next_id,
+                    timestamp=now,
+                    mac=mac,
+                    slot=slot,
+                    kind=kind,
+                    active=active,
+                    detail=detail,
+                )
+            )
+            self.next_id += 1
+
+    def alerts(self) -> List[FanAlert]:
+        return list(self.active.values())
+
+    def events_since(self, since: int = 0) -> List[FanEvent]:
+        with self.lock:
+            return [e for e in self.events if e.id > since]
+
+    # ---------- detection ----------
+    def update(self, fans: List[Fan], now: float, paused: Collection[str] = ()):
+        """Check one tick's readings; ``paused`` fans only count as seen."""
+        seen = set()
+        for f in fans:
+            seen.add(f.mac)
+            state = self.fans.get(f.mac)
+            if state is None:
+                state = self.fans[f.mac] = FanHealth(now)
+            elif now - state.last_seen > DROPOUT_SECONDS:
+                self.clear_alert(f.mac, None, "dropout", "reporting again", now)
+            state.last_seen = now
+            if f.mac.lower() in paused:
+                state.anchor_pwm = -1
+                continue
+            self.check_fan(f, state, now)
+
+        for mac, state in list(self.fans.items()):
+            if mac in seen:
+                continue
+            missing = now - state.last_seen
+            if missing > FORGET_SECONDS:
+                del self.fans[mac]
+                for key in [k for k in self.active if k[0] == mac]:
+                    self.clear_alert(mac, key[1], key[2], "no longer tracked", now)
+            elif missing > DROPOUT_SECONDS:
+                self.raise_alert(
+                    mac, None, "dropout", "missing from the wireless records", now
+                )
+
+    def check_fan(self, f: Fan, state: FanHealth, now: float):
+        pwm = f.pwm
+        if abs(pwm - state.anchor_pwm) > SETTLE_BAND:
+            state.anchor_pwm = pwm
+            state.settled = 0
+        else:
+            state.settled += 1
+        settled = state.settled >= SETTLE_TICKS
+
+        for slot in range(min(f.fan_count, RPM_SLOTS, len(f.rpm))):
+            rpm = f.rpm[slot]
+            stats = state.slots[slot]
+
+            stalled = rpm == 0 and pwm >= STALL_MIN_PWM
+            stats.zero_ticks = stats.zero_ticks + 1 if stalled else 0
+            self.update_alert(
+                f.mac,
+                slot,
+                "stall",
+                stats.zero_ticks >= STALL_TICKS,
+                rpm > 0,
+                f"0 RPM at {pwm * 100 // 255}% PWM",
+                f"spinning at {rpm} RPM",
+                now,
+            )
+            if not settled or rpm == 0:
+                continue
+
+            if stats.n < WARMUP_SAMPLES:
+                stats.learn(pwm, rpm)
+                continue
+            r = stats.observe(pwm, rpm)
+            self.check_degraded(f.mac, slot, stats, now)
+            # Do not let the baseline learn a fan that is currently off-track.
+            if abs(r) < DEGRADED_DROP and (f.mac, slot, "degraded") not in self.active:
+                stats.learn(pwm, rpm)
+
+    def check_degraded(self, mac: str, slot: int, stats: SlotStats, now: float):
+        self.update_alert(
+            mac,
+            slot,
+            "degraded",
+            stats.residual < -DEGRADED_DROP,
+            stats.residual > -DEGRADED_DROP / 2,
+            f"{-stats.residual:.0%} below its usual RPM at this PWM",
+            "back to its usual RPM",
+            now,
+        )
+        self.update_alert(
+            mac,
+            slot,
+            "erratic",
+            stats.spread > ERRATIC_SPREAD**2,
+            stats.spread < (ERRATIC_SPREAD / 2) ** 2,
+            f"RPM fluctuating by {math.sqrt(stats.spread):.0%}",
+            "RPM steady again",
+            now,
+        )
@@ -0,0 +1,70 @@
+import select
+import socket
+from typing import List, Optional, Tuple
+
+NETLINK_KOBJECT_UEVENT = 15
+KERNEL_EVENTS = 1
+
+
+class UeventMonitor:
+    """Listens for kernel USB uevents of one vendor on a netlink socket.
+
+    Events are returned as ``(action, product_id)`` tuples, e.g.
+    ``("remove", 0x8041)``. Only the kernel multicast group is used, so no
+    udev library is needed.
+    """
+
+    def __init__(self, vendor: int):
+        self.prefix = f"PRODUCT={vendor:x}/"
+        self.sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT
+        )
+        self.sock.bind((0, KERNEL_EVENTS))
+        self.sock.setblocking(False)
+
+    @classmethod
+    def open(cls, vendor: int) -> Optional["UeventMonitor"]:
+        try:
+            return cls(vendor)
+        except (AttributeError, OSError) as e:
+            print(f"USB hotplug events unavailable, falling back to polling: {e}")
+            return None
+
+    def parse(self, message: bytes) -> Optional[Tuple[str, int]]:
+        fields = message.split(b"\0")
+        action = None
+        product = None
+        is_device = False
+        for raw in fields[1:]:
+            field = raw.decode(errors="ignore")
+            if field.startswith("ACTION="):
+                action = field[7:]
+            elif field.startswith(self.prefix):
+                try:
+                    product = int(field[len(self.prefix) :].split("/")[0], 16)
+                except ValueError:
+                    return None
+            elif field == "DEVTYPE=usb_device":
+                is_device = True
+        if action is None or product is None or not is_device:
+            return None
+        return action, product
+
+    def poll(self, timeout: float = 0) -> List[Tuple[str, int]]:
+        """Return matching events, waiting up to ``timeout`` for the first one."""
+        events: List[Tuple[str, int]] = []
+        ready, _, _ = select.select([self.sock], [], [], timeout)
+        if not ready:
+            return events
+        while True:
+            try:
+                message = self.sock.recv(16384)
+            except BlockingIOError:
+                break
+            event = self.parse(message)
+            if event:
+                events.append(event)
+        return events
+
+    def close(self):
+        self.sock.close()
@@ -1,7 +1,8 @@
 import re
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+from sources import validate_sources
 
 
 class Fan(BaseModel):
@@ -16,11 +17,33 @@ class Fan(BaseModel):
     is_bound: bool
 
 
+AlertKind = Literal["stall", "degraded", "erratic", "dropout"]
+
+
+class FanAlert(BaseModel):
+    mac: str
+    slot: Optional[int] = None
+    kind: AlertKind
+    since: float
+    detail: str
+
+
+class FanEvent(BaseModel):
+    id: int
+    timestamp: float
+    mac: str
+    slot: Optional[int] = None
+    kind: AlertKind
+    active: bool
+    detail: str
+
+
 class SystemStatus(BaseModel):
     timestamp: float
     cpu_temp: Optional[float] = None
     gpu_temp: Optional[float] = None
     fans: List[Fan]
+    alerts: List[FanAlert] = []
 
 
 class VersionInfo(BaseModel):
@@ -66,6 +89,18 @@ class CurvePoint(BaseModel):
     percent: int = Field(ge=0, le=100)
 
 
+def _validate_curve_points(points: List[CurvePoint], value: str = "percent"):
+    for i in range(1, len(points)):
+        prev = points[i - 1]
+        cur = points[i]
+        if cur.temp_c <= prev.temp_c:
+            raise ValueError("curve temperatures must be strictly increasing")
+        if getattr(cur, value) < getattr(prev, value):
+            if value == "rpm":
+                raise ValueError("curve RPM values must be non-decreasing")
+            raise ValueError("curve pwm percentages must be non-decreasing")
+
+
 class CurveMode(BaseModel):
     model_config = ConfigDict(validate_assignment=True)
     points: List[CurvePoint]
@@ -74,14 +109,31 @@ class CurveMode(BaseModel):
     def validate_points(self):
         if len(self.points) != 4:
             raise ValueError("curve mode requires exactly 4 mappings")
+        _validate_curve_points(self.points)
+        return self
+
+
+FAN_CURVE_MIN_POINTS = 2
+FAN_CURVE_MAX_POINTS = 32
+
+
+class FanCurve(BaseModel):
+    """A curve of its own for one fan group, used in curve mode.
+
+    ``source`` is cpu, gpu, mix or the name of a source from ``Settings.sources``.
+    """
 
-        for i in range(1, len(self.points)):
-            prev = self.points[i - 1]
-            cur = self.points[i]
-            if cur.temp_c <= prev.temp_c:
-                raise ValueError("curve temperatures must be strictly increasing")
-            if cur.percent < prev.percent:
-                raise ValueError("curve pwm percentages must be non-decreasing")
+    model_config = ConfigDict(validate_assignment=True)
+    source: str = "cpu"
+    points: List[CurvePoint]
+
+    @model_validator(mode="after")
+    def validate_points(self):
+        if not FAN_CURVE_MIN_POINTS <= len(self.points) <= FAN_CURVE_MAX_POINTS:
+            raise ValueError(
+                f"fan curves need {FAN_CURVE_MIN_POINTS} to {FAN_CURVE_MAX_POINTS} points"
+            )
+        _validate_curve_points(self.points)
         return self
 
 
@@ -107,9 +159,101 @@ def default_gpu_curve() -> CurveMode:
     )
 
 
+class PidMode(BaseModel):
+    model_config = ConfigDict(validate_assignment=True)
+    cpu_target_temp: int = Field(default=70, ge=30, le=100)
+    gpu_target_temp: int = Field(default=68, ge=30, le=100)
+
+    kp: float = Field(default=3.0, ge=0, le=100)
+    ki: float = Field(default=0.15, ge=0, le=10)
+    kd: float = Field(default=4.0, ge=0, le=100)
+    derivative_filter: float = Field(default=2.0, ge=0, le=30)
+
+    min_pwm: int = Field(default=20, ge=0, le=100)
+    max_pwm: int = Field(default=100, ge=0, le=100)
+    slew_up: float = Field(default=30.0, gt=0, le=200)
+    slew_down: float = Field(default=5.0, gt=0, le=200)
+
+    cpu_load_gain: float = Field(default=0.3, ge=0, le=1)
+    gpu_load_gain: float = Field(default=0.3, ge=0, le=1)
+
+    @model_validator(mode="after")
+    def validate_ranges(self):
+        if self.min_pwm > self.max_pwm:
+            raise ValueError("min_pwm must be less than or equal to max_pwm")
+        return self
+
+
+RPM_MAX = 6000
+
+
+class RpmPoint(BaseModel):
+    temp_c: int = Field(ge=20, le=120)
+    rpm: int = Field(ge=0, le=RPM_MAX)
+
+
+def _rpm_curve(spec: str) -> List[RpmPoint]:
+    return [
+        RpmPoint(temp_c=int(t), rpm=int(r))
+        for t, r in (part.split(":") for part in spec.split(","))
+    ]
+
+
+class RpmMode(BaseModel):
+    """Curves from temperature to fan speed, and the RPM controller's tuning.
+
+    ``correction_gain`` is the share of the remaining RPM error corrected per
+    settled tick, ``max_correction`` bounds the total correction and errors
+    within ``tolerance`` are left alone.
+    """
+
+    model_config = ConfigDict(validate_assignment=True)
+    cpu_curve: List[RpmPoint] = Field(
+        default_factory=lambda: _rpm_curve("50:700,60:900,90:1600,95:2000")
+    )
+    gpu_curve: List[RpmPoint] = Field(
+        default_factory=lambda: _rpm_curve("35:750,60:950,70:1300,75:1800")
+    )
+    correction_gain: float = Field(default=0.5, ge=0, le=1)
+    max_correction: int = Field(default=300, ge=0, le=RPM_MAX)
+    tolerance: int = Field(default=40, ge=0, le=1000)
+
+    @field_validator("cpu_curve", "gpu_curve")
+    @classmethod
+    def validate_curve(cls, points: List[RpmPoint]):
+        if not FAN_CURVE_MIN_POINTS <= len(points) <= FAN_CURVE_MAX_POINTS:
+            raise ValueError(
+                f"RPM curves need {FAN_CURVE_MIN_POINTS} to {FAN_CURVE_MAX_POINTS} points"
+            )
+        _validate_curve_points(points, "rpm")
+        return points
+
+
+class FanCalibration(BaseModel):
+    """RPM a fan group settled at for each swept PWM (0-255)."""
+
+    pwm: List[int]
+    rpm: List[int]
+    calibrated_at: float
+
+    @model_validator(mode="after")
+    def validate_table(self):
+        if len(self.pwm) != len(self.rpm) or len(self.pwm) < 2:
+            raise ValueError("calibration needs matching pwm and rpm lists of 2+ steps")
+        if any(not 0 <= p <= 255 for p in self.pwm):
+            raise ValueError("calibration pwm values must be 0-255")
+        if any(b <= a for a, b in zip(self.pwm, self.pwm[1:])):
+            raise ValueError("calibration pwm values must be strictly increasing")
+        if any(r < 0 for r in self.rpm):
+            raise ValueError("calibration rpm values cannot be negative")
+        return self
+
+
 class FanMode(str, Enum):
     linear = "linear"
     curve = "curve"
+    pid = "pid"
+    rpm = "rpm"
 
 
 MAC_RE = re.compile(r"^[0-9a-f]{2}(?::[0-9a-f]{2}){5}$")
@@ -133,14 +277,38 @@ class Settings(BaseModel):
     gpu_linear: LinearMode = Field(default_factory=default_gpu_linear)
     cpu_curve: CurveMode = Field(default_factory=default_cpu_curve)
     gpu_curve: CurveMode = Field(default_factory=default_gpu_curve)
+    pid: PidMode = Field(default_factory=PidMode)
     gpu_macs: List[str] = Field(default_factory=list)
     mix_macs: List[str] = Field(default_factory=list)
+    fan_curves: Dict[str, FanCurve] = Field(default_factory=dict)
+    sources: Dict[str, str] = Field(default_factory=dict)
+    rpm: RpmMode = Field(default_factory=RpmMode)
+    calibrations: Dict[str, FanCalibration] = Field(default_factory=dict)
 
     @field_validator("gpu_macs", "mix_macs")
     @classmethod
     def validate_mac_lists(cls, values: List[str]):
         return _normalize_mac_list(values)
 
+    @field_validator("fan_curves", "calibrations")
+    @classmethod
+    def validate_mac_keys(cls, values: dict):
+        return {_normalize_mac_list([mac])[0]: c for mac, c in values.items()}
+
+    @field_validator("sources")
+    @classmethod
+    def validate_source_expressions(cls, values: Dict[str, str]):
+        return validate_sources(values)
+
+    @model_validator(mode="after")
+    def validate_fan_curve_sources(self):
+        for mac, curve in self.fan_curves.items():
+            if curve.source not in ("cpu", "gpu", "mix", *self.sources):
+                raise ValueError(
+                    f"fan curve of {mac} uses unknown source '{curve.source}'"
+                )
+        return self
+
     @model_validator(mode="after")
     def validate_no_mac_overlap(self):
         overlap = set(self.gpu_macs) & set(self.mix_macs)
@@ -149,3 +317,77 @@ class Settings(BaseModel):
                 f"MAC(s) cannot be in both gpu and mix groups: {', '.join(sorted(overlap))}"
             )
         return self
+
+
+class SettingsState(BaseModel):
+    version: int
+    settings: Settings
+
+
+class SourceAssignment(BaseModel):
+    fan_ids: str
+    group: Literal["cpu", "gpu", "mix"]
+
+
+class CalibrationRequest(BaseModel):
+    fan_ids: Optional[str] = None
+
+
+class CalibrationStatus(BaseModel):
+    running: bool
+    macs: List[str]
+    step: int
+    steps: int
+    remaining: float
+    error: Optional[str] = None
+
+
+class FrameRecord(BaseModel):
+    timestamp: float
+    data: str
+
+
+class DryRunStatus(BaseModel):
+    frames: int
+    recent: List[FrameRecord]
+
+
+class ShadowRequest(BaseModel):
+    """Settings changes for the shadow engine, merged onto the live settings."""
+
+    settings: dict = Field(default_factory=dict)
+    engine: Optional[Literal["python", "numpy"]] = None
+
+
+class ShadowTick(BaseModel):
+    timestamp: float
+    # mac -> [live PWM, shadow PWM] for the groups whose targets differ.
+    diffs: Dict[str, List[int]]
+    live_writes: int
+    shadow_writes: int
+    live_us: int
+    shadow_us: int
+
+
+class ShadowSummary(BaseModel):
+    started_at: float
+    ticks: int
+    differing_ticks: int
+    max_diff: int
+    mean_diff: float
+    live_writes: int
+    shadow_writes: int
+    live_p50_us: int
+    live_p99_us: int
+    shadow_p50_us: int
+    shadow_p99_us: int
+
+
+class ShadowStatus(BaseModel):
+    running: bool
+    engine: Optional[str] = None
+    settings: Optional[dict] = None
+    summary: Optional[ShadowSummary] = None
+    ticks: List[ShadowTick] = []
+    frames: List[FrameRecord] = []
+    dry_run: Optional[DryRunStatus] = None
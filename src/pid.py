@@ -0,0 +1,78 @@
+import time
+from typing import Optional
+from models import PidMode
+
+# Gaps longer than this (daemon paused, mode switched back to pid) restart the
+# controller instead of integrating over the whole gap.
+MAX_DT = 5.0
+
+
+class PidController:
+    """PID on temperature error with load feed-forward, in PWM percent.
+
+    The derivative acts on the measurement (no kick when the target changes)
+    and is low-pass filtered, and the integral only accumulates while the
+    feedback term is not saturated in the same direction. The feed-forward
+    term is added after the feedback clamp so load raises the fans even while
+    the temperature is still below target. The output is slew limited with
+    separate ramp-up and ramp-down rates.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.last_temp: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self.output: Optional[float] = None
+
+    def update(
+        self,
+        temp: float,
+        target_temp: float,
+        feed_forward: float,
+        cfg: PidMode,
+        now: Optional[float] = None,
+    ) -> int:
+        now = time.monotonic() if now is None else now
+        dt = 0.0 if self.last_time is None else now - self.last_time
+        if dt > MAX_DT:
+            self.reset()
+            dt = 0.0
+
+        error = temp - target_temp
+
+        if dt > 0 and self.last_temp is not None:
+            raw = (temp - self.last_temp) / dt
+            alpha = dt / (cfg.derivative_filter + dt)
+            self.derivative += alpha * (raw - self.derivative)
+
+        unclamped = (
+            cfg.min_pwm + cfg.kp * error + self.integral + cfg.kd * self.derivative
+        )
+
+        if dt > 0 and cfg.ki > 0:
+            step = cfg.ki * error * dt
+            saturated_high = unclamped >= cfg.max_pwm and step > 0
+            saturated_low = unclamped <= cfg.min_pwm and step < 0
+            if not (saturated_high or saturated_low):
+                self.integral += step
+                unclamped += step
+            span = cfg.max_pwm - cfg.min_pwm
+            self.integral = max(-span, min(span, self.integral))
+
+        feedback = max(cfg.min_pwm, min(cfg.max_pwm, unclamped))
+        output = max(cfg.min_pwm, min(cfg.max_pwm, feedback + feed_forward))
+
+        if self.output is not None and dt > 0:
+            output = max(
+                self.output - cfg.slew_down * dt,
+                min(self.output + cfg.slew_up * dt, output),
+            )
+
+        self.output = output
+        self.last_temp = temp
+        self.last_time = now
+        return int(round(output / 100 * 255))
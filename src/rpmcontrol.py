@@ -0,0 +1,248 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional
+from models import Fan, FanCalibration, RpmMode
+from curves import percent_to_pwm
+
+# Fans without a calibration are driven as if their speed were linear in
+# PWM up to this RPM; the correction term trims the difference.
+DEFAULT_MAX_RPM = 2000
+RPM_SLOTS = 4
+
+# The measured RPM is trusted once this long has passed since the last PWM
+# change of at least SETTLE_PWM_STEP and the reading has stopped moving.
+SETTLE_SECONDS = 3.0
+SETTLE_PWM_STEP = 5
+
+CALIBRATION_PERCENTS = (0, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100)
+# The first step spins the fans down from wherever they were.
+CALIBRATION_FIRST_SETTLE = 8.0
+CALIBRATION_SETTLE = 3.0
+CALIBRATION_MEASURE = 2.0
+
+
+def group_rpm(fan: Fan) -> Optional[float]:
+    """Mean RPM of the spinning fans of a group, or None when none report."""
+    readings = [r for r in fan.rpm[: min(fan.fan_count, RPM_SLOTS)] if r > 0]
+    return sum(readings) / len(readings) if readings else None
+
+
+class RpmTable:
+    """A calibration inverted for RPM to PWM lookups.
+
+    Measured RPM can dip between steps from noise, so the table keeps the
+    running maximum to stay invertible. Targets between standstill and the
+    slowest speed the fan holds get the PWM of that slowest speed.
+    """
+
+    __slots__ = ("pwm", "rpm", "spin")
+
+    def __init__(self, pwm: List[int], rpm: List[int]):
+        self.pwm = pwm
+        self.rpm = []
+        top = 0
+        for r in rpm:
+            top = max(top, r)
+            self.rpm.append(top)
+        self.spin = next((i for i, r in enumerate(self.rpm) if r > 0), len(rpm) - 1)
+
+    @classmethod
+    def from_calibration(cls, calibration: FanCalibration) -> "RpmTable":
+        return cls(calibration.pwm, calibration.rpm)
+
+    def pwm_for(self, rpm: float) -> int:
+        if rpm <= 0:
+            return self.pwm[0]
+        if rpm <= self.rpm[self.spin]:
+            return self.pwm[self.spin]
+        if rpm >= self.rpm[-1]:
+            return self.pwm[-1]
+        i = bisect_left(self.rpm, rpm)
+        lo, hi = self.rpm[i - 1], self.rpm[i]
+        ratio = (rpm - lo) / (hi - lo)
+        return int(round(self.pwm[i - 1] + ratio * (self.pwm[i] - self.pwm[i - 1])))
+
+
+# A sweep of a fan whose speed is exactly linear in PWM.
+DEFAULT_TABLE = RpmTable(
+    [percent_to_pwm(p) for p in CALIBRATION_PERCENTS],
+    [round(p / 100 * DEFAULT_MAX_RPM) for p in CALIBRATION_PERCENTS],
+)
+
+
+class FanLoop:
+    __slots__ = ("table", "correction", "pwm", "target", "changed_at", "measured")
+
+    def __init__(self, table: RpmTable):
+        self.table = table
+        self.correction = 0.0
+        self.pwm: Optional[int] = None
+        self.target = 0.0
+        self.changed_at = 0.0
+        self.measured: Optional[float] = None
+
+
+class RpmController:
+    """Per-fan PWM for RPM targets: feed-forward plus a small correction.
+
+    The calibration table gives the PWM for the target at once, so a fan
+    lands on its target as soon as it has spun up. What the table gets
+    wrong (dust, wear, a table measured at another temperature) is trimmed
+    by a correction in RPM added to the target before the lookup. It only
+    learns once the fan has settled after a PWM change, so it never chases
+    the spin-up and cannot oscillate.
+    """
+
+    def __init__(self):
+        self.fans: Dict[str, FanLoop] = {}
+        self.tables: Dict[str, RpmTable] = {}
+        self.calibrations: Dict[str, FanCalibration] = {}
+
+    def table(self, mac: str, calibrations: Dict[str, FanCalibration]) -> RpmTable:
+        calibration = calibrations.get(mac)
+        if calibration is None:
+            return DEFAULT_TABLE
+        if self.calibrations.get(mac) is not calibration:
+            self.calibrations[mac] = calibration
+            self.tables[mac] = RpmTable.from_calibration(calibration)
+        return self.tables[mac]
+
+    def update(
+        self,
+        mac: str,
+        target: float,
+        measured: Optional[float],
+        table: RpmTable,
+        cfg: RpmMode,
+        now: float,
+    ) -> int:
+        loop = self.fans.get(mac)
+        if loop is None or loop.table is not table:
+            loop = self.fans[mac] = FanLoop(table)
+
+        if (
+            measured is not None
+            and loop.measured is not None
+            and loop.target > 0
+            and now - loop.changed_at >= SETTLE_SECONDS
+            and abs(measured - loop.measured) <= cfg.tolerance
+        ):
+            error = loop.target - measured
+            if abs(error) > cfg.tolerance:
+                limit = cfg.max_correction
+                loop.correction += cfg.correction_gain * error
+                loop.correction = max(-limit, min(limit, loop.correction))
+        loop.measured = measured
+
+        pwm = table.pwm_for(target + loop.correction if target > 0 else 0)
+        # Compared with the PWM of the last big change, so creeping targets
+        # still restart the wait once they add up.
+        if loop.pwm is None or abs(pwm - loop.pwm) >= SETTLE_PWM_STEP:
+            loop.pwm = pwm
+            loop.changed_at = now
+        loop.target = target
+        return pwm
+
+    def targets(
+        self,
+        fans: List[Fan],
+        cpu_rpm: Optional[float],
+        gpu_rpm: Optional[float],
+        gpu_mac_set: set,
+        mix_mac_set: set,
+        cfg: RpmMode,
+        calibrations: Dict[str, FanCalibration],
+        now: float,
+    ) -> Dict[str, int]:
+        """PWM per MAC for the fans whose source group has an RPM target.
+
+        Group resolution matches ``route_targets``: gpu falls back to the CPU
+        target and mix takes the higher of the two.
+        """
+        result: Dict[str, int] = {}
+        for f in fans:
+            mac = f.mac.lower()
+            if mac in mix_mac_set:
+                target = max(
+                    (t for t in (cpu_rpm, gpu_rpm) if t is not None), default=None
+                )
+            elif mac in gpu_mac_set:
+                target = gpu_rpm if gpu_rpm is not None else cpu_rpm
+            else:
+                target = cpu_rpm
+            if target is None:
+                continue
+            table = self.table(mac, calibrations)
+            result[mac] = self.update(mac, target, group_rpm(f), table, cfg, now)
+        return result
+
+
+class Calibration:
+    """Sweeps the PWM of some fan groups up in steps and records the RPM
+    each settles at.
+
+    The control loop writes ``target()`` to the fans being calibrated and
+    passes every tick's fan list to ``observe()``. Groups that stop
+    reporting during the sweep are left out of the results.
+    """
+
+    def __init__(
+        self,
+        macs: List[str],
+        now: float,
+        percents=CALIBRATION_PERCENTS,
+    ):
+        self.macs = macs
+        self.pwm = [percent_to_pwm(p) for p in percents]
+        self.step = 0
+        self.step_started = now
+        self.readings: Dict[str, List[List[float]]] = {
+            mac: [[] for _ in self.pwm] for mac in macs
+        }
+        self.error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.error is not None or self.step >= len(self.pwm)
+
+    def settle(self, step: int) -> float:
+        return CALIBRATION_FIRST_SETTLE if step == 0 else CALIBRATION_SETTLE
+
+    def remaining(self, now: float) -> float:
+        if self.done:
+            return 0.0
+        left = sum(
+            self.settle(s) + CALIBRATION_MEASURE
+            for s in range(self.step, len(self.pwm))
+        )
+        return max(0.0, left - (now - self.step_started))
+
+    def target(self) -> int:
+        return self.pwm[min(self.step, len(self.pwm) - 1)]
+
+    def observe(self, fans: List[Fan], now: float):
+        if self.done:
+            return
+        elapsed = now - self.step_started
+        settle = self.settle(self.step)
+        if elapsed >= settle:
+            for f in fans:
+                steps = self.readings.get(f.mac.lower())
+                if steps is not None:
+                    steps[self.step].append(group_rpm(f) or 0.0)
+        if elapsed >= settle + CALIBRATION_MEASURE:
+            self.step += 1
+            self.step_started = now
+
+    def abort(self, reason: str):
+        self.error = reason
+
+    def results(self, now: float) -> Dict[str, FanCalibration]:
+        return {
+            mac: FanCalibration(
+                pwm=self.pwm,
+                rpm=[int(round(sum(r) / len(r))) for r in steps],
+                calibrated_at=now,
+            )
+            for mac, steps in self.readings.items()
+            if all(steps)
+        }
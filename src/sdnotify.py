@@ -0,0 +1,68 @@
+import os
+import socket
+import time
+from typing import Optional
+
+
+class Notifier:
+    """Speaks the systemd notify protocol without libsystemd.
+
+    Does nothing when the daemon is not started by a ``Type=notify`` unit.
+    The packaged daemon is a PyInstaller one-file binary, which runs Python
+    as a child of the unit's main process, so the watchdog is accepted for
+    ``WATCHDOG_PID`` being either this process or its parent.
+    """
+
+    def __init__(self):
+        self.sock: Optional[socket.socket] = None
+        self.address: Optional[str] = None
+        self.interval: Optional[float] = None
+        self.last_ping = 0.0
+        self.is_ready = False
+
+        address = os.getenv("NOTIFY_SOCKET")
+        if address:
+            if address.startswith("@"):
+                address = "\0" + address[1:]
+            try:
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+                self.sock.setblocking(False)
+                self.address = address
+            except OSError as e:
+                print(f"systemd notifications unavailable: {e}")
+
+        usec = os.getenv("WATCHDOG_USEC")
+        pid = os.getenv("WATCHDOG_PID")
+        if self.sock and usec and usec.isdigit():
+            if pid is None or pid in (str(os.getpid()), str(os.getppid())):
+                # Ping at twice the rate systemd requires.
+                self.interval = int(usec) / 1_000_000 / 2
+
+    def notify(self, *fields: str) -> bool:
+        if self.sock is None:
+            return False
+        try:
+            self.sock.sendto("\n".join(fields).encode(), self.address)
+            return True
+        except OSError:
+            return False
+
+    def ready(self, status: str):
+        if not self.is_ready:
+            self.is_ready = True
+            self.notify("READY=1", f"STATUS={status}")
+            self.last_ping = time.monotonic()
+
+    def status(self, status: str):
+        self.notify(f"STATUS={status}")
+
+    def watchdog(self):
+        if self.interval is None:
+            return
+        now = time.monotonic()
+        if now - self.last_ping >= self.interval:
+            self.last_ping = now
+            self.notify("WATCHDOG=1")
+
+    def stopping(self):
+        self.notify("STOPPING=1")
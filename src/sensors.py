@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Callable, Optional, Tuple
+
+
+class Sampler:
+    """Reads one sensor source on its own thread and keeps the latest value.
+
+    The latest reading is published as a single ``(value, monotonic time)``
+    tuple, so readers never take a lock: rebinding the attribute is atomic and
+    a reader always sees a complete pair. A read that raises or hangs simply
+    stops publishing, which readers detect as staleness.
+
+    With ``idle_after`` set, the sampler stops reading once nobody has asked
+    for a value for that long, and resumes on the next ``get()``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        read: Callable[[], Any],
+        interval: float,
+        stale_after: float,
+        idle_after: Optional[float] = None,
+    ):
+        self.name = name
+        self.read = read
+        self.interval = interval
+        self.stale_after = stale_after
+        self.idle_after = idle_after
+        self.latest: Optional[Tuple[Any, float]] = None
+        self.resumed_at = time.monotonic()
+        self.wanted_at = self.resumed_at
+        self.wake = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name=f"sampler-{name}", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def is_idle(self, now: float) -> bool:
+        return self.idle_after is not None and now - self.wanted_at > self.idle_after
+
+    def run(self):
+        while True:
+            if self.is_idle(time.monotonic()):
+                self.wake.wait()
+                self.wake.clear()
+                continue
+
+            started = time.monotonic()
+            try:
+                value = self.read()
+            except Exception:
+                pass
+            else:
+                self.latest = (value, time.monotonic())
+
+            self.wake.wait(max(0.0, self.interval - (time.monotonic() - started)))
+            self.wake.clear()
+
+    def get(self) -> Tuple[Any, bool]:
+        """Return ``(value, stale)``.
+
+        ``value`` is None when nothing fresh is available. ``stale`` is True
+        once the source has gone ``stale_after`` seconds without publishing.
+        """
+        now = time.monotonic()
+        if self.is_idle(now):
+            self.resumed_at = now
+            self.wake.set()
+        self.wanted_at = now
+
+        sample = self.latest
+        if sample is None or sample[1] < self.resumed_at:
+            return None, now - self.resumed_at > self.stale_after
+
+        value, published_at = sample
+        if now - published_at > self.stale_after:
+            return None, True
+        return value, False
@@ -1,4 +1,9 @@
+import asyncio
+import errno
+import importlib.util
 import os
+import signal
+import socket
 import time
 import threading
 import sys
@@ -6,51 +11,648 @@ import subprocess
 import usb.core
 import usb.util
 import psutil
-import uvicorn
-from fastapi import FastAPI
+from apiserver import (
+    ApiError,
+    Broadcast,
+    Request,
+    Response,
+    StreamResponse,
+    authorized,
+    encode,
+    serve_sockets,
+    serve_unix,
+)
 from parseArg import extractVersion
-from utils import DEV_MODE, SOCKET_DIR, SOCKET_PATH, load_settings
-from models import CurveMode, Fan, FanMode, LinearMode, SystemStatus
-from typing import List, Literal, Optional
+import flightrec
+from curves import CompiledCurve, CurveSet
+from hotplug import UeventMonitor
+import health
+import rpmcontrol
+import sdnotify
+import statuscodec
+import usbtrace
+from utils import (
+    API_SERVER,
+    API_TCP,
+    API_TOKEN_PATH,
+    CACHE_DIR,
+    DEV_MODE,
+    DRY_RUN,
+    FLIGHT_RECORDS,
+    SOCKET_DIR,
+    SOCKET_PATH,
+    STATUS_SHM,
+    STATUS_SHM_PATH,
+    TARGET_ENGINE,
+    USB_BACKEND,
+    USB_CAPTURE,
+    load_api_token,
+    load_settings,
+    merge_settings,
+    parse_host_port,
+    resolve_fan_ids,
+    save_settings,
+)
+from models import (
+    CalibrationRequest,
+    CalibrationStatus,
+    CurveMode,
+    DryRunStatus,
+    Fan,
+    FanEvent,
+    FanMode,
+    LinearMode,
+    Settings,
+    SettingsState,
+    ShadowRequest,
+    ShadowStatus,
+    SourceAssignment,
+    SystemStatus,
+)
+from pid import PidController
+from sensors import Sampler
+from typing import (
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Literal,
+    Optional,
+    Union,
+)
 from vars import APP_NAME, APP_RAW_VERSION
 
 shared_state: SystemStatus = None
+TRACE: Optional[usbtrace.TraceWriter] = None
+PERSISTER: Optional["SettingsPersister"] = None
+SETTINGS_VERSION = 0
+STATUS_ENCODER = statuscodec.StatusEncoder()
+# A shmstatus.StatusWriter once LLCW_SHM is set up.
+SHM_WRITER = None
+HEALTH = health.HealthMonitor()
+NOTIFIER = sdnotify.Notifier()
+FLIGHT: Optional[flightrec.FlightRecorder] = (
+    flightrec.FlightRecorder(FLIGHT_RECORDS, CACHE_DIR) if FLIGHT_RECORDS else None
+)
+CALIBRATION: Optional[rpmcontrol.Calibration] = None
+SHADOW: Optional["ShadowEngine"] = None
+# Frames the TX device would have sent, kept across reconnects (a
+# shadow.FrameLog under LLCW_DRY_RUN).
+DRY_RUN_LOG = None
+STATUS_FEED = Broadcast()
 
 
 def update_state(cpu_temp: Optional[float], gpu_temp: Optional[float], fans: List[Fan]):
     global shared_state
     shared_state = SystemStatus(
-        timestamp=time.time(), cpu_temp=cpu_temp, gpu_temp=gpu_temp, fans=fans
+        timestamp=time.time(),
+        cpu_temp=cpu_temp,
+        gpu_temp=gpu_temp,
+        fans=fans,
+        alerts=HEALTH.alerts(),
     )
+    if SHM_WRITER:
+        SHM_WRITER.publish(STATUS_ENCODER.encode(shared_state, statuscodec.BINARY))
+    STATUS_FEED.publish()
 
 
 # ==============================
 # SOCK SERVER
 # ==============================
 
-app = FastAPI()
 
+def api_status(request: Request) -> Response:
+    return status_response(request.headers.get("accept"))
 
-@app.get("/status", response_model=SystemStatus)
-async def get_status():
-    return shared_state
 
+def api_events(request: Request) -> List[dict]:
+    try:
+        since = int(request.query.get("since", 0))
+    except ValueError:
+        raise ApiError(422, ["since must be an event id"])
+    return [e.model_dump() for e in HEALTH.events_since(since)]
+
+
+def api_watch(request: Request) -> StreamResponse:
+    try:
+        interval = float(request.query.get("interval", 0))
+    except ValueError:
+        raise ApiError(422, ["interval must be a number of seconds"])
+    on_change = request.query.get("on_change", "").lower() in ("1", "true", "yes")
+    return watch_response(interval, on_change)
 
-@app.post("/reload-settings")
-async def reload_settings():
-    global SETTINGS
-    SETTINGS = load_settings()
+
+def api_reload_settings(request: Request) -> dict:
+    with SETTINGS_LOCK:
+        set_settings(load_settings(), persist=False)
     return {"msg": "ok"}
 
 
-@app.get("/")
-async def root():
+def api_get_settings(request: Request) -> SettingsState:
+    return SettingsState(version=SETTINGS_VERSION, settings=SETTINGS)
+
+
+def api_patch_settings(request: Request) -> SettingsState:
+    return patch_settings(request.json(), request.headers.get("if-match"))
+
+
+def api_put_settings(request: Request) -> SettingsState:
+    return patch_settings(request.json(), request.headers.get("if-match"), replace=True)
+
+
+def api_assign_sources(request: Request) -> SettingsState:
+    return assign_sources(request.model(SourceAssignment))
+
+
+def api_flight_recorder(request: Request) -> dict:
+    return dump_flight_recorder_api()
+
+
+def api_start_calibration(request: Request) -> CalibrationStatus:
+    return start_calibration(request.model(CalibrationRequest))
+
+
+def api_calibration_status(request: Request) -> CalibrationStatus:
+    return calibration_status()
+
+
+def api_shadow_status(request: Request) -> ShadowStatus:
+    try:
+        ticks = int(request.query.get("ticks", SHADOW_TICKS))
+    except ValueError:
+        raise ApiError(422, ["ticks must be a number of ticks"])
+    return shadow_status(ticks)
+
+
+def api_start_shadow(request: Request) -> ShadowStatus:
+    return start_shadow(request.model(ShadowRequest))
+
+
+def api_stop_shadow(request: Request) -> ShadowStatus:
+    return stop_shadow()
+
+
+def api_root(request: Request) -> dict:
     return {"status": "running", "service": APP_NAME}
 
 
-def start_api_server():
+API_ROUTES = {
+    ("GET", "/status"): api_status,
+    ("GET", "/events"): api_events,
+    ("GET", "/watch"): api_watch,
+    ("POST", "/reload-settings"): api_reload_settings,
+    ("GET", "/settings"): api_get_settings,
+    ("PATCH", "/settings"): api_patch_settings,
+    ("PUT", "/settings"): api_put_settings,
+    ("POST", "/settings/sources"): api_assign_sources,
+    ("POST", "/flight-recorder"): api_flight_recorder,
+    ("POST", "/calibrate"): api_start_calibration,
+    ("GET", "/calibrate"): api_calibration_status,
+    ("GET", "/shadow"): api_shadow_status,
+    ("POST", "/shadow"): api_start_shadow,
+    ("DELETE", "/shadow"): api_stop_shadow,
+    ("GET", "/"): api_root,
+}
+
+
+def status_age_header(state: Optional[SystemStatus]) -> Dict[str, str]:
+    """How old ``state`` is by this daemon's clock, so pollers on other hosts
+    can judge staleness without comparing clocks."""
+    if state is None:
+        return {}
+    return {statuscodec.AGE_HEADER: f"{max(0.0, time.time() - state.timestamp):.3f}"}
+
+
+def status_response(accept: Optional[str]) -> Response:
+    media_type = statuscodec.negotiate(accept)
+    if media_type is None:
+        raise ApiError(406, f"Supported: {', '.join(statuscodec.available())}")
+    state = shared_state
+    if state is None and media_type != statuscodec.JSON:
+        raise ApiError(503, "No fan data yet")
+    return Response(
+        STATUS_ENCODER.encode(state, media_type), media_type, status_age_header(state)
+    )
+
+
+WATCH_MEDIA_TYPE = "application/x-ndjson"
+WATCH_MAX_INTERVAL = 3600
+
+
+def same_status(a: SystemStatus, b: SystemStatus) -> bool:
+    return (a.cpu_temp, a.gpu_temp, a.fans, a.alerts) == (
+        b.cpu_temp,
+        b.gpu_temp,
+        b.fans,
+        b.alerts,
+    )
+
+
+async def watch_status(interval: float, on_change: bool) -> AsyncIterator[bytes]:
+    """Each published status as one line of compact JSON, starting with the
+    current one.
+
+    Lines are at least ``interval`` seconds apart and carry the latest status
+    at that time. With ``on_change``, a status that only differs from the last
+    line in its timestamp is skipped.
+    """
+    loop = asyncio.get_running_loop()
+    seen = STATUS_FEED.version
+    state = shared_state
+    last: Optional[SystemStatus] = None
+    next_at = 0.0
+    while True:
+        if state is not None and not (
+            on_change and last is not None and same_status(state, last)
+        ):
+            yield STATUS_ENCODER.encode(state, statuscodec.JSON) + b"\n"
+            last = state
+            next_at = loop.time() + interval
+        delay = next_at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        seen = await STATUS_FEED.wait(seen)
+        state = shared_state
+
+
+def watch_response(interval: float, on_change: bool) -> StreamResponse:
+    if not 0 <= interval <= WATCH_MAX_INTERVAL:
+        raise ApiError(422, [f"interval must be 0-{WATCH_MAX_INTERVAL} seconds"])
+    return StreamResponse(watch_status(interval, on_change), WATCH_MEDIA_TYPE)
+
+
+def dump_flight_recorder_api() -> dict:
+    if FLIGHT is None:
+        raise ApiError(404, "Flight recorder is off (LLCW_FLIGHT_RECORDS=0)")
+    path = dump_flight_recorder("api")
+    if path is None:
+        raise ApiError(500, "Unable to write the flight record")
+    return {"path": str(path), "records": min(FLIGHT.count, FLIGHT.capacity)}
+
+
+def patch_settings(
+    changes, if_match: Optional[str], replace: bool = False
+) -> SettingsState:
+    if not isinstance(changes, dict):
+        raise ApiError(422, ["settings changes must be a JSON object"])
+    return commit_settings(changes, replace, if_match)
+
+
+def assign_sources(body: SourceAssignment) -> SettingsState:
+    if shared_state is None:
+        raise ApiError(503, "No fan data yet")
+    try:
+        macs = resolve_fan_ids(body.fan_ids, shared_state.fans)
+    except ValueError as e:
+        raise ApiError(400, str(e))
+
+    def changes(settings: Settings) -> dict:
+        gpu_macs = [m for m in settings.gpu_macs if m not in macs]
+        mix_macs = [m for m in settings.mix_macs if m not in macs]
+        if body.group == "gpu":
+            gpu_macs += macs
+        elif body.group == "mix":
+            mix_macs += macs
+        return {"gpu_macs": gpu_macs, "mix_macs": mix_macs}
+
+    return commit_settings(changes)
+
+
+def start_calibration(body: CalibrationRequest) -> CalibrationStatus:
+    global CALIBRATION
+    if DRY_RUN:
+        # No frame reaches the fans, so the sweep would measure nothing.
+        raise ApiError(409, "Calibration needs the fans to run; turn off LLCW_DRY_RUN")
+    if shared_state is None:
+        raise ApiError(503, "No fan data yet")
+    if CALIBRATION is not None and not CALIBRATION.done:
+        raise ApiError(409, "A calibration is already running")
+    if body.fan_ids:
+        try:
+            macs = resolve_fan_ids(body.fan_ids, shared_state.fans)
+        except ValueError as e:
+            raise ApiError(400, str(e))
+    else:
+        macs = [f.mac.lower() for f in shared_state.fans]
+    CALIBRATION = rpmcontrol.Calibration(macs, time.monotonic())
+    return calibration_status()
+
+
+def calibration_status() -> CalibrationStatus:
+    calibration = CALIBRATION
+    if calibration is None:
+        return CalibrationStatus(running=False, macs=[], step=0, steps=0, remaining=0)
+    steps = len(calibration.pwm)
+    return CalibrationStatus(
+        running=not calibration.done,
+        macs=calibration.macs,
+        step=min(calibration.step, steps),
+        steps=steps,
+        remaining=calibration.remaining(time.monotonic()),
+        error=calibration.error,
+    )
+
+
+def finish_calibration(calibration: rpmcontrol.Calibration):
+    if calibration.error is None:
+        results = calibration.results(time.time())
+        if results:
+            commit_settings(
+                {"calibrations": {mac: c.model_dump() for mac, c in results.items()}}
+            )
+            print(f"Calibrated {len(results)} fan group(s).")
+            return
+        calibration.abort("no fan group reported RPM through the whole sweep")
+    print(f"Calibration failed: {calibration.error}")
+
+
+SHADOW_TICKS = 10
+
+
+def start_shadow(body: ShadowRequest) -> ShadowStatus:
+    global SHADOW
+    if SHADOW is not None:
+        raise ApiError(409, "A shadow engine is already running")
+    engine = body.engine or TARGET_ENGINE
+    if engine == "numpy" and importlib.util.find_spec("numpy") is None:
+        raise ApiError(422, ["The numpy target engine needs numpy installed"])
+    try:
+        SHADOW = ShadowEngine(body.settings, engine)
+    except ValueError as e:
+        raise ApiError(422, str(e).splitlines())
+    return shadow_status(0)
+
+
+def stop_shadow() -> ShadowStatus:
+    """Stop the shadow engine and return its final report."""
+    global SHADOW
+    engine, SHADOW = SHADOW, None
+    if engine is None:
+        return shadow_status(0)
+    status = engine.status(SHADOW_TICKS)
+    status.running = False
+    return status
+
+
+def shadow_status(ticks: int) -> ShadowStatus:
+    engine = SHADOW
+    status = engine.status(ticks) if engine else ShadowStatus(running=False)
+    if DRY_RUN_LOG is not None:
+        status.dry_run = DryRunStatus(
+            frames=DRY_RUN_LOG.count, recent=DRY_RUN_LOG.recent()
+        )
+    return status
+
+
+def create_fastapi_app():
+    """Build the FastAPI app; FastAPI is only imported when this mode is used."""
+    from fastapi import FastAPI, Header
+    from fastapi.responses import (
+        JSONResponse,
+        Response as RawResponse,
+        StreamingResponse,
+    )
+
+    app = FastAPI()
+
+    @app.exception_handler(ApiError)
+    async def api_error(request, e: ApiError):
+        return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+
+    @app.get("/status", response_model=Optional[SystemStatus])
+    async def get_status(response: RawResponse, accept: Optional[str] = Header(None)):
+        if statuscodec.negotiate(accept) == statuscodec.JSON:
+            state = shared_state
+            response.headers.update(status_age_header(state))
+            return state
+        encoded = status_response(accept)
+        return RawResponse(
+            content=encoded.body,
+            media_type=encoded.media_type,
+            headers=encoded.headers,
+        )
+
+    @app.get("/events", response_model=List[FanEvent])
+    async def events(since: int = 0):
+        return HEALTH.events_since(since)
+
+    @app.get("/watch")
+    async def watch(interval: float = 0, on_change: bool = False):
+        stream = watch_response(interval, on_change)
+        return StreamingResponse(stream.chunks, media_type=stream.media_type)
+
+    @app.post("/reload-settings")
+    async def reload_settings():
+        return api_reload_settings(None)
+
+    @app.get("/settings", response_model=SettingsState)
+    async def get_settings():
+        return api_get_settings(None)
+
+    @app.patch("/settings", response_model=SettingsState)
+    async def patch(changes: dict, if_match: Optional[str] = Header(None)):
+        return patch_settings(changes, if_match)
+
+    @app.put("/settings", response_model=SettingsState)
+    async def put(settings: dict, if_match: Optional[str] = Header(None)):
+        return patch_settings(settings, if_match, replace=True)
+
+    @app.post("/settings/sources", response_model=SettingsState)
+    async def sources(body: SourceAssignment):
+        return assign_sources(body)
+
+    @app.post("/flight-recorder")
+    async def flight_recorder():
+        return dump_flight_recorder_api()
+
+    @app.post("/calibrate", response_model=CalibrationStatus)
+    async def calibrate(body: CalibrationRequest):
+        return start_calibration(body)
+
+    @app.get("/calibrate", response_model=CalibrationStatus)
+    async def calibrate_status():
+        return calibration_status()
+
+    @app.get("/shadow", response_model=ShadowStatus)
+    async def get_shadow(ticks: int = SHADOW_TICKS):
+        return shadow_status(ticks)
+
+    @app.post("/shadow", response_model=ShadowStatus)
+    async def post_shadow(body: ShadowRequest):
+        return start_shadow(body)
+
+    @app.delete("/shadow", response_model=ShadowStatus)
+    async def delete_shadow():
+        return stop_shadow()
+
+    @app.get("/")
+    async def root():
+        return api_root(None)
+
+    return app
+
+
+def set_settings(settings: Settings, persist: bool = True):
+    global SETTINGS, SETTINGS_VERSION
+    SETTINGS = settings
+    SETTINGS_VERSION += 1
+    if TRACE:
+        TRACE.settings(SETTINGS.model_dump_json().encode())
+    if persist and PERSISTER:
+        PERSISTER.schedule()
+
+
+def commit_settings(
+    changes: Union[dict, Callable[[Settings], dict]],
+    replace: bool = False,
+    if_match: Optional[str] = None,
+) -> SettingsState:
+    """Validate a partial update against the live settings and swap it in.
+
+    With ``replace``, ``changes`` is merged onto the defaults instead, so
+    whatever it leaves out (fan curves, sources, calibrations) is dropped.
+    ``changes`` may also be a function of the live settings, for updates
+    that are derived from them. The whole read-merge-swap runs under
+    SETTINGS_LOCK so concurrent updates never drop each other's changes.
+    """
+    with SETTINGS_LOCK:
+        if if_match is not None and if_match.strip('"') != str(SETTINGS_VERSION):
+            raise ApiError(412, f"Settings changed (now at version {SETTINGS_VERSION})")
+        if callable(changes):
+            changes = changes(SETTINGS)
+        try:
+            settings = merge_settings(Settings() if replace else SETTINGS, changes)
+        except ValueError as e:
+            raise ApiError(422, str(e).splitlines())
+        if settings != SETTINGS:
+            set_settings(settings)
+        return SettingsState(version=SETTINGS_VERSION, settings=SETTINGS)
+
+
+class SettingsPersister:
+    """Writes the live settings to config.json off the request path.
+
+    Updates that land while a write is in progress are coalesced into the
+    next write, so a burst of changes costs at most two file writes.
+    """
+
+    def __init__(self):
+        self.pending = threading.Event()
+        self.saved_version = SETTINGS_VERSION
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(
+            target=self.run, name="settings-writer", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def schedule(self):
+        self.pending.set()
+
+    def save(self):
+        with self.lock:
+            version = SETTINGS_VERSION
+            if version == self.saved_version:
+                return
+            try:
+                save_settings(SETTINGS)
+                self.saved_version = version
+            except OSError as e:
+                print(f"Unable to save settings: {e}")
+
+    def run(self):
+        while True:
+            self.pending.wait()
+            self.pending.clear()
+            self.save()
+
+
+def bind_api_socket() -> socket.socket:
+    """Bind the API socket up front so clients can connect while USB starts."""
     os.makedirs(SOCKET_DIR, exist_ok=True)
-    uvicorn.run(app, uds=SOCKET_PATH, log_level="warning")
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(SOCKET_PATH)
+    try:
+        os.chmod(SOCKET_PATH, 0o666)
+    except OSError:
+        pass
+    sock.listen(128)
+    return sock
+
+
+def bind_tcp_socket() -> Optional[socket.socket]:
+    """Bind the optional LLCW_API_TCP listener, or return None when it is off."""
+    if not API_TCP:
+        return None
+    try:
+        host, port = parse_host_port(API_TCP)
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+    except (OSError, ValueError) as e:
+        print(f"Unable to listen on TCP {API_TCP}: {e}")
+        return None
+    sock.listen(128)
+    return sock
+
+
+def require_token(app, token: str):
+    """Wrap an ASGI app so that requests over TCP must carry the API token.
+
+    Unix socket connections have no client address and are let through.
+    """
+
+    async def guarded(scope, receive, send):
+        if scope["type"] == "http" and scope.get("client"):
+            headers = dict(scope["headers"])
+            header = headers.get(b"authorization", b"").decode("latin-1")
+            if not authorized(header, token):
+                body = encode({"detail": "Missing or invalid API token"})
+                await send(
+                    {
+                        "type": "http.response.start",
+                        "status": 401,
+                        "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                        ],
+                    }
+                )
+                await send({"type": "http.response.body", "body": body})
+                return
+        await app(scope, receive, send)
+
+    return guarded
+
+
+def start_api_server(sock: socket.socket, tcp_sock: Optional[socket.socket] = None):
+    token = None
+    if tcp_sock is not None:
+        token = load_api_token()
+        host, port = tcp_sock.getsockname()[:2]
+        origin = "LLCW_API_TOKEN" if os.getenv("LLCW_API_TOKEN") else API_TOKEN_PATH
+        print(f"API also listening on TCP {host}:{port} (token from {origin})")
+    if API_SERVER == "builtin":
+        if tcp_sock is None:
+            serve_unix(API_ROUTES, sock)
+        else:
+            serve_sockets(API_ROUTES, sock, tcp_sock, token)
+        return
+    import uvicorn
+
+    app = create_fastapi_app()
+    sockets = [sock]
+    if tcp_sock is not None:
+        app = require_token(app, token)
+        sockets.append(tcp_sock)
+    config = uvicorn.Config(app, log_level="warning")
+    uvicorn.Server(config).run(sockets=sockets)
 
 
 # ==============================
@@ -76,8 +678,28 @@ MAX_DEVICES_PAGE = 10
 # MIN_TEMP = 35.0
 # MAX_TEMP = 85.0
 SETTINGS = load_settings()
+# Held while a settings update reads, merges and swaps SETTINGS.
+SETTINGS_LOCK = threading.Lock()
 
 LOOP_INTERVAL = 0.5
+WRITE_INTERVAL = 0.1
+PAGE_REPLY_WAIT = 0.1
+
+CPU_SAMPLE_INTERVAL = 0.5
+GPU_SAMPLE_INTERVAL = 1.0
+SENSOR_STALE_AFTER = 5.0
+GPU_IDLE_AFTER = 5.0
+HWMON_IDLE_AFTER = 5.0
+FALLBACK_PWM = int(round(80 / 100 * 255))
+# A calibration sweep starts with the fans stopped; it gives up above this.
+CALIBRATION_ABORT_TEMP = 90
+
+RECONNECT_BACKOFF_MIN = 0.25
+RECONNECT_BACKOFF_MAX = 1.0
+# Errors other than USB ones back off up to this many seconds (well inside
+# WatchdogSec) and stop the daemon once this many happen in a row.
+ERROR_BACKOFF_MAX = 4.0
+ERROR_LIMIT = 5
 
 
 # ==============================
@@ -118,6 +740,15 @@ def displayDetected(fans: List[Fan]):
 # USB DEVICE HANDLING
 # ==============================
 def open_device(pid: Literal[32832]):
+    if USB_BACKEND == "emulator":
+        import emulator
+
+        return emulator.open_device(pid)
+    if USB_BACKEND == "libusb1":
+        import usbasync
+
+        return usbasync.open_device(VID, pid, USB_IN if pid == RX else None)
+
     dev = usb.core.find(idVendor=VID, idProduct=pid)
     if dev is None:
         raise RuntimeError(f"Device {pid:04x} not found")
@@ -130,7 +761,132 @@ def open_device(pid: Literal[32832]):
     return dev
 
 
+def base_device(dev: usb.core.Device) -> usb.core.Device:
+    """The device under the flight recorder, capture and dry-run wrappers."""
+    wrappers = (flightrec.RecorderDevice, usbtrace.RecordingDevice)
+    if DRY_RUN_LOG is not None:
+        import shadow
+
+        wrappers += (shadow.DryRunDevice,)
+    while isinstance(dev, wrappers):
+        dev = dev.dev
+    return dev
+
+
+def close_device(dev: usb.core.Device):
+    dev = base_device(dev)
+    if USB_BACKEND == "emulator":
+        return
+    if USB_BACKEND == "libusb1":
+        dev.close()
+        return
+    usb.util.dispose_resources(dev)
+
+
+class UsbLink:
+    """Owns the TX/RX handles so either can be re-claimed after a hotplug event."""
+
+    def __init__(self):
+        self.devices: Dict[int, usb.core.Device] = {}
+
+    @property
+    def tx(self) -> usb.core.Device:
+        return self.devices.get(TX)
+
+    @property
+    def rx(self) -> usb.core.Device:
+        return self.devices.get(RX)
+
+    def open(self, pids: Iterable[int] = (TX, RX)):
+        for pid in pids:
+            if pid in self.devices:
+                continue
+            dev = open_device(pid)
+            if DRY_RUN_LOG is not None and pid == TX:
+                import shadow
+
+                dev = shadow.DryRunDevice(dev, DRY_RUN_LOG)
+            if TRACE:
+                dev = usbtrace.RecordingDevice(
+                    dev,
+                    TRACE,
+                    usbtrace.DEVICE_TX if pid == TX else usbtrace.DEVICE_RX,
+                )
+            if FLIGHT:
+                dev = flightrec.RecorderDevice(
+                    dev,
+                    FLIGHT,
+                    flightrec.DEVICE_TX if pid == TX else flightrec.DEVICE_RX,
+                )
+            self.devices[pid] = dev
+
+    def close(self, pids: Iterable[int] = (TX, RX)):
+        for pid in pids:
+            dev = self.devices.pop(pid, None)
+            if dev is None:
+                continue
+            try:
+                close_device(dev)
+            except Exception:
+                pass
+
+
+def is_disconnect(e: Exception) -> bool:
+    return isinstance(e, usb.core.USBError) and e.errno == errno.ENODEV
+
+
+def reconnect(
+    link: UsbLink, monitor: Optional[UeventMonitor], pids: Iterable[int] = (TX, RX)
+):
+    pids = list(pids)
+    link.close(pids)
+    print("Wireless controller disconnected, waiting for it to come back...")
+
+    NOTIFIER.status("Waiting for the wireless controller")
+    delay = RECONNECT_BACKOFF_MIN
+    while True:
+        NOTIFIER.watchdog()
+        try:
+            link.open(pids)
+            print("Wireless controller reconnected")
+            NOTIFIER.status("Wireless controller reconnected")
+            return
+        except Exception:
+            pass
+
+        if monitor:
+            if any(action == "add" for action, _ in monitor.poll(delay)):
+                delay = RECONNECT_BACKOFF_MIN
+                continue
+        else:
+            time.sleep(delay)
+        delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+
+
+def dump_flight_recorder(reason: str, detail: Optional[str] = None):
+    if FLIGHT is None:
+        return None
+    try:
+        path = FLIGHT.dump(reason, detail)
+    except OSError as e:
+        print(f"Unable to write the flight record: {e}")
+        return None
+    print(f"Flight record written to {path}")
+    return path
+
+
 def fetch_page(rx: usb.core.Device, page_count: int):
+    if USB_BACKEND == "libusb1":
+        import usbasync
+
+        try:
+            return rx.fetch_page(page_count, USB_OUT, PAGE_REPLY_WAIT)
+        except usb.core.USBError as e:
+            if is_disconnect(e) or isinstance(e, usbasync.ReadsStopped):
+                raise
+            print(e)
+            return bytearray()
+
     cmd = bytearray(64)
     cmd[0] = GET_DEV_CMD
     cmd[1] = page_count & 0xFF
@@ -159,13 +915,21 @@ def list_fans(rx: usb.core.Device, last_fans_data: List[Fan] = []):
     if not payload or payload is None or payload == b"":
         return []
     count = payload[1]
+    # Each RF page holds MAX_DEVICES_PAGE records after a 4 byte header.
+    pages = -(-count // MAX_DEVICES_PAGE)
+    if pages > 1:
+        payload = fetch_page(rx, pages)
+        if not payload:
+            return []
     fans: List[Fan] = []
-    offset = 4
 
-    for _ in range(count):
+    for index in range(count):
+        page, slot = divmod(index, MAX_DEVICES_PAGE)
+        offset = page * RF_PAGE_STRIDE + 4 + slot * 42
         record = payload[offset : offset + 42]
-        offset += 42
 
+        if len(record) < 42:
+            break
         if record[41] != 28:
             continue
 
@@ -201,6 +965,13 @@ def list_fans(rx: usb.core.Device, last_fans_data: List[Fan] = []):
 # CPU/GPU TEMP
 # ==============================
 def get_cpu_temp():
+    if USB_BACKEND == "emulator":
+        import emulator
+
+        temp = emulator.synthetic_temp("cpu")
+        if temp is not None:
+            return temp
+
     temps = psutil.sensors_temperatures()
     tctl = None
     values = []
@@ -215,12 +986,20 @@ def get_cpu_temp():
     return tctl if tctl else (max(values) if values else None)
 
 
-def get_gpu_temp():
+def get_gpu_stats():
+    """Return the hottest GPU temperature and the busiest GPU utilization."""
+    if USB_BACKEND == "emulator":
+        import emulator
+
+        temp = emulator.synthetic_temp("gpu")
+        if temp is not None:
+            return temp, None
+
     try:
         output = subprocess.check_output(
             [
                 "nvidia-smi",
-                "--query-gpu=temperature.gpu",
+                "--query-gpu=temperature.gpu,utilization.gpu",
                 "--format=csv,noheader,nounits",
             ],
             stderr=subprocess.DEVNULL,
@@ -232,18 +1011,43 @@ def get_gpu_temp():
         subprocess.CalledProcessError,
         subprocess.TimeoutExpired,
     ):
-        return None
+        return None, None
 
-    values: List[float] = []
+    temps: List[float] = []
+    utils: List[float] = []
     for line in output.splitlines():
-        line = line.strip()
-        if not line:
-            continue
+        parts = [p.strip() for p in line.split(",")]
         try:
-            values.append(float(line))
+            temps.append(float(parts[0]))
         except ValueError:
             continue
-    return max(values) if values else None
+        try:
+            utils.append(float(parts[1]))
+        except (IndexError, ValueError):
+            pass
+    return (
+        max(temps) if temps else None,
+        max(utils) if utils else None,
+    )
+
+
+def get_gpu_temp():
+    return get_gpu_stats()[0]
+
+
+def get_hwmon_temps() -> Dict[str, Dict[str, float]]:
+    """Every hwmon temperature as ``{chip: {label: value}}`` for named sources."""
+    temps: Dict[str, Dict[str, float]] = {}
+    for chip, entries in psutil.sensors_temperatures().items():
+        readings = temps.setdefault(chip, {})
+        for i, e in enumerate(entries):
+            if e.current is not None:
+                readings[e.label or f"temp{i + 1}"] = e.current
+    return temps
+
+
+def get_cpu_load():
+    return psutil.cpu_percent(interval=None)
 
 
 # ==============================
@@ -266,23 +1070,26 @@ def temp_to_pwm(temp: float, linear: LinearMode):
 
 
 def curve_to_pwm(temp: float, curve: CurveMode):
-    points = curve.points
-
-    if temp <= points[0].temp_c:
-        return int(round(points[0].percent / 100 * 255))
-    if temp >= points[-1].temp_c:
-        return int(round(points[-1].percent / 100 * 255))
-
-    for i in range(1, len(points)):
-        left = points[i - 1]
-        right = points[i]
-        if temp <= right.temp_c:
-            ratio = (temp - left.temp_c) / (right.temp_c - left.temp_c)
-            pwm_percent = left.percent + ratio * (right.percent - left.percent)
-            pwm_percent = clamp(pwm_percent, 0, 100)
-            return int(round(pwm_percent / 100 * 255))
-
-    return int(round(points[-1].percent / 100 * 255))
+    return CompiledCurve(curve.points)(temp)
+
+
+def fan_curve_pwm(
+    source: str,
+    curve: CompiledCurve,
+    cpu_temp: Optional[float],
+    gpu_temp: Optional[float],
+    named: Dict[str, Optional[float]],
+) -> Optional[int]:
+    if source == "cpu":
+        temp = cpu_temp
+    elif source == "gpu":
+        temp = gpu_temp if gpu_temp is not None else cpu_temp
+    elif source == "mix":
+        # Curves are non-decreasing, so the curve of the hotter source wins.
+        temp = max((t for t in (cpu_temp, gpu_temp) if t is not None), default=None)
+    else:
+        temp = named.get(source)
+    return None if temp is None else curve(temp)
 
 
 # ==============================
@@ -315,150 +1122,625 @@ def build_data(fan: Fan, seq):
 # ==============================
 # MAIN LOOP
 # ==============================
-def fan_control_loop(rx: usb.core.Device, tx: usb.core.Device):
-    global SETTINGS
-    last_fans_amount = 0
-    warned_missing_gpu_temp = False
-    last_fans_data: List[Fan] = []
+class SensorSamplers:
+    def __init__(self):
+        self.cpu_temp = Sampler(
+            "cpu-temp", get_cpu_temp, CPU_SAMPLE_INTERVAL, SENSOR_STALE_AFTER
+        )
+        self.cpu_load = Sampler(
+            "cpu-load", get_cpu_load, CPU_SAMPLE_INTERVAL, SENSOR_STALE_AFTER
+        )
+        self.gpu = Sampler(
+            "gpu",
+            get_gpu_stats,
+            GPU_SAMPLE_INTERVAL,
+            SENSOR_STALE_AFTER,
+            idle_after=GPU_IDLE_AFTER,
+        )
+        self.hwmon = Sampler(
+            "hwmon",
+            get_hwmon_temps,
+            CPU_SAMPLE_INTERVAL,
+            SENSOR_STALE_AFTER,
+            idle_after=HWMON_IDLE_AFTER,
+        )
 
-    err = 0
-    while True:
-        try:
-            cpu_temp = get_cpu_temp()
-            gpu_mac_set = set(SETTINGS.gpu_macs)
-            mix_mac_set = set(SETTINGS.mix_macs)
-            needs_gpu_temp = len(gpu_mac_set) > 0 or len(mix_mac_set) > 0
-            gpu_temp = get_gpu_temp() if needs_gpu_temp else None
-
-            cpu_target_pwm: Optional[int] = None
-            gpu_target_pwm: Optional[int] = None
-
-            if SETTINGS.mode == FanMode.linear:
-                if cpu_temp is not None:
-                    cpu_target_pwm = temp_to_pwm(cpu_temp, SETTINGS.linear)
-
-                if needs_gpu_temp and gpu_temp is not None:
-                    gpu_target_pwm = temp_to_pwm(gpu_temp, SETTINGS.gpu_linear)
-                    warned_missing_gpu_temp = False
-                elif needs_gpu_temp and cpu_temp is not None:
-                    gpu_target_pwm = temp_to_pwm(cpu_temp, SETTINGS.gpu_linear)
-                    if DEV_MODE and not warned_missing_gpu_temp:
-                        print(
-                            "GPU temp unavailable; GPU/mix fan groups are temporarily using CPU temperature with GPU linear mapping."
-                        )
-                        warned_missing_gpu_temp = True
-                else:
-                    warned_missing_gpu_temp = False
+    def start(self):
+        self.cpu_temp.start()
+        self.cpu_load.start()
+        self.gpu.start()
+        self.hwmon.start()
+        return self
+
+
+def make_router(engine: str = TARGET_ENGINE):
+    """A vector.VectorRouter for the numpy engine, None for the Python one."""
+    if engine != "numpy":
+        return None
+    import vector
+
+    try:
+        return vector.VectorRouter()
+    except RuntimeError as e:
+        print(f"{e}; using the Python target engine.")
+        return None
+
+
+class LoopState:
+    def __init__(
+        self,
+        samplers: Optional[SensorSamplers] = None,
+        quiet: bool = False,
+        engine: str = TARGET_ENGINE,
+    ):
+        self.samplers = samplers
+        self.quiet = quiet
+        # Replays swap in the recorded tick times.
+        self.clock = time.monotonic
+        self.last_fans_amount = 0
+        self.warned_missing_gpu_temp = False
+        self.warned_stale: List[str] = []
+        self.force_write = False
+        # Why the last tick was skipped, for the service status.
+        self.idle_reason = ""
+        self.last_fans_data: List[Fan] = []
+        self.pid = {"cpu": PidController(), "gpu": PidController()}
+        self.rpm = rpmcontrol.RpmController()
+        self.curves: Optional[CurveSet] = None
+        self.router = make_router(engine)
+
+    def note(self, message: str):
+        if not self.quiet:
+            print(message)
+
+    def read_cpu_temp(self):
+        if self.samplers is None:
+            return get_cpu_temp(), False
+        return self.samplers.cpu_temp.get()
+
+    def read_cpu_load(self) -> float:
+        if self.samplers is None:
+            return get_cpu_load()
+        return self.samplers.cpu_load.get()[0] or 0.0
+
+    def read_gpu(self, with_util: bool):
+        """Return ``(temp, util, stale)`` for the GPU source."""
+        if self.samplers is None:
+            if with_util:
+                temp, util = get_gpu_stats()
+                return temp, util, False
+            return get_gpu_temp(), None, False
+        stats, stale = self.samplers.gpu.get()
+        temp, util = stats if stats else (None, None)
+        return temp, util, stale
+
+    def read_hwmon(self):
+        if self.samplers is None:
+            return get_hwmon_temps(), False
+        return self.samplers.hwmon.get()
+
+
+def display_tick(
+    cpu_temp: Optional[float],
+    gpu_temp: Optional[float],
+    fans: List[Fan],
+    gpu_mac_set: set,
+    mix_mac_set: set,
+):
+    clear_console()
+    displayDetected(fans)
+    cpu_text = f"{cpu_temp:.1f} °C" if cpu_temp is not None else "N/A"
+    gpu_text = f"{gpu_temp:.1f} °C" if gpu_temp is not None else "N/A"
+    print(f"\n\nCPU Temp: {cpu_text}")
+    print(f"GPU Temp: {gpu_text}\n")
+    print(f"{'ID':>3}  {'Fan Address':17} | Fans | Src | Cur % | Tgt % | RPM")
+    print("-" * 78)
+
+    for idx, d in enumerate(fans):
+        mac_lower = d.mac.lower()
+        if mac_lower in gpu_mac_set:
+            src = "GPU"
+        elif mac_lower in mix_mac_set:
+            src = "MIX"
+        else:
+            src = "CPU"
+
+        cur_pct = int(d.pwm / 255 * 100)
+        tgt_pct = int(d.target_pwm / 255 * 100)
+
+        rpm = ", ".join(str(r) for r in d.rpm if r > 0)
+
+        print(
+            f"{idx:>3}  {d.mac:17} | "
+            f"{d.fan_count:>4} | "
+            f"{src:>3} | "
+            f"{cur_pct:>5}% | "
+            f"{tgt_pct:>5}% | "
+            f"{rpm}"
+        )
+
+
+def route_targets(
+    fans: List[Fan],
+    cpu_target_pwm: Optional[int],
+    gpu_target_pwm: Optional[int],
+    gpu_mac_set: set,
+    mix_mac_set: set,
+    curve_targets: Dict[str, Optional[int]],
+    force: bool,
+) -> List[Fan]:
+    """Set each fan's target from its source group and return the changed fans."""
+    updated_fans: List[Fan] = []
+
+    for f in fans:
+        mac = f.mac.lower()
+
+        if mac in curve_targets:
+            target_pwm = curve_targets[mac]
+            if target_pwm is None:
+                target_pwm = f.pwm
+        elif mac in mix_mac_set:
+            if cpu_target_pwm is not None and gpu_target_pwm is not None:
+                target_pwm = max(cpu_target_pwm, gpu_target_pwm)
+            elif cpu_target_pwm is not None:
+                target_pwm = cpu_target_pwm
+            elif gpu_target_pwm is not None:
+                target_pwm = gpu_target_pwm
             else:
-                if cpu_temp is not None:
-                    cpu_target_pwm = curve_to_pwm(cpu_temp, SETTINGS.cpu_curve)
-
-                if needs_gpu_temp and gpu_temp is not None:
-                    gpu_target_pwm = curve_to_pwm(gpu_temp, SETTINGS.gpu_curve)
-                    warned_missing_gpu_temp = False
-                elif needs_gpu_temp and cpu_temp is not None:
-                    gpu_target_pwm = curve_to_pwm(cpu_temp, SETTINGS.cpu_curve)
-                    if DEV_MODE and not warned_missing_gpu_temp:
-                        print(
-                            "GPU temp unavailable; GPU/mix fan groups are temporarily using the CPU curve."
-                        )
-                        warned_missing_gpu_temp = True
-                else:
-                    warned_missing_gpu_temp = False
-
-            if cpu_target_pwm is None and gpu_target_pwm is None:
-                time.sleep(1)
-                continue
+                target_pwm = f.pwm
+        elif mac in gpu_mac_set:
+            if gpu_target_pwm is not None:
+                target_pwm = gpu_target_pwm
+            elif cpu_target_pwm is not None:
+                target_pwm = cpu_target_pwm
+            else:
+                target_pwm = f.pwm
+        else:
+            if cpu_target_pwm is not None:
+                target_pwm = cpu_target_pwm
+            else:
+                target_pwm = f.pwm
+
+        if target_pwm != f.target_pwm or force:
+            updated_fans.append(f)
+
+        f.target_pwm = target_pwm
+        f.pwm = f.target_pwm
+    return updated_fans
+
+
+class GroupTargets:
+    """The sensor readings of one tick and the targets of the CPU/GPU groups."""
+
+    __slots__ = (
+        "now",
+        "cpu_temp",
+        "gpu_temp",
+        "cpu_load",
+        "gpu_util",
+        "cpu_stale",
+        "gpu_stale",
+        "sensors",
+        "sensors_stale",
+        "cpu_pwm",
+        "gpu_pwm",
+        "cpu_rpm",
+        "gpu_rpm",
+        "named",
+        "fan_curves",
+        "gpu_mac_set",
+        "mix_mac_set",
+    )
 
-            fans = list_fans(rx, last_fans_data)
 
-            if last_fans_amount != 0 and len(fans) == 0:
-                continue
-            last_fans_amount = len(fans)
-
-            updated_fans: List[str] = []
-
-            for f in fans:
-                mac = f.mac.lower()
-
-                if mac in mix_mac_set:
-                    if cpu_target_pwm is not None and gpu_target_pwm is not None:
-                        target_pwm = max(cpu_target_pwm, gpu_target_pwm)
-                    elif cpu_target_pwm is not None:
-                        target_pwm = cpu_target_pwm
-                    elif gpu_target_pwm is not None:
-                        target_pwm = gpu_target_pwm
-                    else:
-                        target_pwm = f.pwm
-                elif mac in gpu_mac_set:
-                    if gpu_target_pwm is not None:
-                        target_pwm = gpu_target_pwm
-                    elif cpu_target_pwm is not None:
-                        target_pwm = cpu_target_pwm
-                    else:
-                        target_pwm = f.pwm
-                else:
-                    if cpu_target_pwm is not None:
-                        target_pwm = cpu_target_pwm
-                    else:
-                        target_pwm = f.pwm
-
-                if target_pwm != f.target_pwm:
-                    updated_fans.append(f.mac)
-
-                f.target_pwm = target_pwm
-                f.pwm = f.target_pwm
-            for f in fans:
-                if not f.mac in updated_fans:
-                    continue
-                for i in range(len(fans)):
-                    tx.write(USB_OUT, build_data(f, i))
-                time.sleep(0.1)
-
-            update_state(cpu_temp, gpu_temp, fans)
-
-            if DEV_MODE:
-                clear_console()
-                displayDetected(fans)
-                cpu_text = f"{cpu_temp:.1f} °C" if cpu_temp is not None else "N/A"
-                gpu_text = f"{gpu_temp:.1f} °C" if gpu_temp is not None else "N/A"
-                print(f"\n\nCPU Temp: {cpu_text}")
-                print(f"GPU Temp: {gpu_text}\n")
-                print(
-                    f"{'ID':>3}  {'Fan Address':17} | Fans | Src | Cur % | Tgt % | RPM"
+def group_targets(settings: Settings, state: LoopState) -> GroupTargets:
+    """Read the sensors and compute the group targets for ``settings``."""
+    g = GroupTargets()
+    g.now = state.clock()
+    g.cpu_load = None
+    g.cpu_temp, g.cpu_stale = state.read_cpu_temp()
+    if state.curves is None or state.curves.settings is not settings:
+        state.curves = CurveSet(settings, state.curves)
+    curves = state.curves
+    g.fan_curves = curves.fans if settings.mode == FanMode.curve else {}
+    g.gpu_mac_set = set(settings.gpu_macs)
+    g.mix_mac_set = set(settings.mix_macs)
+    needs_gpu_temp = (
+        len(g.gpu_mac_set) > 0
+        or len(g.mix_mac_set) > 0
+        or (settings.mode == FanMode.curve and curves.needs_gpu)
+    )
+    cpu_temp = g.cpu_temp
+    gpu_temp: Optional[float] = None
+    gpu_util: Optional[float] = None
+    g.gpu_stale = False
+    if needs_gpu_temp:
+        gpu_temp, gpu_util, g.gpu_stale = state.read_gpu(settings.mode == FanMode.pid)
+    g.gpu_temp = gpu_temp
+    g.gpu_util = gpu_util
+
+    cpu_target_pwm: Optional[int] = None
+    gpu_target_pwm: Optional[int] = None
+    cpu_target_rpm: Optional[float] = None
+    gpu_target_rpm: Optional[float] = None
+
+    if settings.mode == FanMode.linear:
+        if cpu_temp is not None:
+            cpu_target_pwm = temp_to_pwm(cpu_temp, settings.linear)
+
+        if needs_gpu_temp and gpu_temp is not None:
+            gpu_target_pwm = temp_to_pwm(gpu_temp, settings.gpu_linear)
+            state.warned_missing_gpu_temp = False
+        elif needs_gpu_temp and cpu_temp is not None:
+            gpu_target_pwm = temp_to_pwm(cpu_temp, settings.gpu_linear)
+            if DEV_MODE and not state.warned_missing_gpu_temp:
+                state.note(
+                    "GPU temp unavailable; GPU/mix fan groups are temporarily using CPU temperature with GPU linear mapping."
+                )
+                state.warned_missing_gpu_temp = True
+        else:
+            state.warned_missing_gpu_temp = False
+    elif settings.mode == FanMode.pid:
+        pid = settings.pid
+        if cpu_temp is not None:
+            g.cpu_load = state.read_cpu_load()
+            cpu_target_pwm = state.pid["cpu"].update(
+                cpu_temp,
+                pid.cpu_target_temp,
+                pid.cpu_load_gain * g.cpu_load,
+                pid,
+                g.now,
+            )
+
+        if needs_gpu_temp and gpu_temp is not None:
+            gpu_target_pwm = state.pid["gpu"].update(
+                gpu_temp,
+                pid.gpu_target_temp,
+                pid.gpu_load_gain * (gpu_util or 0),
+                pid,
+                g.now,
+            )
+            state.warned_missing_gpu_temp = False
+        elif needs_gpu_temp and cpu_temp is not None:
+            gpu_target_pwm = cpu_target_pwm
+            if DEV_MODE and not state.warned_missing_gpu_temp:
+                state.note(
+                    "GPU temp unavailable; GPU/mix fan groups are temporarily following the CPU controller."
                 )
-                print("-" * 78)
-
-                for idx, d in enumerate(fans):
-                    mac_lower = d.mac.lower()
-                    if mac_lower in gpu_mac_set:
-                        src = "GPU"
-                    elif mac_lower in mix_mac_set:
-                        src = "MIX"
-                    else:
-                        src = "CPU"
-
-                    cur_pct = int(d.pwm / 255 * 100)
-                    tgt_pct = int(d.target_pwm / 255 * 100)
-
-                    rpm = ", ".join(str(r) for r in d.rpm if r > 0)
-
-                    print(
-                        f"{idx:>3}  {d.mac:17} | "
-                        f"{d.fan_count:>4} | "
-                        f"{src:>3} | "
-                        f"{cur_pct:>5}% | "
-                        f"{tgt_pct:>5}% | "
-                        f"{rpm}"
-                    )
+                state.warned_missing_gpu_temp = True
+        else:
+            state.warned_missing_gpu_temp = False
+    elif settings.mode == FanMode.rpm:
+        if cpu_temp is not None:
+            cpu_target_rpm = curves.cpu_rpm(cpu_temp)
+
+        if needs_gpu_temp and gpu_temp is not None:
+            gpu_target_rpm = curves.gpu_rpm(gpu_temp)
+            state.warned_missing_gpu_temp = False
+        elif needs_gpu_temp and cpu_temp is not None:
+            gpu_target_rpm = curves.gpu_rpm(cpu_temp)
+            if DEV_MODE and not state.warned_missing_gpu_temp:
+                state.note(
+                    "GPU temp unavailable; GPU/mix fan groups are temporarily using CPU temperature with the GPU RPM curve."
+                )
+                state.warned_missing_gpu_temp = True
+        else:
+            state.warned_missing_gpu_temp = False
+
+        # Each fan gets its own PWM below; these only make the tick go ahead.
+        if cpu_target_rpm is not None:
+            cpu_target_pwm = rpmcontrol.DEFAULT_TABLE.pwm_for(cpu_target_rpm)
+        if gpu_target_rpm is not None:
+            gpu_target_pwm = rpmcontrol.DEFAULT_TABLE.pwm_for(gpu_target_rpm)
+    else:
+        if cpu_temp is not None:
+            cpu_target_pwm = curves.cpu(cpu_temp)
+
+        if needs_gpu_temp and gpu_temp is not None:
+            gpu_target_pwm = curves.gpu(gpu_temp)
+            state.warned_missing_gpu_temp = False
+        elif needs_gpu_temp and cpu_temp is not None:
+            gpu_target_pwm = curves.cpu(cpu_temp)
+            if DEV_MODE and not state.warned_missing_gpu_temp:
+                state.note(
+                    "GPU temp unavailable; GPU/mix fan groups are temporarily using the CPU curve."
+                )
+                state.warned_missing_gpu_temp = True
+        else:
+            state.warned_missing_gpu_temp = False
+
+    g.named = {}
+    g.sensors = None
+    g.sensors_stale = False
+    if g.fan_curves and curves.needs_sources:
+        if curves.needs_sensors:
+            g.sensors, g.sensors_stale = state.read_hwmon()
+        g.named = curves.graph.evaluate(
+            {"cpu": cpu_temp, "gpu": gpu_temp}, g.sensors, g.now
+        )
+
+    stale = [
+        name
+        for name, flag in (
+            ("CPU", g.cpu_stale),
+            ("GPU", g.gpu_stale),
+            ("hwmon", g.sensors_stale),
+        )
+        if flag
+    ]
+    if g.cpu_stale:
+        cpu_target_pwm = FALLBACK_PWM
+        cpu_target_rpm = None
+    if g.gpu_stale:
+        gpu_target_pwm = FALLBACK_PWM
+        gpu_target_rpm = None
+    if stale != state.warned_stale:
+        if stale:
+            state.note(
+                f"{'/'.join(stale)} sensor stopped updating; using fallback PWM {FALLBACK_PWM}."
+            )
+        state.warned_stale = stale
+
+    g.cpu_pwm = cpu_target_pwm
+    g.gpu_pwm = gpu_target_pwm
+    g.cpu_rpm = cpu_target_rpm
+    g.gpu_rpm = gpu_target_rpm
+    return g
+
+
+def fan_targets(
+    settings: Settings, state: LoopState, g: GroupTargets, fans: List[Fan]
+) -> Dict[str, Optional[int]]:
+    """Targets of the fans that do not simply follow their source group."""
+    curve_targets: Dict[str, Optional[int]] = {}
+    for mac, (source, curve, inputs) in g.fan_curves.items():
+        if (
+            (g.cpu_stale and "cpu" in inputs)
+            or (g.gpu_stale and "gpu" in inputs)
+            or (g.sensors_stale and "sensor" in inputs)
+        ):
+            curve_targets[mac] = FALLBACK_PWM
+        else:
+            curve_targets[mac] = fan_curve_pwm(
+                source, curve, g.cpu_temp, g.gpu_temp, g.named
+            )
+
+    if settings.mode == FanMode.rpm:
+        curve_targets.update(
+            state.rpm.targets(
+                fans,
+                g.cpu_rpm,
+                g.gpu_rpm,
+                g.gpu_mac_set,
+                g.mix_mac_set,
+                settings.rpm,
+                settings.calibrations,
+                g.now,
+            )
+        )
+    return curve_targets
+
+
+def control_tick(rx: usb.core.Device, tx: usb.core.Device, state: LoopState) -> bool:
+    """Run one sense/compute/write pass of the control loop.
+
+    Returns True when the tick completed, False when it was skipped because no
+    temperature or no fan data was available.
+    """
+    started = time.perf_counter_ns()
+    settings = SETTINGS
+    g = group_targets(settings, state)
+    if TRACE:
+        TRACE.tick(g.cpu_temp, g.gpu_temp, g.now, g.cpu_load, g.gpu_util, g.sensors)
+
+    if g.cpu_pwm is None and g.gpu_pwm is None:
+        state.idle_reason = "No temperature sensor available, fans left as they are"
+        time.sleep(1)
+        return False
+    compute_ns = time.perf_counter_ns() - started
+
+    fans = list_fans(rx, state.last_fans_data)
+
+    if state.last_fans_amount != 0 and len(fans) == 0:
+        state.idle_reason = "No fan data from the wireless controller"
+        return False
+    state.last_fans_amount = len(fans)
+
+    started = time.perf_counter_ns()
+    curve_targets = fan_targets(settings, state, g, fans)
+
+    calibration = CALIBRATION
+    calibrating = calibration is not None and not calibration.done
+    if calibrating:
+        if g.cpu_temp is not None and g.cpu_temp >= CALIBRATION_ABORT_TEMP:
+            calibration.abort(f"CPU reached {g.cpu_temp:.0f} °C")
+        else:
+            for mac in calibration.macs:
+                curve_targets[mac] = calibration.target()
+
+    candidate = SHADOW if not calibrating else None
+    if candidate is not None:
+        shadow_fans = [f.model_copy() for f in fans]
+
+    route = state.router.route if state.router else route_targets
+    updated_fans = route(
+        fans,
+        g.cpu_pwm,
+        g.gpu_pwm,
+        g.gpu_mac_set,
+        g.mix_mac_set,
+        curve_targets,
+        state.force_write,
+    )
+    compute_ns += time.perf_counter_ns() - started
+    for f in updated_fans:
+        for i in range(len(fans)):
+            tx.write(USB_OUT, build_data(f, i))
+        NOTIFIER.watchdog()
+        time.sleep(WRITE_INTERVAL)
+    state.force_write = False
+
+    if candidate is not None:
+        candidate.tick(
+            state, shadow_fans, fans, len(updated_fans) * len(fans), compute_ns
+        )
+
+    # The fans do not follow unsent targets, so their speed proves nothing.
+    if DRY_RUN_LOG is not None:
+        paused = [f.mac.lower() for f in fans]
+    else:
+        paused = calibration.macs if calibrating else ()
+    HEALTH.update(fans, time.time(), paused)
+    update_state(g.cpu_temp, g.gpu_temp, fans)
+
+    if calibrating:
+        calibration.observe(fans, g.now)
+        if calibration.done:
+            finish_calibration(calibration)
+
+    if DEV_MODE:
+        display_tick(g.cpu_temp, g.gpu_temp, fans, g.gpu_mac_set, g.mix_mac_set)
+    state.last_fans_data = fans
+    return True
+
+
+class ShadowEngine:
+    """Runs a candidate configuration next to the live engine without writing.
+
+    Each tick it reads the same samplers and the same fan list as the live
+    loop, computes and routes its own targets, and records how they differ
+    from what the live engine sent. It has its own PID, RPM and smoothing
+    state, so a candidate controller evolves as it would on its own, but it
+    sees the temperatures the live engine produces.
+    """
+
+    def __init__(self, patch: dict, engine: str):
+        self.patch = patch
+        self.engine = engine
+        self.base = SETTINGS
+        self.settings = merge_settings(SETTINGS, patch)
+        self.state: Optional[LoopState] = None
+        self.targets: Dict[str, int] = {}
+        import shadow
+
+        self.stats = shadow.ShadowStats()
+        self.frames = shadow.FrameLog()
+
+    def current_settings(self) -> Settings:
+        """The patch applied to the live settings, following live changes."""
+        base = SETTINGS
+        if base is not self.base:
+            self.base = base
+            try:
+                self.settings = merge_settings(base, self.patch)
+            except ValueError as e:
+                print(f"Shadow settings no longer apply, keeping the last ones: {e}")
+        return self.settings
+
+    def tick(
+        self,
+        live: LoopState,
+        fans: List[Fan],
+        live_fans: List[Fan],
+        live_writes: int,
+        live_ns: int,
+    ):
+        if self.state is None:
+            self.state = LoopState(live.samplers, quiet=True, engine=self.engine)
+        state = self.state
+        settings = self.current_settings()
+
+        started = time.perf_counter_ns()
+        g = group_targets(settings, state)
+        if g.cpu_pwm is None and g.gpu_pwm is None:
+            return
+        for f in fans:
+            f.target_pwm = self.targets.get(f.mac.lower(), f.target_pwm)
+        curve_targets = fan_targets(settings, state, g, fans)
+        route = state.router.route if state.router else route_targets
+        updated_fans = route(
+            fans,
+            g.cpu_pwm,
+            g.gpu_pwm,
+            g.gpu_mac_set,
+            g.mix_mac_set,
+            curve_targets,
+            False,
+        )
+        shadow_ns = time.perf_counter_ns() - started
+
+        for f in updated_fans:
+            for i in range(len(fans)):
+                self.frames.add(build_data(f, i))
+        self.targets = {f.mac.lower(): f.target_pwm for f in fans}
+        self.stats.record(
+            {f.mac.lower(): f.target_pwm for f in live_fans},
+            self.targets,
+            live_writes,
+            len(updated_fans) * len(fans),
+            live_ns,
+            shadow_ns,
+        )
+
+    def status(self, ticks: int) -> ShadowStatus:
+        return ShadowStatus(
+            running=True,
+            engine=self.engine,
+            settings=self.patch,
+            summary=self.stats.summary(),
+            ticks=self.stats.last(ticks),
+            frames=self.frames.recent(),
+        )
+
+
+def fan_control_loop(link: UsbLink):
+    state = LoopState(SensorSamplers().start())
+    monitor = UeventMonitor.open(VID) if USB_BACKEND in ("pyusb", "libusb1") else None
+
+    err = 0
+    usb_err = 0
+    reported: Optional[str] = None
+    while True:
+        try:
+            if monitor:
+                removed = {
+                    pid
+                    for action, pid in monitor.poll()
+                    if action == "remove" and pid in (TX, RX)
+                }
+                if removed:
+                    reconnect(link, monitor, removed)
+                    state.force_write = True
+                    reported = None
+            controlling = control_tick(link.rx, link.tx, state)
             err = 0
-            last_fans_data = fans
+            if controlling:
+                usb_err = 0
+                status = f"Controlling {len(shared_state.fans)} fan group(s)"
+            else:
+                status = state.idle_reason
+            if status != reported:
+                NOTIFIER.status(status)
+                reported = status
+        except usb.core.USBError as e:
+            if usb_err > 3 or is_disconnect(e):
+                print(f"USB error: {e}")
+                if not is_disconnect(e):
+                    dump_flight_recorder("usb-errors", repr(e))
+                reconnect(link, monitor)
+                state.force_write = True
+                reported = None
+                usb_err = 0
+            else:
+                usb_err += 1
         except Exception as e:
-            if err > 3:
+            err += 1
+            print(f"Fan control error ({err}/{ERROR_LIMIT}): {e!r}")
+            if err >= ERROR_LIMIT:
                 raise e
-            else:
-                err += 1
+            time.sleep(min(LOOP_INTERVAL * 2**err, ERROR_BACKOFF_MAX))
         finally:
+            NOTIFIER.watchdog()
             time.sleep(LOOP_INTERVAL)
 
 
@@ -466,8 +1748,7 @@ def fan_control_loop(rx: usb.core.Device, tx: usb.core.Device):
 # ENTRY
 # ==============================
 if __name__ == "__main__":
-    tx = None
-    rx = None
+    link = UsbLink()
     try:
         current_ver = extractVersion(APP_RAW_VERSION)
         print(f"Current Version: {APP_RAW_VERSION}")
@@ -475,44 +1756,70 @@ if __name__ == "__main__":
         print(f"- Release Candidate: {current_ver.rc}")
         print(f"- Build Release: {current_ver.release}")
         print(f"Start sock server at {SOCKET_PATH}")
-        api_thread = threading.Thread(target=start_api_server, daemon=True)
+        PERSISTER = SettingsPersister().start()
+        signal.signal(
+            signal.SIGUSR1, lambda signum, frame: dump_flight_recorder("sigusr1")
+        )
+        if USB_BACKEND != "pyusb":
+            print(f"USB backend: {USB_BACKEND}")
+        if API_SERVER != "fastapi":
+            print(f"API server: {API_SERVER}")
+        if DRY_RUN:
+            import shadow
+
+            DRY_RUN_LOG = shadow.FrameLog()
+            print("Dry run: frames for the fans are recorded but not sent")
+        api_thread = threading.Thread(
+            target=start_api_server,
+            args=(bind_api_socket(), bind_tcp_socket()),
+            daemon=True,
+        )
         api_thread.start()
 
-        retries = 0
-        while not os.path.exists(SOCKET_PATH) and retries < 50:
-            time.sleep(0.2)
-            retries += 1
+        if STATUS_SHM:
+            import shmstatus
 
-        if os.path.exists(SOCKET_PATH):
             try:
-                os.chmod(SOCKET_PATH, 0o666)
-            except OSError:
-                pass
+                SHM_WRITER = shmstatus.StatusWriter(STATUS_SHM_PATH)
+            except OSError as e:
+                print(f"Unable to publish status to shared memory: {e}")
+
+        if USB_CAPTURE:
+            print(f"Capturing USB traffic to {USB_CAPTURE}")
+            TRACE = usbtrace.TraceWriter(USB_CAPTURE)
+            TRACE.settings(SETTINGS.model_dump_json().encode())
 
         try:
-            tx = open_device(TX)
-            rx = open_device(RX)
+            link.open()
         except Exception as e:
             print("Unable to open lian li wireless controller")
             print(e)
             sys.exit(1)
 
-        fans = list_fans(rx, [])
+        fans = list_fans(link.rx, [])
         displayDetected(fans)
+        # Ready once the API is up and the controller is open, even if no
+        # temperature source resolves; the loop reports that via STATUS=.
+        NOTIFIER.ready(f"Wireless controller open, {len(fans)} fan group(s) found")
 
         time.sleep(5 if DEV_MODE else 0)
 
-        fan_control_loop(rx, tx)
+        fan_control_loop(link)
 
     except KeyboardInterrupt:
         pass
     except Exception as e:
         print(f"Error: {e}")
+        dump_flight_recorder("crash", repr(e))
     finally:
-        if tx:
-            usb.util.dispose_resources(tx)
-        if rx:
-            usb.util.dispose_resources(rx)
+        NOTIFIER.stopping()
+        link.close()
+        if PERSISTER:
+            PERSISTER.save()
+        if TRACE:
+            TRACE.close()
+        if SHM_WRITER:
+            SHM_WRITER.close()
 
         if os.path.exists(SOCKET_PATH):
             os.unlink(SOCKET_PATH)
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List
+from models import FrameRecord, ShadowSummary, ShadowTick
+
+# Frames kept for GET /shadow; the counters cover every frame.
+FRAME_LOG_SIZE = 64
+RECENT_TICKS = 120
+# Compute-time percentiles are taken over this many recent ticks.
+TIMING_WINDOW = 1024
+
+
+class FrameLog:
+    """The newest frames that were not sent, plus a count of all of them."""
+
+    def __init__(self, capacity: int = FRAME_LOG_SIZE):
+        self.frames: Deque[FrameRecord] = deque(maxlen=capacity)
+        self.count = 0
+
+    def add(self, data: bytes):
+        self.count += 1
+        self.frames.append(FrameRecord(timestamp=time.time(), data=bytes(data).hex()))
+
+    def recent(self) -> List[FrameRecord]:
+        return list(self.frames)
+
+
+class DryRunDevice:
+    """Stands in for the TX handle when LLCW_DRY_RUN is set.
+
+    Frames are logged and reported as written but never reach the
+    controller, so the fans keep whatever speed they had. It sits under the
+    capture and flight-recorder wrappers, which still see every frame.
+    """
+
+    def __init__(self, dev, log: FrameLog):
+        self.dev = dev
+        self.log = log
+
+    def write(self, endpoint, data, timeout=None):
+        self.log.add(data)
+        return len(data)
+
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
+
+
+def percentile(values: List[int], q: float) -> int:
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ShadowStats:
+    """Per-tick differences between the live engine and a shadow engine.
+
+    Targets are compared per fan group in raw PWM; write counts are USB
+    frames (each changed group is sent once per group slot, as the live
+    loop does). Compute time covers the sensor reads, target computation
+    and routing of one tick, but not the fan list read or the writes.
+    """
+
+    def __init__(self, capacity: int = RECENT_TICKS):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.recent: Deque[ShadowTick] = deque(maxlen=capacity)
+        self.ticks = 0
+        self.differing_ticks = 0
+        self.max_diff = 0
+        self.diff_total = 0
+        self.diff_count = 0
+        self.live_writes = 0
+        self.shadow_writes = 0
+        self.live_ns: Deque[int] = deque(maxlen=TIMING_WINDOW)
+        self.shadow_ns: Deque[int] = deque(maxlen=TIMING_WINDOW)
+
+    def record(
+        self,
+        live: Dict[str, int],
+        shadow: Dict[str, int],
+        live_writes: int,
+        shadow_writes: int,
+        live_ns: int,
+        shadow_ns: int,
+    ) -> ShadowTick:
+        diffs = {
+            mac: [pwm, shadow[mac]]
+            for mac, pwm in live.items()
+            if mac in shadow and shadow[mac] != pwm
+        }
+        tick = ShadowTick(
+            timestamp=time.time(),
+            diffs=diffs,
+            live_writes=live_writes,
+            shadow_writes=shadow_writes,
+            live_us=live_ns // 1000,
+            shadow_us=shadow_ns // 1000,
+        )
+        with self.lock:
+            self.ticks += 1
+            for a, b in diffs.values():
+                self.max_diff = max(self.max_diff, abs(a - b))
+                self.diff_total += abs(a - b)
+            if diffs:
+                self.differing_ticks += 1
+            self.diff_count += len(live)
+            self.live_writes += live_writes
+            self.shadow_writes += shadow_writes
+            self.live_ns.append(live_ns)
+            self.shadow_ns.append(shadow_ns)
+            self.recent.append(tick)
+        return tick
+
+    def summary(self) -> ShadowSummary:
+        with self.lock:
+            live_ns = list(self.live_ns)
+            shadow_ns = list(self.shadow_ns)
+            return ShadowSummary(
+                started_at=self.started_at,
+                ticks=self.ticks,
+                differing_ticks=self.differing_ticks,
+                max_diff=self.max_diff,
+                mean_diff=(
+                    round(self.diff_total / self.diff_count, 2)
+                    if self.diff_count
+                    else 0.0
+                ),
+                live_writes=self.live_writes,
+                shadow_writes=self.shadow_writes,
+                live_p50_us=percentile(live_ns, 0.5) // 1000,
+                live_p99_us=percentile(live_ns, 0.99) // 1000,
+                shadow_p50_us=percentile(shadow_ns, 0.5) // 1000,
+                shadow_p99_us=percentile(shadow_ns, 0.99) // 1000,
+            )
+
+    def last(self, count: int) -> List[ShadowTick]:
+        with self.lock:
+            ticks = list(self.recent)
+        return ticks[-count:] if count > 0 else []
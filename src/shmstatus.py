@@ -0,0 +1,177 @@
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+from models import SystemStatus
+import statuscodec
+
+# ==============================
+# LAYOUT (version 1, little endian)
+# ==============================
+# 0   magic "LLSH"
+# 4   layout version u16, state u16 (1 = live, 0 = daemon stopped)
+# 8   sequence u64: odd while the writer is updating, even when consistent
+# 16  payload length u32, payload capacity u32
+# 24  payload: a statuscodec binary status
+MAGIC = b"LLSH"
+LAYOUT_VERSION = 1
+HEADER = struct.Struct("<4sHHQII")
+SEQ = struct.Struct("<Q")
+SEQ_OFFSET = 8
+STATE = struct.Struct("<H")
+STATE_OFFSET = 6
+LENGTH = struct.Struct("<I")
+LENGTH_OFFSET = 16
+PAYLOAD_OFFSET = HEADER.size
+REGION_SIZE = 64 * 1024
+
+STATE_STOPPED = 0
+STATE_LIVE = 1
+
+READ_RETRIES = 1000
+# Readable by everyone, writable by the daemon only. The daemon usually runs
+# as root and `llcw monitor --shm` as a desktop user, who can already read
+# the same status from the socket (which is 0666).
+FILE_MODE = 0o644
+
+
+class StatusUnavailable(Exception):
+    pass
+
+
+class StatusWriter:
+    """Publishes the daemon's status into a memory-mapped file under a seqlock.
+
+    There is exactly one writer. A new file is renamed into place on start,
+    so readers still mapping the file of a previous run see it go stale and
+    reopen rather than reading from a region nobody updates. The file is
+    world-readable (``FILE_MODE``) so unprivileged clients can map it.
+    """
+
+    def __init__(self, path: str, size: int = REGION_SIZE):
+        self.path = path
+        self.capacity = size - PAYLOAD_OFFSET
+        self.seq = 0
+        self.warned = False
+        tmp = f"{path}.tmp"
+        fd = os.open(tmp, os.O_RDWR | os.O_CREAT | os.O_TRUNC, FILE_MODE)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(
+            self.mm, 0, MAGIC, LAYOUT_VERSION, STATE_LIVE, 0, 0, self.capacity
+        )
+        os.replace(tmp, path)
+        self.inode = os.stat(path).st_ino
+
+    def _begin(self):
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def _end(self):
+        self.seq += 1
+        SEQ.pack_into(self.mm, SEQ_OFFSET, self.seq)
+
+    def publish(self, payload: bytes) -> bool:
+        if len(payload) > self.capacity:
+            if not self.warned:
+                print(
+                    f"Status is {len(payload)} bytes, more than the {self.capacity} "
+                    "bytes of shared memory; not publishing it there"
+                )
+                self.warned = True
+            return False
+        self._begin()
+        self.mm[PAYLOAD_OFFSET : PAYLOAD_OFFSET + len(payload)] = payload
+        LENGTH.pack_into(self.mm, LENGTH_OFFSET, len(payload))
+        self._end()
+        return True
+
+    def close(self):
+        self._begin()
+        STATE.pack_into(self.mm, STATE_OFFSET, STATE_STOPPED)
+        self._end()
+        self.mm.close()
+        try:
+            if os.stat(self.path).st_ino == self.inode:
+                os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class StatusReader:
+    """Reads the status the daemon publishes, without talking to it.
+
+    ``read_bytes()`` copies the payload between two reads of the sequence
+    counter and retries when the writer was active in between. CPython has
+    no memory fences, so on weakly ordered CPUs the payload length and
+    layout are checked again when it is decoded.
+    """
+
+    def __init__(self, path: str, max_age: float = 5.0):
+        self.path = path
+        self.max_age = max_age
+        self.mm: Optional[mmap.mmap] = None
+        self.seq = -1
+
+    def open(self):
+        try:
+            with open(self.path, "rb") as f:
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise StatusUnavailable(f"No shared status at {self.path}: {e}")
+        magic, version, _, _, _, _ = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            self.close()
+            raise StatusUnavailable(f"Unsupported shared status layout in {self.path}")
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def sequence(self) -> int:
+        """Current sequence number; compare with ``self.seq`` to spot updates."""
+        if self.mm is None:
+            self.open()
+        return SEQ.unpack_from(self.mm, SEQ_OFFSET)[0]
+
+    def read_bytes(self) -> bytes:
+        if self.mm is None:
+            self.open()
+        mm = self.mm
+        for _ in range(READ_RETRIES):
+            before = SEQ.unpack_from(mm, SEQ_OFFSET)[0]
+            if before & 1:
+                # Mid-update: let the writer finish instead of spinning on it.
+                time.sleep(0)
+                continue
+            _, _, state, _, length, capacity = HEADER.unpack_from(mm)
+            payload = mm[PAYLOAD_OFFSET : PAYLOAD_OFFSET + min(length, capacity)]
+            if SEQ.unpack_from(mm, SEQ_OFFSET)[0] == before:
+                break
+        else:
+            raise StatusUnavailable("Shared status kept changing while being read")
+        if state != STATE_LIVE:
+            self.close()
+            raise StatusUnavailable("Daemon stopped")
+        if before == 0:
+            raise StatusUnavailable("No status published yet")
+        self.seq = before
+        return payload
+
+    def read(self) -> SystemStatus:
+        """Return the latest status, reopening the file if it went stale."""
+        try:
+            status = statuscodec.decode_binary(self.read_bytes())
+        except ValueError:
+            # A torn copy got past the counter; the next one will not.
+            status = statuscodec.decode_binary(self.read_bytes())
+        if self.max_age and time.time() - status.timestamp > self.max_age:
+            # The daemon may have been restarted onto a new file.
+            self.close()
+            status = statuscodec.decode_binary(self.read_bytes())
+        return status
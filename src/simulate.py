@@ -0,0 +1,303 @@
+import json
+from typing import Callable, Dict, List, Optional
+from models import Settings
+from utils import parse_curve_input, parse_fan_curve_input
+import vector
+from vector import np
+
+TIME_KEYS = ("timestamp", "time", "t")
+CPU_KEYS = ("cpu_temp", "cpu")
+GPU_KEYS = ("gpu_temp", "gpu")
+PWM_KEYS = ("pwm",)
+
+
+class TemperatureTrace:
+    """Temperatures over time; missing readings are NaN.
+
+    ``times`` are seconds, or None when the trace has no timestamps. ``pwm``
+    is the mean fan PWM (0-255) in effect after each sample, or None when the
+    trace did not record it.
+    """
+
+    def __init__(self, times, cpu, gpu, pwm=None):
+        self.times = times
+        self.cpu = cpu
+        self.gpu = gpu
+        self.pwm = pwm
+
+    def __len__(self) -> int:
+        return len(self.cpu)
+
+
+def pick(names: List[str], keys) -> Optional[int]:
+    return next((names.index(k) for k in keys if k in names), None)
+
+
+def load_csv(path: str) -> TemperatureTrace:
+    with open(path) as f:
+        header = f.readline().strip().lower().split(",")
+    names = [h.strip().strip('"') for h in header]
+    try:
+        [float(n) for n in names]
+        # No header: cpu / time,cpu / time,cpu,gpu
+        layout = {1: (None, 0, None, None), 2: (0, 1, None, None)}.get(
+            len(names), (0, 1, 2, None)
+        )
+        skip = 0
+    except ValueError:
+        layout = (
+            pick(names, TIME_KEYS),
+            pick(names, CPU_KEYS),
+            pick(names, GPU_KEYS),
+            pick(names, PWM_KEYS),
+        )
+        skip = 1
+    if layout[1] is None and layout[2] is None:
+        raise ValueError(f"{path} has no cpu_temp or gpu_temp column")
+
+    cols = [c for c in layout if c is not None]
+    try:
+        data = np.loadtxt(path, delimiter=",", skiprows=skip, usecols=cols, ndmin=2)
+    except ValueError:
+        # Empty fields (missing readings) need the slower parser.
+        data = np.genfromtxt(
+            path, delimiter=",", skip_header=skip, usecols=cols, ndmin=2
+        )
+    column = {c: data[:, i] for i, c in enumerate(cols)}
+    missing = np.full(len(data), np.nan)
+    return TemperatureTrace(
+        column.get(layout[0]) if layout[0] is not None else None,
+        column[layout[1]] if layout[1] is not None else missing,
+        column[layout[2]] if layout[2] is not None else missing,
+        column.get(layout[3]) if layout[3] is not None else None,
+    )
+
+
+def load_ndjson(path: str) -> TemperatureTrace:
+    """One JSON object per line, e.g. saved ``/status`` responses."""
+    times: List[float] = []
+    cpu: List[float] = []
+    gpu: List[float] = []
+    pwm: List[float] = []
+    nan = float("nan")
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record: Dict[str, object] = json.loads(line)
+            t = next((record[k] for k in TIME_KEYS if k in record), None)
+            c = next((record[k] for k in CPU_KEYS if k in record), None)
+            g = next((record[k] for k in GPU_KEYS if k in record), None)
+            fans = record.get("fans")
+            if fans:
+                p = sum(f["pwm"] for f in fans) / len(fans)
+            else:
+                p = next((record[k] for k in PWM_KEYS if k in record), None)
+            times.append(nan if t is None else t)
+            cpu.append(nan if c is None else c)
+            gpu.append(nan if g is None else g)
+            pwm.append(nan if p is None else p)
+    times_array = np.array(times, dtype=np.float64)
+    pwm_array = np.array(pwm, dtype=np.float64)
+    return TemperatureTrace(
+        None if np.isnan(times_array).all() else times_array,
+        np.array(cpu, dtype=np.float64),
+        np.array(gpu, dtype=np.float64),
+        None if np.isnan(pwm_array).all() else pwm_array,
+    )
+
+
+def load_capture(path: str) -> TemperatureTrace:
+    """The tick temperatures of an ``LLCW_CAPTURE`` USB trace.
+
+    The PWM of a tick is the mean of the last value written to each fan by
+    the end of that tick, read from the first frame of each write.
+    """
+    import usbtrace
+
+    _, events = usbtrace.read_events(path)
+    ticks: List[tuple] = []
+    pwm: List[float] = []
+    written: Dict[bytes, int] = {}
+    nan = float("nan")
+    for e in events:
+        if e.kind == usbtrace.KIND_TICK:
+            if ticks:
+                pwm.append(sum(written.values()) / len(written) if written else nan)
+            ticks.append((e.t, *usbtrace.TICK_PAYLOAD.unpack_from(e.payload)))
+        elif (
+            e.kind == usbtrace.KIND_WRITE
+            and e.device == usbtrace.DEVICE_TX
+            and len(e.payload) >= 22
+            and e.payload[0] == 0x10
+            and e.payload[1] == 0
+        ):
+            written[bytes(e.payload[6:12])] = e.payload[21]
+    if ticks:
+        pwm.append(sum(written.values()) / len(written) if written else nan)
+    data = np.array(ticks, dtype=np.float64).reshape(-1, 3)
+    pwm_array = np.array(pwm, dtype=np.float64)
+    return TemperatureTrace(
+        data[:, 0],
+        data[:, 1],
+        data[:, 2],
+        None if np.isnan(pwm_array).all() else pwm_array,
+    )
+
+
+def load_trace(path: str) -> TemperatureTrace:
+    if np is None:
+        raise RuntimeError("Simulating curves needs numpy installed")
+    with open(path, "rb") as f:
+        head = f.read(64)
+    if head.startswith(b"LLCWTRC1"):
+        trace = load_capture(path)
+    elif head.lstrip().startswith(b"{"):
+        trace = load_ndjson(path)
+    else:
+        trace = load_csv(path)
+    if len(trace) == 0:
+        raise ValueError(f"{path} has no samples")
+    return trace
+
+
+def hold_last(values):
+    """Fill NaN with the previous reading, as the daemon keeps the last target."""
+    valid = ~np.isnan(values)
+    idx = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    return values[idx]
+
+
+class Candidate:
+    """A curve to evaluate; ``gpu_model`` is the GPU group's own curve, if any.
+
+    Like the daemon's groups, gpu falls back to the CPU temperature when the
+    GPU has none, and mix takes the higher of the two targets, or the curve at
+    the hotter temperature when there is a single curve (as per-fan curves do).
+    """
+
+    def __init__(
+        self,
+        label: str,
+        model: Callable,
+        gpu_model: Optional[Callable] = None,
+    ):
+        self.label = label
+        self.model = model
+        self.gpu_model = gpu_model
+
+    def pwm(self, cpu, gpu, source: str):
+        gpu_model = self.gpu_model or self.model
+        if source == "cpu":
+            return self.model(cpu)
+        if source == "gpu":
+            return gpu_model(gpu)
+        if self.gpu_model is None:
+            return self.model(np.maximum(cpu, gpu))
+        return np.maximum(self.model(cpu), gpu_model(gpu))
+
+
+def linear_candidate(spec: str) -> Candidate:
+    linear = parse_curve_input(spec)
+    return Candidate(f"linear {spec}", lambda t: vector.temp_to_pwm(t, linear))
+
+
+def curve_candidate(spec: str) -> Candidate:
+    points = parse_fan_curve_input(spec).points
+    return Candidate(f"curve {spec}", lambda t: vector.curve_to_pwm(t, points))
+
+
+def settings_candidates(settings: Settings) -> List[Candidate]:
+    return [
+        Candidate(
+            "current linear",
+            lambda t: vector.temp_to_pwm(t, settings.linear),
+            lambda t: vector.temp_to_pwm(t, settings.gpu_linear),
+        ),
+        Candidate(
+            "current curve",
+            lambda t: vector.curve_to_pwm(t, settings.cpu_curve.points),
+            lambda t: vector.curve_to_pwm(t, settings.gpu_curve.points),
+        ),
+    ]
+
+
+class Simulation:
+    """PWM timelines of several candidates over one trace."""
+
+    def __init__(
+        self,
+        trace: TemperatureTrace,
+        source: str,
+        interval: float,
+        candidates: List[Candidate],
+    ):
+        cpu = hold_last(trace.cpu)
+        gpu = hold_last(np.where(np.isnan(trace.gpu), trace.cpu, trace.gpu))
+        needed = {"cpu": cpu, "gpu": gpu, "mix": cpu}[source]
+        valid = np.flatnonzero(~np.isnan(needed))
+        if len(valid) == 0:
+            raise ValueError(f"The trace has no {source} temperatures")
+        # Nothing is written before the first reading.
+        start = valid[0]
+        self.cpu = cpu[start:]
+        self.gpu = np.where(np.isnan(gpu[start:]), self.cpu, gpu[start:])
+        self.temps = {"cpu": self.cpu, "gpu": self.gpu}.get(
+            source, np.fmax(self.cpu, self.gpu)
+        )
+
+        if trace.times is not None:
+            times = trace.times[start:]
+            self.times = times - times[0]
+            steps = np.diff(times)
+            last = np.median(steps) if len(steps) else interval
+            self.durations = np.clip(np.append(steps, last), 0, None)
+        else:
+            self.times = np.arange(len(self.temps)) * interval
+            self.durations = np.full(len(self.temps), interval)
+
+        self.candidates = candidates
+        self.timelines = [c.pwm(self.cpu, self.gpu, source) for c in candidates]
+
+    def stats(self, above: float) -> List[Dict[str, object]]:
+        total = float(self.durations.sum())
+        hours = total / 3600
+        results = []
+        for candidate, pwm in zip(self.candidates, self.timelines):
+            percent = pwm * (100 / 255)
+            writes = 1 + int(np.count_nonzero(pwm[1:] != pwm[:-1]))
+            results.append(
+                {
+                    "candidate": candidate.label,
+                    "mean_percent": float(
+                        np.average(percent, weights=self.durations)
+                        if total > 0
+                        else percent.mean()
+                    ),
+                    "p95_percent": float(np.percentile(percent, 95)),
+                    "max_percent": float(percent.max()),
+                    "above_percent_time": (
+                        float(self.durations[percent > above].sum() / total * 100)
+                        if total > 0
+                        else 0.0
+                    ),
+                    "writes": writes,
+                    "writes_per_hour": writes / hours if hours > 0 else 0.0,
+                }
+            )
+        return results
+
+    def save(self, path: str):
+        """Write the timeline as CSV: time, temperature, then PWM per candidate."""
+        labels = ",".join(f'"{c.label}"' for c in self.candidates)
+        columns = [self.times, self.temps] + self.timelines
+        formats = ["%.3f", "%.2f"] + ["%d"] * len(self.timelines)
+        np.savetxt(
+            path,
+            np.column_stack(columns),
+            fmt=formats,
+            delimiter=",",
+            header=f"time,temp,{labels}",
+            comments="",
+        )
@@ -0,0 +1,244 @@
+import ast
+import math
+import re
+from typing import Dict, List, Optional, Set, Tuple
+
+# ==============================
+# EXPRESSION LANGUAGE
+# ==============================
+# cpu, gpu                  sampled CPU/GPU temperatures
+# sensor("chip"[, "label"]) any hwmon temperature (hottest of the chip without label)
+# max(...), min(...), avg(...), ema(expr, seconds), + - * / and numbers
+# other source names        reuse another named source
+INPUTS = ("cpu", "gpu")
+RESERVED = set(INPUTS) | {"mix", "max", "min", "avg", "ema", "sensor"}
+NAME_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+BINARY_OPS = {
+    ast.Add: "add",
+    ast.Sub: "sub",
+    ast.Mult: "mul",
+    ast.Div: "div",
+}
+COMMUTATIVE = {"add", "mul", "max", "min", "avg"}
+
+Node = Tuple
+
+
+class SourceGraph:
+    """Named temperature sources compiled into one deduplicated node list.
+
+    Every distinct sub-expression becomes a single node keyed by its
+    structure, so ``max(cpu, gpu)`` shared by several sources (or several
+    fans) is computed once per tick. Nodes are appended after their inputs,
+    so one forward pass over the list evaluates everything.
+
+    ``ema()`` state is keyed by the structure of the smoothed expression
+    rather than by node index, so ``carry_state()`` can hand it to the graph
+    rebuilt from the next settings.
+    """
+
+    def __init__(self, sources: Dict[str, str]):
+        self.nodes: List[Node] = []
+        self.index: Dict[Node, int] = {}
+        self.keys: List[Node] = []
+        self.uses: List[Set[str]] = []
+        self.outputs: Dict[str, int] = {}
+        self.ema_state: Dict[Node, Tuple[float, float]] = {}
+        self.sources = sources
+        self.visiting: List[str] = []
+        for name in sources:
+            self.compile_source(name)
+        self.has_sensors = any(node[0] == "sensor" for node in self.nodes)
+
+    # ---------- compile ----------
+    def compile_source(self, name: str) -> int:
+        if name in self.outputs:
+            return self.outputs[name]
+        if name in self.visiting:
+            cycle = " -> ".join(self.visiting + [name])
+            raise ValueError(f"source '{name}' refers to itself ({cycle})")
+        self.visiting.append(name)
+        try:
+            tree = ast.parse(self.sources[name], mode="eval")
+        except SyntaxError as e:
+            raise ValueError(f"source '{name}': invalid expression ({e.msg})")
+        try:
+            self.outputs[name] = self.compile_node(tree.body)
+        except ValueError as e:
+            if str(e).startswith("source '"):
+                raise
+            raise ValueError(f"source '{name}': {e}")
+        self.visiting.pop()
+        return self.outputs[name]
+
+    def add(self, node: Node, uses: Set[str]) -> int:
+        if node[0] in COMMUTATIVE:
+            node = (node[0],) + tuple(sorted(node[1:]))
+        idx = self.index.get(node)
+        if idx is None:
+            idx = len(self.nodes)
+            self.nodes.append(node)
+            self.keys.append(self.structure(node))
+            self.uses.append(uses)
+            self.index[node] = idx
+        return idx
+
+    def structure(self, node: Node) -> Node:
+        """``node`` with its input indices replaced by their own structure."""
+        op = node[0]
+        if op in ("const", "input", "sensor"):
+            return node
+        if op == "ema":
+            return (op, self.keys[node[1]], node[2])
+        args = [self.keys[j] for j in node[1:]]
+        if op in COMMUTATIVE:
+            args.sort(key=repr)
+        return (op, *args)
+
+    def compile_args(self, args) -> Tuple[List[int], Set[str]]:
+        ids = [self.compile_node(a) for a in args]
+        uses: Set[str] = set()
+        for i in ids:
+            uses |= self.uses[i]
+        return ids, uses
+
+    def compile_node(self, expr: ast.AST) -> int:
+        if isinstance(expr, ast.Constant) and isinstance(expr.value, (int, float)):
+            return self.add(("const", float(expr.value)), set())
+        if isinstance(expr, ast.Name):
+            if expr.id in INPUTS:
+                return self.add(("input", expr.id), {expr.id})
+            if expr.id in self.sources:
+                return self.compile_source(expr.id)
+            raise ValueError(f"unknown name '{expr.id}'")
+        if isinstance(expr, ast.UnaryOp) and isinstance(expr.op, ast.USub):
+            ids, uses = self.compile_args([expr.operand])
+            return self.add(("neg", ids[0]), uses)
+        if isinstance(expr, ast.BinOp) and type(expr.op) in BINARY_OPS:
+            ids, uses = self.compile_args([expr.left, expr.right])
+            return self.add((BINARY_OPS[type(expr.op)], *ids), uses)
+        if isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name):
+            return self.compile_call(expr.func.id, expr)
+        raise ValueError(f"unsupported expression '{ast.unparse(expr)}'")
+
+    def compile_call(self, func: str, expr: ast.Call) -> int:
+        if expr.keywords:
+            raise ValueError(f"{func}() takes no keyword arguments")
+        args = expr.args
+        if func in ("max", "min", "avg"):
+            if not args:
+                raise ValueError(f"{func}() needs at least one argument")
+            ids, uses = self.compile_args(args)
+            return self.add((func, *ids), uses)
+        if func == "ema":
+            if len(args) != 2 or not isinstance(args[1], ast.Constant):
+                raise ValueError("ema() takes an expression and a time constant")
+            tau = args[1].value
+            if not isinstance(tau, (int, float)) or tau <= 0:
+                raise ValueError("ema() time constant must be a positive number")
+            ids, uses = self.compile_args(args[:1])
+            return self.add(("ema", ids[0], float(tau)), uses)
+        if func == "sensor":
+            names = [a.value for a in args if isinstance(a, ast.Constant)]
+            if not 1 <= len(args) <= 2 or len(names) != len(args):
+                raise ValueError("sensor() takes a chip name and an optional label")
+            if not all(isinstance(n, str) for n in names):
+                raise ValueError("sensor() arguments must be strings")
+            label = names[1] if len(names) > 1 else None
+            return self.add(("sensor", names[0], label), {"sensor"})
+        raise ValueError(f"unknown function '{func}'")
+
+    # ---------- evaluate ----------
+    def evaluate(
+        self,
+        inputs: Dict[str, Optional[float]],
+        sensors: Optional[Dict[str, Dict[str, float]]],
+        now: float,
+    ) -> Dict[str, Optional[float]]:
+        """Evaluate every node once and return the value of each named source."""
+        values: List[Optional[float]] = [None] * len(self.nodes)
+        for i, node in enumerate(self.nodes):
+            op = node[0]
+            if op == "const":
+                value = node[1]
+            elif op == "input":
+                value = inputs.get(node[1])
+            elif op == "sensor":
+                value = read_sensor(sensors, node[1], node[2])
+            elif op in ("max", "min", "avg"):
+                args = [values[j] for j in node[1:] if values[j] is not None]
+                if not args:
+                    value = None
+                elif op == "max":
+                    value = max(args)
+                elif op == "min":
+                    value = min(args)
+                else:
+                    value = sum(args) / len(args)
+            elif op == "ema":
+                value = self.update_ema(self.keys[i], values[node[1]], node[2], now)
+            elif op == "neg":
+                value = None if values[node[1]] is None else -values[node[1]]
+            else:
+                value = binary(op, values[node[1]], values[node[2]])
+            values[i] = value
+        return {name: values[idx] for name, idx in self.outputs.items()}
+
+    def update_ema(
+        self, key: Node, x: Optional[float], tau: float, now: float
+    ) -> Optional[float]:
+        state = self.ema_state.get(key)
+        if x is None:
+            return state[0] if state else None
+        if state is None:
+            value = x
+        else:
+            prev, at = state
+            value = prev + (x - prev) * (1 - math.exp(-max(0.0, now - at) / tau))
+        self.ema_state[key] = (value, now)
+        return value
+
+    def carry_state(self, previous: "SourceGraph"):
+        """Keep the ``ema()`` values of ``previous`` this graph still computes."""
+        keys = set(self.keys)
+        self.ema_state = {
+            key: state for key, state in previous.ema_state.items() if key in keys
+        }
+
+    def source_inputs(self, name: str) -> Set[str]:
+        return self.uses[self.outputs[name]]
+
+
+def binary(op: str, a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None or b is None:
+        return None
+    if op == "add":
+        return a + b
+    if op == "sub":
+        return a - b
+    if op == "mul":
+        return a * b
+    return a / b if b else None
+
+
+def read_sensor(
+    sensors: Optional[Dict[str, Dict[str, float]]], chip: str, label: Optional[str]
+) -> Optional[float]:
+    readings = sensors.get(chip) if sensors else None
+    if not readings:
+        return None
+    if label is None:
+        return max(readings.values())
+    return readings.get(label)
+
+
+def validate_sources(sources: Dict[str, str]) -> Dict[str, str]:
+    for name in sources:
+        if not NAME_RE.fullmatch(name) or name in RESERVED:
+            raise ValueError(
+                f"invalid source name '{name}' (use lowercase letters, digits and _; "
+                f"not {', '.join(sorted(RESERVED))})"
+            )
+    SourceGraph(sources)
+    return sources
@@ -0,0 +1,224 @@
+import importlib
+import importlib.util
+import math
+import struct
+from typing import Dict, List, Optional, Tuple
+from models import SystemStatus
+
+# ==============================
+# MEDIA TYPES
+# ==============================
+JSON = "application/json"
+BINARY = "application/vnd.llcw.status"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+ALIASES = {"application/x-msgpack": MSGPACK}
+# Optional codec packages, imported the first time their media type is used.
+CODEC_MODULES = {MSGPACK: "msgpack", CBOR: "cbor2"}
+# Seconds since the status was taken, by the daemon's clock; sent with /status.
+AGE_HEADER = "x-status-age"
+
+# ==============================
+# BINARY FORMAT (version 1, little endian)
+# ==============================
+# header  magic "LLCS", version u8, flags u8 (1 = cpu_temp, 2 = gpu_temp),
+#         fan count u16, timestamp f64, cpu_temp f64, gpu_temp f64
+# fan     mac 6s, master_mac 6s, channel u8, rx_type u8, fan_count u8,
+#         pwm u8, target_pwm u8, is_bound u8, rpm 4 x u16
+# Fan health alerts are not carried; read them from JSON /status or /events.
+MAGIC = b"LLCS"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHddd")
+FAN = struct.Struct("<6s6sBBBBBB4H")
+HAS_CPU = 0x01
+HAS_GPU = 0x02
+RPM_SLOTS = 4
+
+
+def codec(media_type: str):
+    """The msgpack or cbor2 module for ``media_type``, or None if not installed."""
+    try:
+        return importlib.import_module(CODEC_MODULES[media_type])
+    except ImportError:
+        return None
+
+
+def available() -> List[str]:
+    """Media types this process can encode and decode, preferred first."""
+    types = [BINARY]
+    for media_type, name in CODEC_MODULES.items():
+        if importlib.util.find_spec(name) is not None:
+            types.append(media_type)
+    types.append(JSON)
+    return types
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Pick the media type for an Accept header, or None if none is acceptable.
+
+    Highest q wins, ties go to the order in the header. A missing header or
+    a wildcard answers JSON so plain clients see no change.
+    """
+    if not accept:
+        return JSON
+    supported = available()
+    ranked: List[Tuple[float, int, str]] = []
+    for pos, item in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in item.split(";")]
+        media_type = ALIASES.get(media_type.lower(), media_type.lower())
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q <= 0:
+            continue
+        if media_type in ("*/*", "application/*"):
+            media_type = JSON
+        if media_type in supported:
+            ranked.append((-q, pos, media_type))
+    return min(ranked)[2] if ranked else None
+
+
+def pack_mac(mac: str) -> bytes:
+    return bytes.fromhex(mac.replace(":", ""))
+
+
+def encode_binary(status: SystemStatus) -> bytes:
+    flags = (HAS_CPU if status.cpu_temp is not None else 0) | (
+        HAS_GPU if status.gpu_temp is not None else 0
+    )
+    parts = [
+        HEADER.pack(
+            MAGIC,
+            VERSION,
+            flags,
+            len(status.fans),
+            status.timestamp,
+            status.cpu_temp if status.cpu_temp is not None else math.nan,
+            status.gpu_temp if status.gpu_temp is not None else math.nan,
+        )
+    ]
+    for f in status.fans:
+        rpm = (list(f.rpm) + [0] * RPM_SLOTS)[:RPM_SLOTS]
+        parts.append(
+            FAN.pack(
+                pack_mac(f.mac),
+                pack_mac(f.master_mac),
+                f.channel,
+                f.rx_type,
+                f.fan_count,
+                f.pwm,
+                f.target_pwm,
+                f.is_bound,
+                *rpm,
+            )
+        )
+    return b"".join(parts)
+
+
+def unpack_binary(
+    payload: bytes,
+) -> Tuple[float, Optional[float], Optional[float], List[tuple]]:
+    """Return ``(timestamp, cpu_temp, gpu_temp, fan records)`` without pydantic.
+
+    Each record is a tuple in ``FAN`` field order. This is all a lightweight
+    consumer such as a status bar needs.
+    """
+    if len(payload) < HEADER.size or payload[:4] != MAGIC:
+        raise ValueError("not an LLCW status payload")
+    magic, version, flags, count, timestamp, cpu, gpu = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"unsupported status format version {version}")
+    if len(payload) != HEADER.size + count * FAN.size:
+        raise ValueError("truncated status payload")
+    return (
+        timestamp,
+        cpu if flags & HAS_CPU else None,
+        gpu if flags & HAS_GPU else None,
+        list(FAN.iter_unpack(payload[HEADER.size :])),
+    )
+
+
+def decode_binary(payload: bytes) -> SystemStatus:
+    timestamp, cpu, gpu, records = unpack_binary(payload)
+    # pydantic-core validates plain dicts faster than model_construct() builds
+    # models in Python, so the records are handed over as dicts.
+    fans = [
+        {
+            "mac": mac.hex(":"),
+            "master_mac": master.hex(":"),
+            "channel": channel,
+            "rx_type": rx_type,
+            "fan_count": fan_count,
+            "pwm": pwm,
+            "rpm": rpm,
+            "target_pwm": target_pwm,
+            "is_bound": is_bound,
+        }
+        for mac, master, channel, rx_type, fan_count, pwm, target_pwm, is_bound, *rpm in (
+            records
+        )
+    ]
+    return SystemStatus.model_validate(
+        {
+            "timestamp": timestamp,
+            "cpu_temp": cpu,
+            "gpu_temp": gpu,
+            "fans": fans,
+        }
+    )
+
+
+def encode(status: Optional[SystemStatus], media_type: str) -> bytes:
+    if media_type == BINARY:
+        return encode_binary(status)
+    if media_type == JSON:
+        return status.model_dump_json().encode() if status else b"null"
+    data = status.model_dump() if status else None
+    if media_type == MSGPACK:
+        return codec(MSGPACK).packb(data)
+    if media_type == CBOR:
+        return codec(CBOR).dumps(data)
+    raise ValueError(f"unsupported media type '{media_type}'")
+
+
+def decode(payload: bytes, content_type: Optional[str]) -> SystemStatus:
+    """Decode a /status body by its Content-Type (JSON when unknown)."""
+    media_type = (content_type or JSON).split(";")[0].strip().lower()
+    media_type = ALIASES.get(media_type, media_type)
+    if media_type == BINARY:
+        return decode_binary(payload)
+    module = codec(media_type) if media_type in CODEC_MODULES else None
+    if media_type == MSGPACK and module is not None:
+        return SystemStatus.model_validate(module.unpackb(payload))
+    if media_type == CBOR and module is not None:
+        return SystemStatus.model_validate(module.loads(payload))
+    if media_type != JSON:
+        raise ValueError(f"cannot decode status as '{media_type}'")
+    return SystemStatus.model_validate_json(payload)
+
+
+class StatusEncoder:
+    """Caches each encoding of the current status until the status changes.
+
+    The control loop publishes a new ``SystemStatus`` object every tick, so
+    identity is enough to tell whether cached payloads are still valid. The
+    status and its payloads are swapped as one tuple, so the control thread
+    and the API thread can both encode without a lock.
+    """
+
+    def __init__(self):
+        self.cache: Tuple[Optional[SystemStatus], Dict[str, bytes]] = (None, {})
+
+    def encode(self, status: Optional[SystemStatus], media_type: str) -> bytes:
+        cache = self.cache
+        if cache[0] is not status:
+            cache = self.cache = (status, {})
+        payload = cache[1].get(media_type)
+        if payload is None:
+            payload = cache[1][media_type] = encode(status, media_type)
+        return payload
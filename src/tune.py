@@ -0,0 +1,376 @@
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from models import CurveMode, CurvePoint, FanMode, Settings
+from simulate import TemperatureTrace, hold_last
+import vector
+from vector import np
+
+
+def field_bounds(name: str) -> Tuple[int, int]:
+    metadata = CurvePoint.model_fields[name].metadata
+    low = next(m.ge for m in metadata if hasattr(m, "ge"))
+    high = next(m.le for m in metadata if hasattr(m, "le"))
+    return low, high
+
+
+TEMP_MIN, TEMP_MAX = field_bounds("temp_c")
+PERCENT_MIN, PERCENT_MAX = field_bounds("percent")
+POINTS = 4
+
+MAX_STEPS = 10_000
+DEFAULT_TIME_CONSTANT = 60.0
+DEFAULT_FULL_SPEED_EFFECT = -15.0
+# Fits outside these ranges are taken as the history not separating the
+# fans from the load rather than as a real machine.
+MAX_TIME_CONSTANT = 1800.0
+FULL_SPEED_EFFECT_RANGE = (-60.0, -0.5)
+INSTRUMENT_LAGS = 3
+
+# A curve is a tuple of POINTS temperatures followed by POINTS percentages.
+Genome = Tuple[int, ...]
+
+
+def fit_response(temps, duty, sample: float) -> Optional[Tuple[float, float]]:
+    """Fit ``T[k+1] = a*T[k] + b*u[k] + w[k]`` and return its time constant
+    and full-speed effect, or None when the fit is not plausible.
+
+    ``w`` is the load, which is unknown and drives both the temperature and,
+    through the daemon, the duty, so plain least squares is biased. The fit
+    works on first differences, which removes slowly changing load, with
+    lagged differences as instruments for the current ones (two-stage least
+    squares). A duty that is a fixed function of the temperature, as in a
+    plain curve mode, does not identify the fans' effect and usually fails
+    the plausibility check.
+    """
+    d_temp = np.diff(temps)
+    d_duty = np.diff(duty)
+    lags = INSTRUMENT_LAGS
+    if len(d_temp) < 10 * lags or not d_duty.any():
+        return None
+    k = np.arange(lags + 1, len(d_temp))
+    x = np.column_stack([d_temp[k - 1], d_duty[k - 1]])
+    z = np.column_stack(
+        [d_temp[k - 1 - j] for j in range(1, lags + 1)]
+        + [d_duty[k - 1 - j] for j in range(1, lags + 1)]
+    )
+    projected = z @ np.linalg.lstsq(z, x, rcond=None)[0]
+    (a, b), *_ = np.linalg.lstsq(projected, d_temp[k], rcond=None)
+    if not 0 < a < 1:
+        return None
+    time_constant = -sample / math.log(a)
+    effect = b / (1 - a)
+    low, high = FULL_SPEED_EFFECT_RANGE
+    if (
+        not 2 * sample <= time_constant <= MAX_TIME_CONSTANT
+        or not low <= effect <= high
+    ):
+        return None
+    return float(time_constant), float(effect)
+
+
+class ThermalModel:
+    """First-order response of a temperature to the fan duty.
+
+    ``T[k+1] = a*T[k] + b*u[k] + e[k]`` with ``u`` the duty (0-1) set after
+    step ``k``, ``a`` from the time constant and ``b`` from the steady-state
+    effect of full fan speed. The residual ``e`` is what the fans do not
+    explain (load, ambient): replaying it with the recorded duty gives back
+    the recorded temperatures, and replaying it with another curve's duty
+    estimates how the temperature would have run under that curve.
+    """
+
+    def __init__(
+        self, temps, duty, step: float, time_constant: float, full_speed_effect: float
+    ):
+        self.step = step
+        self.time_constant = time_constant
+        self.full_speed_effect = full_speed_effect
+        self.a = math.exp(-step / time_constant)
+        self.b = full_speed_effect * (1 - self.a)
+        self.start = float(temps[0])
+        self.residual = temps[1:] - self.a * temps[:-1] - self.b * duty[:-1]
+
+    def run(self, curves) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Mean duty (%) and peak temperature of each curve in a (n, 8) array.
+
+        Each step evaluates every curve at once, so the cost is per step,
+        not per curve.
+        """
+        n = len(curves)
+        xs = curves[:, :POINTS].astype(np.float64)
+        ys = curves[:, POINTS:].astype(np.float64)
+        flat_x = xs.ravel()
+        flat_y = ys.ravel()
+        inner = xs[:, 1 : POINTS - 1]
+        rows = np.arange(n) * POINTS
+        low = xs[:, 0]
+        high = xs[:, -1]
+        a, b = self.a, self.b
+
+        temps = np.full(n, self.start)
+        peak = temps.copy()
+        total = np.zeros(n)
+        for e in self.residual.tolist():
+            t = np.clip(temps, low, high)
+            i = rows + (t[:, None] > inner).sum(axis=1)
+            x0 = flat_x[i]
+            y0 = flat_y[i]
+            percent = y0 + (t - x0) / (flat_x[i + 1] - x0) * (flat_y[i + 1] - y0)
+            # Quantized to PWM as the daemon writes it.
+            duty = np.rint(percent / 100 * 255) / 255
+            total += duty
+            temps = a * temps + b * duty + e
+            np.maximum(peak, temps, out=peak)
+        return total / len(self.residual) * 100, peak
+
+
+def resample(values, factor: int):
+    """Mean of every ``factor`` consecutive samples (a trailing partial block
+    is dropped)."""
+    if factor <= 1:
+        return values
+    usable = len(values) // factor * factor
+    return values[:usable].reshape(-1, factor).mean(axis=1)
+
+
+class History:
+    """The source temperature and fan duty of a trace, on an even time step.
+
+    The response is fitted on every sample, but curves are evaluated on
+    averages of at most ``MAX_STEPS`` steps; fan curves act on thermal time
+    constants of tens of seconds, so little is lost.
+    """
+
+    def __init__(
+        self,
+        trace: TemperatureTrace,
+        source: str,
+        interval: float,
+        fallback: Optional[Callable] = None,
+    ):
+        cpu = hold_last(trace.cpu)
+        gpu = hold_last(np.where(np.isnan(trace.gpu), trace.cpu, trace.gpu))
+        temps = cpu if source == "cpu" else np.where(np.isnan(gpu), cpu, gpu)
+        valid = np.flatnonzero(~np.isnan(temps))
+        if len(valid) < 2:
+            raise ValueError(f"The trace has too few {source} temperatures")
+        start = valid[0]
+        temps = temps[start:]
+
+        if trace.pwm is not None and not np.isnan(trace.pwm[start:]).all():
+            pwm = hold_last(trace.pwm[start:])
+            pwm = np.where(np.isnan(pwm), np.nanmean(pwm), pwm)
+            self.recorded_pwm = True
+        elif fallback is not None:
+            pwm = fallback(temps).astype(np.float64)
+            self.recorded_pwm = False
+        else:
+            raise ValueError("The trace has no fan PWM to fit the thermal model on")
+
+        if trace.times is not None:
+            steps = np.diff(trace.times[start:])
+            sample = float(np.median(steps)) if len(steps) else interval
+        else:
+            sample = interval
+        sample = max(sample, 1e-3)
+        factor = max(1, math.ceil(len(temps) / MAX_STEPS))
+        self.sample = sample
+        self.samples = len(temps)
+        self.duration = len(temps) * sample
+        self.raw_temps = temps
+        self.raw_duty = pwm / 255
+        self.step = sample * factor
+        self.temps = resample(temps, factor)
+        self.duty = resample(self.raw_duty, factor)
+
+
+# ==============================
+# CURVE SEARCH
+# ==============================
+def repair(genome) -> Genome:
+    """Clamp to the CurvePoint bounds and make the curve valid for CurveMode."""
+    temps = sorted(min(max(int(t), TEMP_MIN), TEMP_MAX) for t in genome[:POINTS])
+    for i in range(1, POINTS):
+        temps[i] = max(temps[i], temps[i - 1] + 1)
+    temps[-1] = min(temps[-1], TEMP_MAX)
+    for i in range(POINTS - 2, -1, -1):
+        temps[i] = min(temps[i], temps[i + 1] - 1)
+    percents = sorted(
+        min(max(int(p), PERCENT_MIN), PERCENT_MAX) for p in genome[POINTS:]
+    )
+    return tuple(temps + percents)
+
+
+def genome_of(curve: CurveMode) -> Genome:
+    return repair([p.temp_c for p in curve.points] + [p.percent for p in curve.points])
+
+
+def curve_of(genome: Genome) -> CurveMode:
+    return CurveMode(
+        points=[
+            CurvePoint(temp_c=t, percent=p)
+            for t, p in zip(genome[:POINTS], genome[POINTS:])
+        ]
+    )
+
+
+def format_curve(genome: Genome) -> str:
+    return ",".join(f"{t}:{p}" for t, p in zip(genome[:POINTS], genome[POINTS:]))
+
+
+_MODEL: Optional[ThermalModel] = None
+
+
+def _init_worker(model: ThermalModel):
+    global _MODEL
+    _MODEL = model
+
+
+def _run_chunk(curves) -> Tuple["np.ndarray", "np.ndarray"]:
+    return _MODEL.run(curves)
+
+
+class Tuner:
+    """Evolutionary search for the 4-point curve with the lowest mean duty
+    that keeps the simulated temperature at or below ``max_temp``.
+
+    Each generation keeps the best quarter and fills the rest with
+    crossovers and mutations of tournament winners. Candidates are scored in
+    parallel across ``jobs`` worker processes; the model is sent to each
+    worker once.
+    """
+
+    def __init__(
+        self,
+        model: ThermalModel,
+        temps,
+        max_temp: float,
+        jobs: int,
+        seed: Optional[int] = None,
+    ):
+        self.model = model
+        self.max_temp = max_temp
+        self.jobs = jobs
+        self.rng = random.Random(seed)
+        self.scores: Dict[Genome, Tuple[float, float]] = {}
+        # Where curve points are worth placing: around the recorded range,
+        # up to a little past the limit.
+        self.low = int(max(TEMP_MIN, math.floor(float(temps.min())) - 5))
+        self.high = int(min(TEMP_MAX, math.ceil(max_temp) + 10))
+        if self.high - self.low < POINTS:
+            self.low = max(TEMP_MIN, self.high - 2 * POINTS)
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self):
+        if self.jobs > 1:
+            self.executor = ProcessPoolExecutor(
+                self.jobs, initializer=_init_worker, initargs=(self.model,)
+            )
+        return self
+
+    def __exit__(self, *exc):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def fitness(self, genome: Genome) -> float:
+        mean, peak = self.scores[genome]
+        if peak <= self.max_temp:
+            return mean
+        # Any curve that meets the limit beats every curve that does not.
+        return PERCENT_MAX + (peak - self.max_temp) * 10
+
+    def evaluate(self, genomes: List[Genome]):
+        todo = [g for g in dict.fromkeys(genomes) if g not in self.scores]
+        if not todo:
+            return
+        curves = np.array(todo, dtype=np.int16)
+        if self.executor is None:
+            results = [self.model.run(curves)]
+        else:
+            chunks = np.array_split(curves, min(self.jobs, len(todo)))
+            results = list(self.executor.map(_run_chunk, chunks))
+        means = np.concatenate([r[0] for r in results])
+        peaks = np.concatenate([r[1] for r in results])
+        for g, mean, peak in zip(todo, means.tolist(), peaks.tolist()):
+            self.scores[g] = (mean, peak)
+
+    def random_genome(self) -> Genome:
+        temps = self.rng.sample(range(self.low, self.high + 1), POINTS)
+        percents = [self.rng.randint(PERCENT_MIN, PERCENT_MAX) for _ in range(POINTS)]
+        return repair(temps + percents)
+
+    def pick(self, population: List[Genome]) -> Genome:
+        a, b = self.rng.sample(population, 2)
+        return a if self.fitness(a) <= self.fitness(b) else b
+
+    def child(self, mother: Genome, father: Genome) -> Genome:
+        genes = []
+        for i in range(POINTS):
+            parent = mother if self.rng.random() < 0.5 else father
+            genes.append((parent[i], parent[POINTS + i]))
+        temps = [t for t, _ in genes]
+        percents = [p for _, p in genes]
+        for i in range(POINTS):
+            if self.rng.random() < 0.4:
+                temps[i] += round(self.rng.gauss(0, 4))
+            if self.rng.random() < 0.4:
+                percents[i] += round(self.rng.gauss(0, 8))
+        return repair(temps + percents)
+
+    def search(
+        self,
+        seeds: List[Genome],
+        population: int,
+        generations: int,
+        progress: Optional[Callable[[int, Genome], None]] = None,
+    ) -> List[Genome]:
+        """Return every evaluated curve, best first."""
+        population = max(population, 4)
+        pool = list(dict.fromkeys(seeds))[:population]
+        while len(pool) < population:
+            pool.append(self.random_genome())
+        elite = max(1, population // 4)
+        for generation in range(generations):
+            self.evaluate(pool)
+            pool.sort(key=self.fitness)
+            if progress is not None:
+                progress(generation + 1, pool[0])
+            if generation == generations - 1:
+                break
+            survivors = pool[:elite]
+            children: List[Genome] = []
+            seen = set(survivors)
+            attempts = 0
+            while len(children) < population - elite:
+                g = self.child(self.pick(pool), self.pick(pool))
+                attempts += 1
+                if g in seen and attempts < population * 20:
+                    continue
+                seen.add(g)
+                children.append(g)
+            pool = survivors + children
+        return sorted(self.scores, key=self.fitness)
+
+
+def settings_pwm(settings: Settings, source: str) -> Optional[Callable]:
+    """The PWM the current settings give, for traces without recorded PWM.
+
+    None in PID mode, whose output depends on more than the temperature.
+    """
+    if settings.mode == FanMode.linear:
+        linear = settings.linear if source == "cpu" else settings.gpu_linear
+        return lambda t: vector.temp_to_pwm(t, linear)
+    if settings.mode == FanMode.curve:
+        curve = settings.cpu_curve if source == "cpu" else settings.gpu_curve
+        return lambda t: vector.curve_to_pwm(t, curve.points)
+    return None
+
+
+def default_jobs() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
@@ -0,0 +1,399 @@
+import errno
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Deque, Dict, List, Optional
+import usb.core
+
+try:
+    import usb1
+except ImportError:
+    usb1 = None
+
+# ==============================
+# ENGINE CONSTANTS
+# ==============================
+IN_QUEUE_DEPTH = 4
+IN_TRANSFER_SIZE = 512
+MAX_INFLIGHT_WRITES = 64
+# pyusb's default, in ms; libusb would take 0 as "never time out".
+DEFAULT_TIMEOUT = 1000
+# An IN transfer that fails this many times in a row is not resubmitted.
+IN_RETRY_LIMIT = 3
+INBOX_SIZE = 64
+EVENT_TIMEOUT = 0.1
+
+GET_DEV_CMD = 0x10
+RF_PAGE_STRIDE = 434
+PAGE_TIMEOUT = 0.5
+PAGE_MAX_AGE = 1.0
+
+TRANSFER_TYPE_MASK = 0x03
+
+
+def transfer_error(status: int) -> usb.core.USBError:
+    """Translate a libusb transfer status into the pyusb exception the daemon handles."""
+    if status == usb1.TRANSFER_TIMED_OUT:
+        return usb.core.USBTimeoutError("Operation timed out", errno=errno.ETIMEDOUT)
+    if status == usb1.TRANSFER_NO_DEVICE:
+        return usb.core.USBError(
+            "No such device (it may have been disconnected)", errno=errno.ENODEV
+        )
+    if status == usb1.TRANSFER_CANCELLED:
+        return usb.core.USBError("Transfer cancelled", errno=errno.ECANCELED)
+    return usb.core.USBError(f"Transfer failed (status {status})", errno=errno.EIO)
+
+
+class ReadsStopped(usb.core.USBError):
+    """Every queued IN transfer has failed; the dongle needs reopening."""
+
+
+def submit_error(e: Exception) -> usb.core.USBError:
+    if isinstance(e, usb1.USBErrorNoDevice):
+        return usb.core.USBError(
+            "No such device (it may have been disconnected)", errno=errno.ENODEV
+        )
+    return usb.core.USBError(str(e), errno=errno.EIO)
+
+
+class TransferEngine:
+    """One libusb context plus the thread that runs its completion callbacks."""
+
+    def __init__(self):
+        if usb1 is None:
+            raise RuntimeError(
+                "The libusb1 backend needs the 'libusb1' Python package installed"
+            )
+        self.context = usb1.USBContext()
+        self.context.open()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="usb-events", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            try:
+                self.context.handleEventsTimeout(EVENT_TIMEOUT)
+            except usb1.USBErrorInterrupted:
+                continue
+            except Exception:
+                time.sleep(EVENT_TIMEOUT)
+
+    def open(self, vendor: int, pid: int):
+        handle = self.context.openByVendorIDAndProductID(
+            vendor, pid, skip_on_error=True
+        )
+        if handle is None:
+            raise RuntimeError(f"Device {pid:04x} not found")
+        try:
+            handle.setAutoDetachKernelDriver(True)
+        except usb1.USBError as e:
+            print(f"Could not detach kernel driver: {e}")
+        handle.claimInterface(0)
+        return handle
+
+
+def endpoint_types(handle) -> Dict[int, int]:
+    types: Dict[int, int] = {}
+    for config in handle.getDevice().iterConfigurations():
+        for interface in config:
+            for setting in interface:
+                for endpoint in setting:
+                    types[endpoint.getAddress()] = (
+                        endpoint.getAttributes() & TRANSFER_TYPE_MASK
+                    )
+    return types
+
+
+class AsyncDevice:
+    """Queues OUT transfers instead of blocking on each one.
+
+    ``write()`` returns as soon as the transfer is submitted. A failed
+    completion is raised from the next ``write()``, so disconnects still reach
+    the control loop; IN failures never are. At most ``MAX_INFLIGHT_WRITES`` transfers are pending;
+    past that, ``write()`` waits for the oldest to finish, up to the write
+    timeout, so a stalled endpoint surfaces as a timeout instead of a hang.
+    """
+
+    def __init__(self, engine: TransferEngine, vendor: int, pid: int):
+        self.engine = engine
+        self.idVendor = vendor
+        self.idProduct = pid
+        self.handle = engine.open(vendor, pid)
+        self.types = endpoint_types(self.handle)
+        self.slots = threading.BoundedSemaphore(MAX_INFLIGHT_WRITES)
+        self.idle: List = []
+        self.submitted: List = []
+        self.lock = threading.Lock()
+        self.write_error: Optional[usb.core.USBError] = None
+
+    def _prepare(self, transfer, endpoint: int, data, callback, timeout: int):
+        if self.types.get(endpoint) == usb1.TRANSFER_TYPE_INTERRUPT:
+            transfer.setInterrupt(endpoint, data, callback=callback, timeout=timeout)
+        else:
+            transfer.setBulk(endpoint, data, callback=callback, timeout=timeout)
+
+    def _submit(self, transfer):
+        with self.lock:
+            self.submitted.append(transfer)
+        try:
+            transfer.submit()
+        except usb1.USBError as e:
+            with self.lock:
+                self.submitted.remove(transfer)
+            raise submit_error(e)
+
+    def _finished(self, transfer):
+        with self.lock:
+            if transfer in self.submitted:
+                self.submitted.remove(transfer)
+
+    def _on_write(self, transfer):
+        self._finished(transfer)
+        status = transfer.getStatus()
+        with self.lock:
+            if status != usb1.TRANSFER_COMPLETED and self.write_error is None:
+                self.write_error = transfer_error(status)
+            self.idle.append(transfer)
+        self.slots.release()
+
+    def write(self, endpoint, data, timeout=None):
+        with self.lock:
+            error, self.write_error = self.write_error, None
+        if error is not None:
+            raise error
+
+        timeout = timeout or DEFAULT_TIMEOUT
+        if not self.slots.acquire(timeout=timeout / 1000):
+            raise usb.core.USBTimeoutError(
+                "Write queue full: the OUT endpoint is not draining",
+                errno=errno.ETIMEDOUT,
+            )
+        with self.lock:
+            transfer = self.idle.pop() if self.idle else self.handle.getTransfer()
+        self._prepare(transfer, endpoint, bytes(data), self._on_write, timeout)
+        try:
+            self._submit(transfer)
+        except usb.core.USBError:
+            with self.lock:
+                self.idle.append(transfer)
+            self.slots.release()
+            raise
+        return len(data)
+
+    def flush(self, timeout: float = 1.0) -> bool:
+        """Wait until every queued write has completed."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not any(t.getEndpoint() & 0x80 == 0 for t in self.submitted):
+                    return True
+            time.sleep(0.005)
+        return False
+
+    def read(self, endpoint, size, timeout=None):
+        raise usb.core.USBError("Reads are not queued on this device", errno=errno.EIO)
+
+    def is_kernel_driver_active(self, interface):
+        return False
+
+    def detach_kernel_driver(self, interface):
+        pass
+
+    def close(self):
+        self.flush(PAGE_TIMEOUT)
+        with self.lock:
+            pending = list(self.submitted)
+        for transfer in pending:
+            try:
+                transfer.cancel()
+            except usb1.USBError:
+                pass
+        deadline = time.monotonic() + PAGE_TIMEOUT
+        while time.monotonic() < deadline:
+            with self.lock:
+                if not self.submitted:
+                    break
+            time.sleep(0.005)
+        try:
+            self.handle.releaseInterface(0)
+        except usb1.USBError:
+            pass
+        self.handle.close()
+
+
+class PageRequest:
+    """Collects the IN chunks that answer one GET_DEV_CMD."""
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+        self.total_len = RF_PAGE_STRIDE * page_count
+        self.buf = bytearray()
+        self.future: Future = Future()
+        self.sent_at = time.monotonic()
+        self.done_at: Optional[float] = None
+
+    def feed(self, chunk: bytes):
+        if self.future.done():
+            return
+        self.buf.extend(chunk)
+        if len(self.buf) >= self.total_len or len(chunk) < IN_TRANSFER_SIZE:
+            self.done_at = time.monotonic()
+            self.future.set_result(self.buf)
+
+    def fail(self, error: usb.core.USBError):
+        if not self.future.done():
+            self.done_at = time.monotonic()
+            self.future.set_exception(error)
+
+    def expired(self, now: float) -> bool:
+        if self.done_at is not None:
+            return now - self.done_at > PAGE_MAX_AGE
+        return now - self.sent_at > PAGE_TIMEOUT
+
+
+class AsyncRxDevice(AsyncDevice):
+    """RX dongle with ``IN_QUEUE_DEPTH`` IN transfers kept pending at all times.
+
+    Incoming chunks go to the outstanding ``PageRequest`` if there is one,
+    otherwise to an inbox served by ``read()``. A failed IN transfer fails the
+    outstanding request, or is kept for the next ``fetch_page()``/``read()``,
+    and is resubmitted unless it failed ``IN_RETRY_LIMIT`` times in a row or
+    the device is gone; once none is left, ``fetch_page()`` raises
+    ``ReadsStopped``.
+    """
+
+    def __init__(self, engine: TransferEngine, vendor: int, pid: int, endpoint: int):
+        super().__init__(engine, vendor, pid)
+        self.in_endpoint = endpoint
+        self.inbox: Deque[bytes] = deque(maxlen=INBOX_SIZE)
+        self.arrived = threading.Condition(self.lock)
+        self.request: Optional[PageRequest] = None
+        self.read_error: Optional[usb.core.USBError] = None
+        self.closing = False
+        self.failures: Dict[object, int] = {}
+        for _ in range(IN_QUEUE_DEPTH):
+            transfer = self.handle.getTransfer()
+            self._prepare(transfer, endpoint, IN_TRANSFER_SIZE, self._on_read, 0)
+            self._submit(transfer)
+
+    def _on_read(self, transfer):
+        self._finished(transfer)
+        status = transfer.getStatus()
+        if status == usb1.TRANSFER_CANCELLED:
+            return
+        if status != usb1.TRANSFER_COMPLETED:
+            error = transfer_error(status)
+            with self.lock:
+                request = self.request
+                if request is None or request.future.done():
+                    request = None
+                    self.read_error = error
+                failures = self.failures.get(transfer, 0) + 1
+                self.failures[transfer] = failures
+                self.arrived.notify_all()
+            if request:
+                request.fail(error)
+            if status == usb1.TRANSFER_NO_DEVICE or failures >= IN_RETRY_LIMIT:
+                return
+        else:
+            chunk = bytes(transfer.getBuffer()[: transfer.getActualLength()])
+            with self.lock:
+                self.failures.pop(transfer, None)
+                request = self.request
+                if request is None or request.future.done():
+                    self.inbox.append(chunk)
+                    self.arrived.notify_all()
+                    request = None
+            if request:
+                request.feed(chunk)
+
+        if not self.closing:
+            try:
+                self._submit(transfer)
+            except usb.core.USBError as e:
+                with self.lock:
+                    self.read_error = e
+                    self.arrived.notify_all()
+
+    def request_page(self, page_count: int, endpoint: int) -> PageRequest:
+        """Send GET_DEV_CMD and return the request its reply will complete."""
+        cmd = bytearray(64)
+        cmd[0] = GET_DEV_CMD
+        cmd[1] = page_count & 0xFF
+        request = PageRequest(page_count)
+        with self.lock:
+            self.inbox.clear()
+            self.request = request
+        self.write(endpoint, cmd)
+        return request
+
+    def fetch_page(self, page_count: int, endpoint: int, wait: float) -> bytearray:
+        """Return a page, waiting at most ``wait`` seconds for the reply.
+
+        A reply that misses the deadline is not abandoned: it keeps filling in
+        the background and is returned by the next call if it is still fresh.
+        Only a request that got no complete reply within ``PAGE_TIMEOUT`` is
+        sent again.
+        """
+        with self.lock:
+            reading = any(t.getEndpoint() & 0x80 for t in self.submitted)
+            error, self.read_error = self.read_error, None
+        if not reading:
+            raise ReadsStopped("No IN transfers left in flight", errno=errno.EIO)
+        if error is not None:
+            raise error
+        now = time.monotonic()
+        request = self.request
+        if request is None or request.page_count != page_count or request.expired(now):
+            request = self.request_page(page_count, endpoint)
+
+        try:
+            payload = request.future.result(timeout=wait)
+        except FutureTimeout:
+            return bytearray()
+        finally:
+            if request.future.done():
+                with self.lock:
+                    if self.request is request:
+                        self.request = None
+        return payload
+
+    def read(self, endpoint, size, timeout=None):
+        deadline = time.monotonic() + (timeout or 1000) / 1000
+        with self.lock:
+            while not self.inbox:
+                if self.read_error is not None:
+                    error, self.read_error = self.read_error, None
+                    raise error
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise usb.core.USBTimeoutError(
+                        "Operation timed out", errno=errno.ETIMEDOUT
+                    )
+                self.arrived.wait(remaining)
+            chunk = self.inbox.popleft()
+        return chunk[:size]
+
+    def close(self):
+        self.closing = True
+        super().close()
+
+
+_engine: Optional[TransferEngine] = None
+
+
+def get_engine() -> TransferEngine:
+    global _engine
+    if _engine is None:
+        _engine = TransferEngine()
+    return _engine
+
+
+def open_device(vendor: int, pid: int, in_endpoint: Optional[int] = None):
+    """Open one dongle on the shared engine; pass ``in_endpoint`` for the RX side."""
+    engine = get_engine()
+    if in_endpoint is None:
+        return AsyncDevice(engine, vendor, pid)
+    return AsyncRxDevice(engine, vendor, pid, in_endpoint)
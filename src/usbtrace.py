@@ -0,0 +1,349 @@
+import json
+import math
+import struct
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import usb.core
+
+# ==============================
+# TRACE FORMAT
+# ==============================
+# File:   MAGIC | start wall-clock (<d) | record*
+# Record: kind (B) | device (B) | µs since previous record (I) | length (H) | payload
+# Tick:   cpu temp, gpu temp (<dd) [| loop clock, cpu load, gpu util (<ddd)
+#         [| hwmon readings as JSON {chip: {label: temp}}]]
+#         Older traces end after the temperatures; NaN stands for no reading.
+#         The hwmon readings are only there when the tick read them.
+# Page:   page count (B) | reply, empty when it was not ready yet (libusb1 RX)
+#         A failed page request is an empty page followed by an error record.
+TRACE_MAGIC = b"LLCWTRC1"
+FILE_HEADER = struct.Struct("<d")
+RECORD_HEADER = struct.Struct("<BBIH")
+ERROR_PAYLOAD = struct.Struct("<i")
+TICK_PAYLOAD = struct.Struct("<dd")
+TICK_INPUTS = struct.Struct("<ddd")
+
+KIND_WRITE = 0
+KIND_READ = 1
+KIND_ERROR = 2
+KIND_TICK = 3
+KIND_SETTINGS = 4
+KIND_PAGE = 5
+
+DEVICE_RX = 0
+DEVICE_TX = 1
+DEVICE_NONE = 0xFF
+
+ETIMEDOUT = 110
+ENODEV = 19
+GET_DEV_CMD = 0x10
+READ_CHUNK = 512
+
+
+def _encode_temp(value: Optional[float]) -> float:
+    return math.nan if value is None else float(value)
+
+
+def _decode_temp(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+class TraceWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self.file: BinaryIO = open(path, "wb")
+        self.file.write(TRACE_MAGIC + FILE_HEADER.pack(time.time()))
+        self.lock = threading.Lock()
+        self.last_ns = time.monotonic_ns()
+
+    def record(self, kind: int, device: int, payload: bytes = b""):
+        now = time.monotonic_ns()
+        with self.lock:
+            delta_us = min(0xFFFFFFFF, (now - self.last_ns) // 1000)
+            self.last_ns = now
+            payload = bytes(payload[:0xFFFF])
+            self.file.write(
+                RECORD_HEADER.pack(kind, device, delta_us, len(payload)) + payload
+            )
+
+    def tick(
+        self,
+        cpu_temp: Optional[float],
+        gpu_temp: Optional[float],
+        clock: Optional[float] = None,
+        cpu_load: Optional[float] = None,
+        gpu_util: Optional[float] = None,
+        sensors: Optional[Dict[str, Dict[str, float]]] = None,
+    ):
+        """Mark the start of a control tick with the inputs it computed from.
+
+        ``clock`` is the loop's monotonic time of the tick, the loads are
+        the PID feed-forward readings and ``sensors`` the hwmon readings of
+        ``sensor()`` sources, so a replay can reproduce every mode exactly.
+        """
+        payload = TICK_PAYLOAD.pack(
+            _encode_temp(cpu_temp), _encode_temp(gpu_temp)
+        ) + TICK_INPUTS.pack(
+            _encode_temp(clock), _encode_temp(cpu_load), _encode_temp(gpu_util)
+        )
+        if sensors is not None:
+            payload += json.dumps(sensors, separators=(",", ":")).encode()
+        self.record(KIND_TICK, DEVICE_NONE, payload)
+        with self.lock:
+            self.file.flush()
+
+    def settings(self, payload: bytes):
+        self.record(KIND_SETTINGS, DEVICE_NONE, payload)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+
+
+class RecordingDevice:
+    """Wraps a TX/RX device and logs every transfer to a TraceWriter."""
+
+    def __init__(self, dev, writer: TraceWriter, device: int):
+        self.dev = dev
+        self.writer = writer
+        self.device = device
+
+    def write(self, endpoint, data, timeout=None):
+        try:
+            written = self.dev.write(endpoint, data, timeout)
+        except usb.core.USBError as e:
+            self.writer.record(
+                KIND_ERROR, self.device, ERROR_PAYLOAD.pack(e.errno or -1)
+            )
+            raise
+        self.writer.record(KIND_WRITE, self.device, data)
+        return written
+
+    def read(self, endpoint, size, timeout=None):
+        try:
+            data = self.dev.read(endpoint, size, timeout)
+        except usb.core.USBError as e:
+            self.writer.record(
+                KIND_ERROR, self.device, ERROR_PAYLOAD.pack(e.errno or -1)
+            )
+            raise
+        self.writer.record(KIND_READ, self.device, data)
+        return data
+
+    def fetch_page(self, page_count: int, endpoint: int, wait: float):
+        """Page request of the libusb1 RX device, recorded as one page event."""
+        try:
+            data = self.dev.fetch_page(page_count, endpoint, wait)
+        except usb.core.USBError as e:
+            self.writer.record(KIND_PAGE, self.device, bytes([page_count & 0xFF]))
+            self.writer.record(
+                KIND_ERROR, self.device, ERROR_PAYLOAD.pack(e.errno or -1)
+            )
+            raise
+        self.writer.record(KIND_PAGE, self.device, bytes([page_count & 0xFF]) + data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
+
+
+# ==============================
+# REPLAY
+# ==============================
+class TraceEvent:
+    __slots__ = ("kind", "device", "t", "payload")
+
+    def __init__(self, kind: int, device: int, t: float, payload: bytes):
+        self.kind = kind
+        self.device = device
+        self.t = t
+        self.payload = payload
+
+
+class TraceTick:
+    def __init__(self, index: int, t: float, cpu_temp, gpu_temp):
+        self.index = index
+        self.t = t
+        self.cpu_temp: Optional[float] = cpu_temp
+        self.gpu_temp: Optional[float] = gpu_temp
+        # None in traces recorded before these were captured.
+        self.clock: Optional[float] = None
+        self.cpu_load: Optional[float] = None
+        self.gpu_util: Optional[float] = None
+        # None when the tick did not read hwmon (or the trace predates it).
+        self.sensors: Optional[Dict[str, Dict[str, float]]] = None
+        self.settings: Optional[bytes] = None
+        self.events: List[TraceEvent] = []
+
+    @property
+    def duration(self) -> float:
+        if not self.events:
+            return 0.0
+        return self.events[-1].t - self.t
+
+    def device_events(self, device: int) -> List[TraceEvent]:
+        return [e for e in self.events if e.device == device]
+
+
+def read_events(path: str) -> Tuple[float, Iterator[TraceEvent]]:
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(TRACE_MAGIC):
+        raise ValueError(f"{path} is not a USB trace")
+    offset = len(TRACE_MAGIC)
+    (started_at,) = FILE_HEADER.unpack_from(data, offset)
+    offset += FILE_HEADER.size
+
+    def events():
+        nonlocal offset
+        t_us = 0
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, device, delta_us, length = RECORD_HEADER.unpack_from(data, offset)
+            offset += RECORD_HEADER.size
+            payload = data[offset : offset + length]
+            offset += length
+            t_us += delta_us
+            yield TraceEvent(kind, device, t_us / 1_000_000, payload)
+
+    return started_at, events()
+
+
+def load_ticks(path: str) -> List[TraceTick]:
+    """Split a trace into control ticks.
+
+    Transfers before the first tick marker (startup enumeration) are dropped.
+    A tick's ``settings`` holds the latest settings snapshot recorded before it.
+    """
+    _, events = read_events(path)
+    ticks: List[TraceTick] = []
+    pending_settings: Optional[bytes] = None
+    for event in events:
+        if event.kind == KIND_TICK:
+            cpu, gpu = TICK_PAYLOAD.unpack_from(event.payload)
+            tick = TraceTick(len(ticks), event.t, _decode_temp(cpu), _decode_temp(gpu))
+            if len(event.payload) >= TICK_PAYLOAD.size + TICK_INPUTS.size:
+                clock, cpu_load, gpu_util = TICK_INPUTS.unpack_from(
+                    event.payload, TICK_PAYLOAD.size
+                )
+                tick.clock = _decode_temp(clock)
+                tick.cpu_load = _decode_temp(cpu_load)
+                tick.gpu_util = _decode_temp(gpu_util)
+            inputs_end = TICK_PAYLOAD.size + TICK_INPUTS.size
+            if len(event.payload) > inputs_end:
+                tick.sensors = json.loads(event.payload[inputs_end:])
+            tick.settings = pending_settings
+            pending_settings = None
+            ticks.append(tick)
+        elif event.kind == KIND_SETTINGS:
+            pending_settings = event.payload
+        elif ticks:
+            ticks[-1].events.append(event)
+    return ticks
+
+
+class ReplayDevice:
+    """Serves the recorded transfers of one device for a single tick.
+
+    Reads return the recorded payloads (or raise the recorded error), writes
+    are compared against the recorded ones and mismatches are collected. A
+    page event recorded by the libusb1 backend answers the GET_DEV_CMD write
+    and the reads after it, so replay goes through the synchronous page read.
+    """
+
+    def __init__(self, device: int):
+        self.device = device
+        self.queue: List[TraceEvent] = []
+        self.pos = 0
+        self.written: List[bytes] = []
+        self.mismatches: List[Dict[str, object]] = []
+        self.page: Optional[bytearray] = None
+        self.page_error: Optional[TraceEvent] = None
+
+    def load(self, tick: TraceTick):
+        self.queue = tick.device_events(self.device)
+        self.pos = 0
+        self.written = []
+        self.mismatches = []
+        self.page = None
+        self.page_error = None
+
+    def _next(self, kind: int) -> Optional[TraceEvent]:
+        while self.pos < len(self.queue):
+            event = self.queue[self.pos]
+            self.pos += 1
+            if event.kind == kind or event.kind == KIND_ERROR:
+                return event
+            self.mismatches.append({"expected": event.kind, "got": kind})
+        return None
+
+    def _raise(self, event: TraceEvent):
+        (errno,) = ERROR_PAYLOAD.unpack(event.payload)
+        if errno == ETIMEDOUT:
+            raise usb.core.USBTimeoutError("Operation timed out", errno=errno)
+        raise usb.core.USBError("Replayed USB error", errno=errno)
+
+    def _page(self, data: bytes) -> bool:
+        if not data or data[0] != GET_DEV_CMD or self.pos >= len(self.queue):
+            return False
+        event = self.queue[self.pos]
+        if event.kind != KIND_PAGE:
+            return False
+        self.pos += 1
+        if event.payload[:1] != data[1:2]:
+            self.mismatches.append({"expected_pages": event.payload[0], "got": data[1]})
+        self.page = bytearray(event.payload[1:])
+        if not self.page and self.pos < len(self.queue):
+            failed = self.queue[self.pos]
+            if failed.kind == KIND_ERROR:
+                self.pos += 1
+                # A disconnect reached the loop from the page request itself;
+                # other errors are raised by the read after it, which logs them.
+                if failed.payload == ERROR_PAYLOAD.pack(ENODEV):
+                    self._raise(failed)
+                self.page_error = failed
+        return True
+
+    def write(self, endpoint, data, timeout=None):
+        data = bytes(data)
+        self.written.append(data)
+        self.page = None
+        self.page_error = None
+        if self._page(data):
+            return len(data)
+        event = self._next(KIND_WRITE)
+        if event is None:
+            self.mismatches.append({"unexpected_write": data.hex()})
+        elif event.kind == KIND_ERROR:
+            self._raise(event)
+        elif event.payload != data:
+            self.mismatches.append(
+                {"expected_write": event.payload.hex(), "got": data.hex()}
+            )
+        return len(data)
+
+    def read(self, endpoint, size, timeout=None):
+        if self.page is not None:
+            if self.page_error is not None:
+                failed, self.page_error = self.page_error, None
+                self._raise(failed)
+            # An empty chunk ends the page read like a short one does.
+            chunk = self.page[: min(size, READ_CHUNK)]
+            del self.page[: len(chunk)]
+            return bytes(chunk)
+        event = self._next(KIND_READ)
+        if event is None:
+            raise usb.core.USBTimeoutError("Operation timed out", errno=ETIMEDOUT)
+        if event.kind == KIND_ERROR:
+            self._raise(event)
+        return event.payload
+
+    def finish(self) -> List[Dict[str, object]]:
+        for event in self.queue[self.pos :]:
+            if event.kind == KIND_WRITE:
+                self.mismatches.append({"missing_write": event.payload.hex()})
+        return self.mismatches
+
+    def is_kernel_driver_active(self, interface):
+        return False
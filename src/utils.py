@@ -2,15 +2,20 @@ import json
 import os
 from pathlib import Path
 import platform
+import secrets
 import subprocess
 import time
-from typing import List
-import httpx
+from typing import List, Tuple
 from pydantic import ValidationError
 from models import (
+    FAN_CURVE_MAX_POINTS,
     CurveMode,
     CurvePoint,
+    FanCurve,
     LinearMode,
+    PidMode,
+    RpmMode,
+    RpmPoint,
     Settings,
     VersionInfo,
     VersionStatus,
@@ -19,6 +24,14 @@ from parseArg import extractVersion
 from vars import APP_NAME, APP_RAW_VERSION, APP_RC, APP_VERSION
 
 DEV_MODE = os.getenv("DEV")
+USB_BACKEND = os.getenv("LLCW_BACKEND", "pyusb").lower()
+USB_CAPTURE = os.getenv("LLCW_CAPTURE")
+TARGET_ENGINE = os.getenv("LLCW_ENGINE", "python").lower()
+API_SERVER = os.getenv("LLCW_API", "fastapi").lower()
+API_TCP = os.getenv("LLCW_API_TCP")
+DRY_RUN = os.getenv("LLCW_DRY_RUN", "0") != "0"
+FLIGHT_RECORDS = os.getenv("LLCW_FLIGHT_RECORDS", "4096")
+FLIGHT_RECORDS = int(FLIGHT_RECORDS) if FLIGHT_RECORDS.isdigit() else 4096
 ROOT_DIR = Path(os.path.realpath(__file__)).parent
 SOCKET_DIR = (
     (ROOT_DIR / ".sock")
@@ -28,10 +41,13 @@ SOCKET_DIR = (
     )
 )
 SOCKET_PATH = str(SOCKET_DIR / "ll-connect-wireless.sock")
+STATUS_SHM_PATH = str(SOCKET_DIR / "status.shm")
+STATUS_SHM = os.getenv("LLCW_SHM", "1") != "0"
 CACHE_DIR = Path(os.path.expanduser("~/.cache/")) / APP_NAME
 CACHE_PATH = CACHE_DIR / "remoteVer.json"
 CONFIG_DIR = Path(os.path.expanduser("~/.config/")) / APP_NAME
 CONFIG_PATH = CONFIG_DIR / "config.json"
+API_TOKEN_PATH = CONFIG_DIR / "api-token"
 
 
 def get_build_identity():
@@ -177,6 +193,8 @@ def fetch_github_tag():
         if TEST_MODE:
             release_res = test_releases
         else:
+            import httpx
+
             with httpx.Client(timeout=5.0) as client:
                 response = client.get(url)
                 if response.status_code == 200:
@@ -285,6 +303,41 @@ def load_settings() -> Settings:
                 except (ValidationError, ValueError):
                     changed = True
 
+            pid_raw = raw.get("PID", raw.get("pid"))
+            if pid_raw is not None:
+                try:
+                    settings.pid = PidMode(**pid_raw)
+                except (ValidationError, TypeError):
+                    changed = True
+
+            rpm_raw = raw.get("RPM", raw.get("rpm"))
+            if rpm_raw is not None:
+                try:
+                    settings.rpm = RpmMode(**expand_rpm_mode(rpm_raw))
+                except (ValidationError, ValueError, TypeError):
+                    changed = True
+
+            calibrations_raw = raw.get("CALIBRATIONS", raw.get("calibrations"))
+            if calibrations_raw is not None:
+                try:
+                    settings.calibrations = calibrations_raw
+                except ValidationError:
+                    changed = True
+
+            sources_raw = raw.get("SOURCES", raw.get("sources"))
+            if sources_raw is not None:
+                try:
+                    settings.sources = sources_raw
+                except ValidationError:
+                    changed = True
+
+            fan_curves_raw = raw.get("FAN_CURVES", raw.get("fan_curves"))
+            if fan_curves_raw is not None:
+                try:
+                    settings.fan_curves = parse_fan_curves(fan_curves_raw)
+                except (ValidationError, ValueError, TypeError, AttributeError):
+                    changed = True
+
             gpu_macs_raw = raw.get(
                 "GPU_MACS",
                 raw.get("gpu_macs", raw.get("GPU_TEMP_MACS", raw.get("gpu_temp_macs"))),
@@ -327,7 +380,7 @@ def load_settings() -> Settings:
     return settings
 
 
-def save_settings(settings: Settings):
+def format_settings(settings: Settings) -> str:
     payload = {
         "mode": settings.mode.value,
         "linear": settings.linear.model_dump(),
@@ -335,38 +388,256 @@ def save_settings(settings: Settings):
         "GPU_LINEAR": settings.gpu_linear.model_dump(),
         "CPU_FAN_CURVE": format_four_point_curve(settings.cpu_curve),
         "GPU_FAN_CURVE": format_four_point_curve(settings.gpu_curve),
+        "PID": settings.pid.model_dump(),
+        "RPM": format_rpm_mode(settings.rpm),
         "GPU_MACS": settings.gpu_macs,
         "MIX_MACS": settings.mix_macs,
+        "SOURCES": settings.sources,
+        "FAN_CURVES": {
+            mac: format_fan_curve(curve) for mac, curve in settings.fan_curves.items()
+        },
+        "CALIBRATIONS": {
+            mac: calibration.model_dump()
+            for mac, calibration in settings.calibrations.items()
+        },
     }
+    return json.dumps(payload, indent=4)
 
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(payload, f, indent=4)
+
+def save_settings(settings: Settings):
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    tmp_path = CONFIG_DIR / f".{CONFIG_PATH.name}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            f.write(format_settings(settings))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, CONFIG_PATH)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+
+def parse_host_port(address: str, default_host: str = "127.0.0.1") -> Tuple[str, int]:
+    """``host:port``, ``[v6]:port`` or a bare port; raises ValueError."""
+    host, sep, port = address.strip().rpartition(":")
+    if not sep:
+        host, port = default_host, address.strip()
+    host = host.strip("[]") or default_host
+    try:
+        number = int(port)
+    except ValueError:
+        raise ValueError(f"'{address}' is not host:port")
+    if not 0 <= number <= 65535:
+        raise ValueError(f"Port {number} is out of range")
+    return host, number
+
+
+def load_api_token() -> str:
+    """The token TCP clients must send, from LLCW_API_TOKEN or the token file.
+
+    A random token is generated and saved (readable by the owner only) the
+    first time the TCP listener is enabled without one.
+    """
+    token = os.getenv("LLCW_API_TOKEN")
+    if token:
+        return token.strip()
+    try:
+        with open(API_TOKEN_PATH) as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    token = secrets.token_urlsafe(32)
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    fd = os.open(API_TOKEN_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token + "\n")
+    return token
+
+
+SETTINGS_ALIASES = {
+    "mode": "mode",
+    "linear": "linear",
+    "cpu_linear": "linear",
+    "gpu_linear": "gpu_linear",
+    "cpu_fan_curve": "cpu_curve",
+    "cpu_curve": "cpu_curve",
+    "gpu_fan_curve": "gpu_curve",
+    "gpu_curve": "gpu_curve",
+    "pid": "pid",
+    "gpu_macs": "gpu_macs",
+    "gpu_temp_macs": "gpu_macs",
+    "mix_macs": "mix_macs",
+    "fan_curves": "fan_curves",
+    "sources": "sources",
+    "rpm": "rpm",
+    "calibrations": "calibrations",
+}
+
+
+def parse_settings_value(field: str, value):
+    if field == "fan_curves" and isinstance(value, dict):
+        return {
+            mac: expand_fan_curve(entry) if entry is not None else None
+            for mac, entry in value.items()
+        }
+    if field == "rpm" and isinstance(value, dict):
+        return expand_rpm_mode(value)
+    if not isinstance(value, str):
+        return value
+    if field in ("linear", "gpu_linear"):
+        return parse_curve_input(value).model_dump()
+    if field in ("cpu_curve", "gpu_curve"):
+        return parse_four_point_curve_input(value).model_dump()
+    if field in ("gpu_macs", "mix_macs"):
+        return [m.strip() for m in value.split(",") if m.strip()]
+    return value
+
+
+def merge_patch(target, patch):
+    """JSON merge patch (RFC 7396): objects merge recursively, null deletes."""
+    if not isinstance(patch, dict):
+        return patch
+    merged = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = merge_patch(merged.get(key), value)
+    return merged
+
+
+def merge_settings(base: Settings, raw) -> Settings:
+    """Merge a full or partial settings document into ``base``.
+
+    Accepts the keys written to config.json as well as the model field names.
+    Nested sections are merged key by key, so ``{"pid": {"kp": 4}}`` only
+    changes ``kp``, and a null value removes an entry (e.g. a fan curve). Every problem is collected and raised as one ValueError.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Settings document must be a JSON object")
+
+    data = base.model_dump(mode="json")
+    errors: List[str] = []
+    for key, value in raw.items():
+        field = SETTINGS_ALIASES.get(str(key).lower())
+        if field is None:
+            errors.append(f"{key}: unknown setting")
+            continue
+        try:
+            value = parse_settings_value(field, value)
+        except ValueError as e:
+            errors.append(f"{key}: {e}")
+            continue
+        if field == "fan_curves" and isinstance(value, dict):
+            # Curves are replaced whole; merging points lists would be meaningless.
+            data[field] = {
+                k: v for k, v in {**data[field], **value}.items() if v is not None
+            }
+        else:
+            data[field] = merge_patch(data[field], value)
+
+    try:
+        settings = Settings.model_validate(data)
+    except ValidationError as e:
+        for err in e.errors():
+            loc = ".".join(str(p) for p in err["loc"]) or "settings"
+            errors.append(f"{loc}: {err['msg']}")
+    else:
+        if not errors:
+            return settings
+    raise ValueError("\n".join(errors))
 
 
 def format_four_point_curve(curve: CurveMode) -> str:
     return ",".join(f"{p.temp_c}:{p.percent}" for p in curve.points)
 
 
-def parse_four_point_curve_input(curve: str) -> CurveMode:
-    parts = [part.strip() for part in curve.split(",") if part.strip()]
-    if len(parts) != 4:
-        raise ValueError(
-            "Invalid format. Use temp:percent,temp:percent,temp:percent,temp:percent."
-        )
-
+def parse_curve_points(curve: str, error: str) -> List[CurvePoint]:
     points: List[CurvePoint] = []
-    for part in parts:
+    for part in curve.split(","):
+        part = part.strip()
+        if not part:
+            continue
         try:
             temp, percent = map(int, part.split(":"))
         except Exception:
-            raise ValueError(
-                "Invalid format. Use temp:percent,temp:percent,temp:percent,temp:percent."
-            )
+            raise ValueError(error)
         points.append(CurvePoint(temp_c=temp, percent=percent))
+    return points
+
+
+def parse_four_point_curve_input(curve: str) -> CurveMode:
+    error = "Invalid format. Use temp:percent,temp:percent,temp:percent,temp:percent."
+    points = parse_curve_points(curve, error)
+    if len(points) != 4:
+        raise ValueError(error)
 
     return CurveMode(points=points)
 
 
+def format_fan_curve(curve: FanCurve) -> dict:
+    points = ",".join(f"{p.temp_c}:{p.percent}" for p in curve.points)
+    return {"source": curve.source, "curve": points}
+
+
+def parse_fan_curve_input(curve: str, source: str = "cpu") -> FanCurve:
+    error = f"Invalid format. Use temp:percent,temp:percent,... (up to {FAN_CURVE_MAX_POINTS} points)."
+    return FanCurve(source=source, points=parse_curve_points(curve, error))
+
+
+def expand_fan_curve(entry):
+    """Turn the config-file form ``{"source", "curve": "t:p,..."}`` into model data."""
+    if isinstance(entry, str):
+        return parse_fan_curve_input(entry).model_dump()
+    if isinstance(entry, dict) and isinstance(entry.get("curve"), str):
+        source = entry.get("source", "cpu")
+        return parse_fan_curve_input(entry["curve"], source).model_dump()
+    return entry
+
+
+def parse_fan_curves(raw: dict) -> dict:
+    return {mac: FanCurve(**expand_fan_curve(entry)) for mac, entry in raw.items()}
+
+
+def format_rpm_curve(points: List[RpmPoint]) -> str:
+    return ",".join(f"{p.temp_c}:{p.rpm}" for p in points)
+
+
+def parse_rpm_curve_input(curve: str) -> List[RpmPoint]:
+    error = f"Invalid format. Use temp:rpm,temp:rpm,... (up to {FAN_CURVE_MAX_POINTS} points)."
+    points: List[RpmPoint] = []
+    for part in curve.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            temp, rpm = map(int, part.split(":"))
+        except Exception:
+            raise ValueError(error)
+        points.append(RpmPoint(temp_c=temp, rpm=rpm))
+    return points
+
+
+def format_rpm_mode(rpm: RpmMode) -> dict:
+    return {
+        **rpm.model_dump(),
+        "cpu_curve": format_rpm_curve(rpm.cpu_curve),
+        "gpu_curve": format_rpm_curve(rpm.gpu_curve),
+    }
+
+
+def expand_rpm_mode(raw: dict) -> dict:
+    """Turn the config-file form, with ``"t:rpm,..."`` curves, into model data."""
+    expanded = dict(raw)
+    for key in ("cpu_curve", "gpu_curve"):
+        if isinstance(expanded.get(key), str):
+            expanded[key] = [p.model_dump() for p in parse_rpm_curve_input(raw[key])]
+    return expanded
+
+
 def parse_curve_input(curve: str) -> LinearMode:
     if curve.isdigit():
         pwm = int(curve)
@@ -384,5 +655,44 @@ def parse_curve_input(curve: str) -> LinearMode:
         )
 
 
+def format_pid(pid: PidMode) -> str:
+    return " ".join(f"{k}={v}" for k, v in pid.model_dump().items())
+
+
+def parse_pid_input(values: List[str], base: PidMode) -> PidMode:
+    data = base.model_dump()
+    for value in values:
+        key, sep, raw = value.partition("=")
+        key = key.strip().lower()
+        if not sep or key not in data:
+            raise ValueError(
+                f"Invalid PID parameter '{value}'. Use key=value with keys: {', '.join(data)}."
+            )
+        data[key] = raw.strip()
+
+    return PidMode(**data)
+
+
+def resolve_fan_ids(fan_ids_str: str, fans) -> list:
+    ids = []
+    for part in fan_ids_str.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            fid = int(part)
+        except ValueError:
+            raise ValueError(f"'{part}' is not a valid fan ID (must be an integer)")
+        if fid < 0 or fid >= len(fans):
+            raise ValueError(
+                f"Fan ID {fid} is out of range. Valid IDs: 0-{len(fans) - 1}"
+            )
+        if fid not in ids:
+            ids.append(fid)
+    if not ids:
+        raise ValueError("No fan IDs provided")
+    return [fans[i].mac.lower() for i in ids]
+
+
 if __name__ == "__main__":
     print(get_build_identity())
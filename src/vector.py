@@ -0,0 +1,139 @@
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from models import CurvePoint, Fan, LinearMode
+
+SOURCE_CPU = 0
+SOURCE_GPU = 1
+SOURCE_MIX = 2
+SOURCE_CURVE = 3
+KEEP = -1
+
+
+class VectorRouter:
+    """Routes group targets to fans with NumPy instead of a per-fan loop.
+
+    Source assignments are kept as arrays and only rebuilt when the fan list
+    or the group settings change. A tick then costs one table lookup, one
+    masked fallback and one comparison for the changed-fan mask, plus the
+    read and write-back of the ``Fan`` targets.
+
+    Like ``service.route_targets``, changes are found against the targets
+    the fans carry in from the last completed tick, not against what was
+    routed last: when a write fails, the tick does not complete and the next
+    one sends the frame again.
+    """
+
+    def __init__(self):
+        if np is None:
+            raise RuntimeError("The numpy target engine needs numpy installed")
+        self.macs: List[str] = []
+        self.groups = None
+        self.source = np.zeros(0, dtype=np.int8)
+        self.curve_idx = np.zeros(0, dtype=np.intp)
+        self.curve_macs: List[str] = []
+
+    def layout(
+        self,
+        fans: List[Fan],
+        macs: List[str],
+        gpu_mac_set: set,
+        mix_mac_set: set,
+        curve_targets: Dict[str, Optional[int]],
+    ):
+        source = np.full(len(fans), SOURCE_CPU, dtype=np.int8)
+        for i, mac in enumerate(macs):
+            if mac in curve_targets:
+                source[i] = SOURCE_CURVE
+            elif mac in mix_mac_set:
+                source[i] = SOURCE_MIX
+            elif mac in gpu_mac_set:
+                source[i] = SOURCE_GPU
+        self.macs = macs
+        self.source = source
+        self.curve_idx = np.flatnonzero(source == SOURCE_CURVE)
+        self.curve_macs = [macs[i] for i in self.curve_idx.tolist()]
+
+    def route(
+        self,
+        fans: List[Fan],
+        cpu_target_pwm: Optional[int],
+        gpu_target_pwm: Optional[int],
+        gpu_mac_set: set,
+        mix_mac_set: set,
+        curve_targets: Dict[str, Optional[int]],
+        force: bool,
+    ) -> List[Fan]:
+        """Same contract as ``service.route_targets``."""
+        macs = [f.mac.lower() for f in fans]
+        groups = (
+            frozenset(gpu_mac_set),
+            frozenset(mix_mac_set),
+            frozenset(curve_targets),
+        )
+        if macs != self.macs or groups != self.groups:
+            self.layout(fans, macs, gpu_mac_set, mix_mac_set, curve_targets)
+            self.groups = groups
+
+        cpu = KEEP if cpu_target_pwm is None else cpu_target_pwm
+        gpu = KEEP if gpu_target_pwm is None else gpu_target_pwm
+        table = np.array(
+            [cpu, gpu if gpu != KEEP else cpu, max(cpu, gpu), KEEP], dtype=np.int16
+        )
+        targets = table[self.source]
+        if self.curve_macs:
+            targets[self.curve_idx] = [
+                KEEP if curve_targets[mac] is None else curve_targets[mac]
+                for mac in self.curve_macs
+            ]
+        keep = targets == KEEP
+        if keep.any():
+            pwm = np.fromiter((f.pwm for f in fans), dtype=np.int16, count=len(fans))
+            targets = np.where(keep, pwm, targets)
+
+        if force:
+            changed = np.arange(len(fans))
+        else:
+            previous = np.fromiter(
+                (f.target_pwm for f in fans), dtype=np.int16, count=len(fans)
+            )
+            changed = np.flatnonzero(targets != previous)
+
+        # Fan has no assignment validation, so skip BaseModel.__setattr__.
+        for f, target in zip(fans, targets.tolist()):
+            fields = f.__dict__
+            fields["target_pwm"] = target
+            fields["pwm"] = target
+        return [fans[i] for i in changed.tolist()]
+
+
+# ==============================
+# ARRAY FORMS OF THE TARGET FUNCTIONS
+# ==============================
+# Same operations in the same order as service.temp_to_pwm and
+# curves.CompiledCurve, so each element matches the scalar result exactly.
+def percent_to_pwm(percent):
+    return np.rint(np.clip(percent, 0, 100) / 100 * 255).astype(np.int16)
+
+
+def temp_to_pwm(temps, linear: LinearMode):
+    """``service.temp_to_pwm`` for an array of temperatures."""
+    t = np.clip(temps, linear.min_temp, linear.max_temp)
+    ratio = (t - linear.min_temp) / (linear.max_temp - linear.min_temp)
+    return percent_to_pwm(linear.min_pwm + ratio * (linear.max_pwm - linear.min_pwm))
+
+
+def curve_to_pwm(temps, points: List[CurvePoint]):
+    """``CompiledCurve(points)(temp)`` for an array of temperatures."""
+    xs = np.array([p.temp_c for p in points], dtype=np.float64)
+    ys = np.array([p.percent for p in points], dtype=np.float64)
+    i = np.clip(np.searchsorted(xs, temps, side="left") - 1, 0, len(xs) - 2)
+    ratio = (temps - xs[i]) / (xs[i + 1] - xs[i])
+    pwm = percent_to_pwm(ys[i] + ratio * (ys[i + 1] - ys[i]))
+    pwm[temps <= xs[0]] = percent_to_pwm(ys[0])
+    pwm[temps >= xs[-1]] = percent_to_pwm(ys[-1])
+    return pwm